@@ -6,6 +6,7 @@ from decorators import Utils
 from utility import to_list
 import pandas as pd
 import postgresql
+import tenant_registry
 import logging
 import logger_setup
 
@@ -17,7 +18,7 @@ table_names = {
     'sponsored_brands.campaigns': sb_campaigns,
     'sponsored_display.campaigns':  sd_campaigns
 }
-tenants = postgresql.get_tenants()
+tenants = tenant_registry.postgres_tenants
 
 @Utils.load_all_pages(throttle_by_seconds=1, next_token_param='nextToken')
 def list_campaigns(table_name, account='Bare Barrel', marketplace='US', **kwargs):
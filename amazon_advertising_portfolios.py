@@ -5,6 +5,7 @@ from ad_api.base import Marketplaces
 from utility import to_list
 import pandas as pd
 import postgresql
+import tenant_registry
 import logger_setup
 
 logger_setup.setup_logging(__file__)
@@ -16,7 +17,7 @@ logging.basicConfig(
 )
 
 table_name = 'amazon_advertising_portfolios'
-tenants = postgresql.get_tenants()
+tenants = tenant_registry.postgres_tenants
 
 
 def list_portfolios(account='Bare Barrel', marketplace='US', **kwargs):
@@ -4,6 +4,7 @@ from ad_api.base import AdvertisingApiException
 from ad_api.base import Marketplaces
 from utility import to_list
 import pandas as pd
+import tenant_registry
 import logger_setup
 import bigquery_utils
 
@@ -11,7 +12,7 @@ import bigquery_utils
 logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
-TENANTS = bigquery_utils.get_tenants()
+TENANTS = tenant_registry.bigquery_tenants
 MARKETPLACES = ['US', 'CA', 'UK']
 
 PROJECT_ID = "modern-sublime-383117"
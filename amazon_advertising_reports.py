@@ -5,6 +5,9 @@ import datetime as dt
 # import io
 # import gzip
 import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from ad_api.api.reports import Reports
 from ad_api.base.exceptions import (
     AdvertisingApiTooManyRequestsException,
@@ -12,18 +15,25 @@ from ad_api.base.exceptions import (
 )
 from ad_api.base import Marketplaces
 from amazon_advertising_report_types_v3 import table_names
-from utility import to_list
+from utility import to_list, read_json_chunks, list_files, combine_files
+from report_manifest import ReportManifest
 import postgresql
 import re
 import os
 import ast
+import tenant_registry
 import logging
 import logger_setup
 
 logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
-tenants = postgresql.get_tenants()
+tenants = tenant_registry.postgres_tenants
+
+
+def get_report_name(ad_product, report_type_id, group_by, start_date, end_date, account, marketplace):
+    """Name of a requested report, it's unique per report"""
+    return f"{ad_product} ({account}-{marketplace}) {report_type_id} {group_by} {start_date} - {end_date}"
 
 
 def request_report(
@@ -64,7 +74,7 @@ def request_report(
         columns = metrics.replace(' date,', '')
 
     body = {
-        "name": f"{ad_product} ({account}-{marketplace}) {report_type_id} {group_by} {start_date} - {end_date}",
+        "name": get_report_name(ad_product, report_type_id, group_by, start_date, end_date, account, marketplace),
         "startDate": str(start_date),
         "endDate": str(end_date),
         "configuration": {
@@ -116,6 +126,49 @@ def request_report(
             return response.payload
 
 
+def parse_report_name(report_name):
+    """
+    Gets ad_product, marketplace, report_type_id, group_by & table_name (without schema) from a report name
+    """
+    # regexing report name
+    match = re.search(r'(SPONSORED_\w+)\s\(.*(\w{2})\)\s(\w+)\s(\[.+\])', report_name)
+    ad_product, marketplace, report_type_id, group_by = (
+        match[1],
+        match[2],
+        match[3],
+        match[4],
+        )
+    table_name = table_names[ad_product][report_type_id][group_by]['table_name']
+    return ad_product, marketplace, report_type_id, group_by, table_name
+
+
+def report_file_path(root_directory, report_name):
+    """Save path of a report, creates its directory if it doesn't exist"""
+    ad_product, marketplace, report_type_id, group_by, table_name = parse_report_name(report_name)
+    directory = os.path.join(root_directory, ad_product, table_name, marketplace)
+
+    if not os.path.exists(directory) and directory:
+        logger.info(f"Creating new directory: {directory}")
+        os.makedirs(directory, exist_ok=True)
+
+    return os.path.join(directory, report_name + '.json.gz')
+
+
+def save_report(url, file_path):
+    """Downloads a completed report's url. Returns the file_path or None if it failed"""
+    response = requests.get(url)
+
+    if response.status_code != 200:
+        logger.info("Failed to download file.")
+        return None
+
+    with open(file_path, 'wb') as file:
+        file.write(response.content)
+
+    logger.info("File downloaded successfully.")
+    return file_path
+
+
 def download_report(report_id, root_directory, report_name, account, marketplace):
     """
     Once you have made a successful POST call, report generation can take up to three hours.
@@ -133,20 +186,7 @@ def download_report(report_id, root_directory, report_name, account, marketplace
     Returns:
         file_path (str)
     """
-    # regexing save path
-    match = re.search(r'(SPONSORED_\w+)\s\(.*(\w{2})\)\s(\w+)\s(\[.+\])', report_name)
-    ad_product, marketplace, report_type_id, group_by = (
-        match[1],
-        match[2],
-        match[3],
-        match[4],
-        )
-    table_name = table_names[ad_product][report_type_id][group_by]['table_name']
-    directory = os.path.join(root_directory, ad_product, table_name, marketplace)
-
-    if not os.path.exists(directory) and directory:
-        logger.info(f"Creating new directory: {directory}")
-        os.makedirs(directory)
+    file_path = report_file_path(root_directory, report_name)
 
     while True:
         logger.info(f"Downloading {report_name}")
@@ -166,21 +206,10 @@ def download_report(report_id, root_directory, report_name, account, marketplace
 
             if status == 'COMPLETED':
                 # Download the report
-                response = requests.get(url)
-
-                if response.status_code == 200:
-                    file_path = os.path.join(directory, report_name + '.json.gz')
-
-                    with open(file_path, 'wb') as file:
-                        file.write(response.content)
-
-                    logger.info("File downloaded successfully.")
-
+                if save_report(url, file_path):
                     return file_path
 
-                else:
-                    logger.info("Failed to download file.")
-                    logger.info("\tRedownloading...")
+                logger.info("\tRedownloading...")
 
             elif status == 'FAILED':
                 break
@@ -221,34 +250,251 @@ def request_download_reports(
     return file_path
 
 
-def combine_data(directory=None, file_paths=[], file_extension='.json.gz'):
+def read_report_file(file_path):
+    """
+    Reads a downloaded report, inserting its `tenant_id` and `marketplace` from the file name.
+    """
+    df = pd.read_json(file_path)
+
+    # manually adds account, marketplace and date
+    match = re.search(r'\((.*)-(\w{2})\).+(20\d\d-\d\d-\d\d)', file_path)
+    account, marketplace = match[1], match[2]
+    df.insert(1, 'tenant_id', tenants[account])
+    df.insert(2, 'marketplace', marketplace)
+    return df
+
+
+def combine_data(directory=None, file_paths=None, file_extension='.json.gz', primary_keys=None, max_workers=8):
     """
     Combines files in a directory and/or in file_paths.
-    Inserts `marketplace` and `date` to the returned dataframe.
+    Inserts `tenant_id` and `marketplace` to the returned dataframe.
+    Optionally drops rows duplicated on `primary_keys`, keeping the last file's.
     """
+    file_paths = list(file_paths or [])
+
     # gets all similar file types in a directory
     if directory:
-        for root, dirs, files in os.walk(directory):
-            for filename in files:
-                if file_extension in filename:
-                    print(os.path.join(root, filename))
-                    file_paths.append(os.path.join(root, filename))
+        file_paths += list_files(directory, file_extension)
+
+    return combine_files(file_paths, read_report_file, primary_keys=primary_keys, max_workers=max_workers)
+
+
+def upsert_report(file_path, account, marketplace, table_name, chunksize=100_000):
+    """
+    Upserts a downloaded report, adding its marketplace and tenant_id.
+    The gzipped JSON is decoded & copied in chunks of `chunksize` rows.
+    """
+    def report_chunks():
+        for data in read_json_chunks(file_path, chunksize):
+            # manually adds marketplace and tenant_id
+            data['marketplace'] = marketplace
+            data['tenant_id'] = tenants[account]
 
-    # combines data
-    combined_data = pd.DataFrame()
+            # removes null
+            if 'ad_group_id' in data.columns:
+                data.fillna({"ad_group_id": 0}, inplace=True)
 
-    for file_path in file_paths:
-        df = pd.read_json(file_path)
+            if 'campaign_id' in data.columns:
+                data.fillna({"campaign_id": 0}, inplace=True)
 
-        # manually adds account, marketplace and date
-        match = re.search(r'\((.*)-(\w{2})\).+(20\d\d-\d\d-\d\d)', file_path)
-        account, marketplace = match[1], match[2]
-        df.insert(1, 'tenant_id', tenants[account])
-        df.insert(2, 'marketplace', marketplace)
+            yield data
 
-        combined_data = pd.concat([df, combined_data], ignore_index=True)
+    # upserts data
+    postgresql.upsert_bulk(table_name, report_chunks(), file_extension='pandas')
 
-    return combined_data
+
+def report_jobs(ad_product, start_date, end_date, report_type_ids=None, marketplaces=["US", "CA", "UK"], max_date_range=31):
+    """
+    Lists the reports of an ad product to be requested, splitting the dates into windows of `max_date_range` days.
+
+    Returns:
+        jobs (list): [(ad_product, report_type_id, group_by, start_date, end_date, marketplace)]
+    """
+    jobs = []
+    for report_type_id in to_list(report_type_ids or list(table_names[ad_product])):
+        for group_by in table_names[ad_product][report_type_id]:
+            for marketplace in to_list(marketplaces):
+                current_start_date = start_date
+                current_end_date = min(end_date, current_start_date + dt.timedelta(days=max_date_range))
+
+                while current_start_date < end_date:
+                    jobs.append((ad_product, report_type_id, group_by, current_start_date, current_end_date, marketplace))
+
+                    current_start_date = current_end_date + dt.timedelta(days=1)
+                    current_end_date = min(
+                        end_date,
+                        current_end_date + dt.timedelta(days=max_date_range),
+                    )
+    return jobs
+
+
+def run_report_jobs(jobs, account="Bare Barrel", post_interval=12, poll_interval=60, max_workers=4, raise_errors=True,
+                    manifest=None):
+    """
+    Requests, polls, downloads & upserts reports concurrently.
+    Reports are posted as soon as their profile's `post_interval` allows, so many are generated at once.
+    All pending reports are polled in one loop every `poll_interval` seconds, and each completed report
+    is downloaded & upserted by a worker while the others are still processing.
+    Upserts to the same table are done one at a time.
+
+    Every step is recorded in a report manifest. Running the same jobs after a crash resumes the run:
+    upserted reports are skipped, requested ones are polled again and downloaded files are reused.
+
+    Args:
+        jobs (list): from report_jobs
+        post_interval (int): seconds between report requests of a profile (account-marketplace)
+        poll_interval (int): seconds between status checks of the pending reports
+        max_workers (int): concurrent downloads & upserts
+        raise_errors (bool): raises the first download or upsert error after all reports finish
+        manifest (ReportManifest): by default, the one in 'PPC Data'
+    Returns:
+        file_paths (dict): {report_name: file_path}, None for failed reports
+    """
+    if manifest is None:
+        # closes the manifest it opens, even if the run fails
+        manifest = ReportManifest()
+        try:
+            return run_report_jobs(jobs, account, post_interval, poll_interval, max_workers, raise_errors, manifest)
+        finally:
+            manifest.close()
+
+    gzipped_directory = os.path.join('PPC Data', 'RAW Gzipped JSON Reports')
+
+    report_names = {job: get_report_name(*job[:-1], account, job[-1]) for job in jobs}
+    recorded_reports = manifest.start_run(account, list(report_names.values()))
+
+    queued = {}     # report requests queued per profile
+    pending = {}    # {report_id: (report_name, marketplace)}
+    futures = {}    # {report_name: future}
+    file_paths = {}
+    table_locks = {}
+
+    def download(url, report_name):
+        for _ in range(3):
+            file_path = save_report(url, report_file_path(gzipped_directory, report_name))
+            if file_path:
+                manifest.update(report_name, status='DOWNLOADED', file_path=file_path)
+                return file_path
+            logger.info("\tRedownloading...")
+        raise Exception(f"Failed to download {report_name}")
+
+    def upsert(file_path, report_name, marketplace):
+        ad_product, _, report_type_id, group_by, table_name = parse_report_name(report_name)
+        table_name = f"{ad_product.lower()}.{table_name}"
+
+        with table_locks.setdefault(table_name, threading.Lock()):
+            logger.info(f"Upserting {report_name}")
+            try:
+                upsert_report(file_path, account, marketplace, table_name)
+            except Exception:
+                manifest.update(report_name, upsert_status='ERROR')
+                raise
+        manifest.update(report_name, upsert_status='UPSERTED')
+        return file_path
+
+    def download_upsert(url, report_name, marketplace):
+        return upsert(download(url, report_name), report_name, marketplace)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # resumes recorded reports
+        for job, report_name in report_names.items():
+            marketplace = job[-1]
+            recorded = recorded_reports.get(report_name, {})
+
+            if recorded.get('upsert_status') == 'UPSERTED':
+                logger.info(f"Already upserted {report_name}")
+                file_paths[report_name] = recorded['file_path']
+
+            elif recorded.get('status') == 'DOWNLOADED' and os.path.exists(recorded['file_path']):
+                futures[report_name] = executor.submit(upsert, recorded['file_path'], report_name, marketplace)
+
+            elif recorded.get('report_id') and recorded.get('status') != 'FAILED':
+                pending[recorded['report_id']] = (report_name, marketplace)
+
+            else:
+                queued.setdefault(marketplace, deque()).append(job)
+
+        next_post_at = {marketplace: 0 for marketplace in queued}
+        next_poll_at = time.monotonic() + (poll_interval if not pending else 0)
+
+        while any(queued.values()) or pending:
+            # requests reports of profiles that aren't rate limited
+            for marketplace, marketplace_jobs in queued.items():
+                if marketplace_jobs and time.monotonic() >= next_post_at[marketplace]:
+                    ad_product, report_type_id, group_by, start_date, end_date, _ = marketplace_jobs.popleft()
+                    response = request_report(
+                        ad_product,
+                        report_type_id,
+                        group_by,
+                        start_date,
+                        end_date,
+                        account=account,
+                        marketplace=marketplace,
+                    )
+                    pending[response['reportId']] = (response['name'], marketplace)
+                    manifest.update(response['name'], report_id=response['reportId'], status='REQUESTED')
+                    next_post_at[marketplace] = time.monotonic() + post_interval
+
+            # polls all pending reports at once
+            if pending and time.monotonic() >= next_poll_at:
+                logger.info(f"Polling {len(pending)} pending reports")
+                throttled = set()
+                for report_id, (report_name, marketplace) in list(pending.items()):
+                    if marketplace in throttled:
+                        continue
+                    try:
+                        response = Reports(
+                            account=f'{account}-{marketplace}',
+                            marketplace=Marketplaces[marketplace],
+                        ).get_report(reportId=report_id)
+                    except AdvertisingApiTooManyRequestsException as e:
+                        logger.warning(e)
+                        throttled.add(marketplace)
+                        continue
+                    except Exception as error:
+                        logger.error(error)
+                        continue
+
+                    if not response:
+                        continue
+                    status = response.payload['status']
+
+                    if status == 'COMPLETED':
+                        logger.info(f"\tCompleted {report_name}")
+                        del pending[report_id]
+                        manifest.update(report_name, status=status)
+                        futures[report_name] = executor.submit(
+                            download_upsert, response.payload['url'], report_name, marketplace)
+
+                    elif status == 'FAILED':
+                        logger.error(f"\tFailed {report_name}: {response.payload.get('failureReason')}")
+                        del pending[report_id]
+                        manifest.update(report_name, status=status)
+                        file_paths[report_name] = None
+
+                next_poll_at = time.monotonic() + poll_interval
+
+            # sleeps until the next request or poll
+            next_event_at = min([next_post_at[marketplace] for marketplace, marketplace_jobs in queued.items()
+                                 if marketplace_jobs] + ([next_poll_at] if pending else []), default=0)
+            time.sleep(max(0, min(next_event_at - time.monotonic(), poll_interval)))
+
+    errors = []
+    for report_name, future in futures.items():
+        try:
+            file_paths[report_name] = future.result()
+        except Exception as error:
+            logger.error(f"{report_name}: {error}")
+            file_paths[report_name] = None
+            errors.append(error)
+
+    # failed reports are requested again on the next run
+    if not errors and all(file_paths.values()):
+        manifest.finish_run()
+
+    if errors and raise_errors:
+        raise errors[0]
+    return file_paths
 
 
 def update_data(
@@ -263,66 +509,11 @@ def update_data(
     Adds upsert data step to request_download_reports by
     combining the downloaded files
     """
-    report_ids = {}
-
-    # requests reports
-    for group_by in table_names[ad_product][report_type_id]:
-        for marketplace in to_list(marketplaces):
-            response = request_report(
-                ad_product,
-                report_type_id,
-                group_by,
-                start_date,
-                end_date,
-                account=account,
-                marketplace=marketplace,
-            )
-            report_ids[response['name']] = response['reportId']
-            time.sleep(10)
+    jobs = [(ad_product, report_type_id, group_by, start_date, end_date, marketplace)
+            for group_by in table_names[ad_product][report_type_id]
+            for marketplace in to_list(marketplaces)]
 
-    # download reports
-    gzipped_directory = os.path.join('PPC Data', 'RAW Gzipped JSON Reports')
-
-    for report_name in report_ids:
-        # regexing table name
-        match = re.search(
-            r'(SPONSORED_\w+)\s\(.*(\w{2})\)\s(\w+)\s(\[.+\])', report_name
-        )
-        ad_product, marketplace, report_type_id, group_by = (
-            match[1],
-            match[2],
-            match[3],
-            match[4],
-        )
-        table_name = table_names[ad_product][report_type_id][group_by]['table_name']
-        table_name = f"{ad_product.lower()}.{table_name}"
-
-        # download and save
-        file_path = download_report(
-            report_ids[report_name],
-            gzipped_directory,
-            report_name,
-            account,
-            marketplace,
-        )
-
-        try:
-            # manually adds marketplace
-            data = pd.read_json(file_path)
-            data['marketplace'] = marketplace
-            data['tenant_id'] = tenants[account]
-
-            # removes null
-            if 'ad_group_id' in data.columns:
-                data.fillna({"ad_group_id": 0}, inplace=True)
-
-            if 'campaign_id' in data.columns:
-                data.fillna({"campaign_id": 0}, inplace=True)
-
-            # upserts data
-            postgresql.upsert_bulk(table_name, data, file_extension='pandas')
-        except Exception as error:
-            logger.error(error)
+    run_report_jobs(jobs, account=account, post_interval=10, raise_errors=False)
 
 
 def update_all_data(
@@ -345,84 +536,21 @@ def update_all_data(
         'SPONSORED_DISPLAY': 65
     }
 
-    report_ids = {}
-    # requests reports
+    jobs = []
     for ad_product in to_list(ad_products):
         data_retention_start_date = dt.datetime.now(
             dt.timezone.utc
         ).date() - dt.timedelta(days=data_retention[ad_product])
 
-        for report_type_id in table_names[ad_product]:
-            for group_by in table_names[ad_product][report_type_id]:
-                for marketplace in to_list(marketplaces):
-                    current_start_date = (
-                        start_date
-                        if start_date >= data_retention_start_date
-                        else data_retention_start_date
-                    )
-                    current_end_date = min(
-                        end_date, current_start_date + dt.timedelta(days=max_date_range)
-                    )
-
-                    while current_start_date < end_date:
-                        response = request_report(
-                            ad_product,
-                            report_type_id,
-                            group_by,
-                            current_start_date,
-                            current_end_date,
-                            account=account,
-                            marketplace=marketplace,
-                        )
-                        report_ids[response['name']] = response['reportId']
-
-                        current_start_date = current_end_date + dt.timedelta(days=1)
-                        current_end_date = min(
-                            end_date,
-                            current_end_date + dt.timedelta(days=max_date_range),
-                        )
-                        time.sleep(12)
-
-    # download reports
-    gzipped_directory = os.path.join('PPC Data', 'RAW Gzipped JSON Reports')
-
-    for report_name in report_ids:
-        # regexing table name
-        match = re.search(
-            r'(SPONSORED_\w+)\s\(.*(\w{2})\)\s(\w+)\s(\[.+\])', report_name
+        current_start_date = (
+            start_date
+            if start_date >= data_retention_start_date
+            else data_retention_start_date
         )
-        ad_product, marketplace, report_type_id, group_by = (
-            match[1],
-            match[2],
-            match[3],
-            match[4],
-        )
-        table_name = table_names[ad_product][report_type_id][group_by]['table_name']
-        table_name = f"{ad_product.lower()}.{table_name}"
-
-        # download and save
-        file_path = download_report(
-            report_ids[report_name],
-            gzipped_directory,
-            report_name,
-            account,
-            marketplace,
-        )
-
-        # manually ads marketplace and tenant_id
-        data = pd.read_json(file_path)
-        data['marketplace'] = marketplace
-        data['tenant_id'] = tenants[account]
-
-        # removes null
-        if 'ad_group_id' in data.columns:
-            data.fillna({"ad_group_id": 0}, inplace=True)
-
-        if 'campaign_id' in data.columns:
-            data.fillna({"campaign_id": 0}, inplace=True)
+        jobs += report_jobs(ad_product, current_start_date, end_date,
+                            marketplaces=marketplaces, max_date_range=max_date_range)
 
-        # upserts data
-        postgresql.upsert_bulk(table_name, data, file_extension='pandas')
+    run_report_jobs(jobs, account=account, post_interval=12)
 
 
 def create_table(directory, drop_table_if_exists=False):
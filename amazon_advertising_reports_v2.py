@@ -2,7 +2,7 @@ from ad_api.api.sb.reports import Reports as sb_Reports
 from ad_api.api.sd.reports import Reports as sd_Reports
 from ad_api.base import Marketplaces
 from ad_api.base.exceptions import AdvertisingApiTooManyRequestsException
-from utility import to_list
+from utility import to_list, read_json_chunks, list_files, combine_files
 import datetime as dt
 import pandas as pd
 import json
@@ -14,13 +14,14 @@ import csv
 import requests
 from requests.exceptions import ConnectionError
 import postgresql
+import tenant_registry
 import logging
 import logger_setup
 
 logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
-tenants = postgresql.get_tenants()
+tenants = tenant_registry.postgres_tenants
 table_names = {
         'SPONSORED_BRANDS': {
             'campaigns': 'campaign_v2',
@@ -237,34 +238,47 @@ def request_download_reports(ad_product, report_type, account, marketplace, star
     return file_paths
 
 
-def combine_data(directory=None, file_paths=[], file_extension='.json.gz'):
+def read_report_file(file_path):
+    """
+    Reads a downloaded report, inserting its `tenant_id`, `marketplace` and `date` from the file name.
+    """
+    df = pd.read_json(file_path)
+
+    # manually adds account, marketplace and date
+    match = re.search(r'\((.*)-(\w{2})\).+(20\d\d-\d\d-\d\d)', file_path)
+    df['tenant_id'] = tenants[match[1]]
+    df['marketplace'], df['date'] = match[2], match[3]
+    return df
+
+
+def combine_data(directory=None, file_paths=None, file_extension='.json.gz', primary_keys=None, max_workers=8):
     """
     Combines files in a directory and/or in file_paths.
-    Inserts `marketplace` and `date`.
+    Inserts `tenant_id`, `marketplace` and `date`.
+    Optionally drops rows duplicated on `primary_keys`, keeping the last file's.
     Returns pandas dataframe.
     """
+    file_paths = list(file_paths or [])
+
     # gets all similar file types in a directory
     if directory:
-        for dirpath, dirnames, filenames in os.walk(directory):
-            filenames = [filename for filename in filenames if file_extension in filename]
+        file_paths += list_files(directory, file_extension)
 
-        for filename in filenames:
-            file_paths.append(os.path.join(dirpath, filename))
-    
-    # combines data
-    combined_data = pd.DataFrame()
+    return combine_files(file_paths, read_report_file, primary_keys=primary_keys, max_workers=max_workers)
 
-    for file_path in file_paths:
-        df = pd.read_json(file_path)
 
-        # manually adds accountmarketplace and date
+def iter_report_chunks(file_paths, chunksize=100_000):
+    """
+    Reads report files in chunks of `chunksize` rows instead of loading them at once.
+    Inserts `tenant_id`, `marketplace` and `date`.
+    """
+    for file_path in file_paths:
         match = re.search(r'\((.*)-(\w{2})\).+(20\d\d-\d\d-\d\d)', file_path)
-        df['tenant_id'] = tenants[match[1]]
-        df['marketplace'], df['date'] = match[2], match[3]
-
-        combined_data = pd.concat([df, combined_data], ignore_index=True)
 
-    return combined_data
+        for df in read_json_chunks(file_path, chunksize):
+            df['tenant_id'] = tenants[match[1]]
+            df['marketplace'], df['date'] = match[2], match[3]
+            yield df
 
 
 def update_data(ad_product, report_type, start_date, end_date, account='Bare Barrel', marketplaces=['US', 'CA', 'UK']):
@@ -278,16 +292,16 @@ def update_data(ad_product, report_type, start_date, end_date, account='Bare Bar
         # request & download reports
         file_paths = request_download_reports(ad_product, report_type, account, marketplace, start_date, end_date, gzipped_directory)
 
-        # combine reports
-        combined_data = combine_data(file_paths=file_paths)
+        # streams reports
+        report_chunks = iter_report_chunks(file_paths)
 
         # cleans SB ads_v2 missing ad_id
         if ad_product == 'SPONSORED_BRANDS' and report_type == 'ads':
-            combined_data.dropna(subset=['adId'], inplace=True)
+            report_chunks = (chunk.dropna(subset=['adId']) for chunk in report_chunks)
     
         # upserts to db
         table_name = f"{ad_product.lower()}.{table_names[ad_product][report_type]}"
-        postgresql.upsert_bulk(table_name, combined_data, file_extension='pandas')
+        postgresql.upsert_bulk(table_name, report_chunks, file_extension='pandas')
 
 
 def update_all_data(start_date, end_date, ad_products = ['SPONSORED_BRANDS'], account='Bare Barrel', marketplaces=['US', 'CA', 'UK']):
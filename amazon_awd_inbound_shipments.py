@@ -7,7 +7,8 @@ from requests.exceptions import ReadTimeout, ConnectionError
 from utility import to_list
 import pandas as pd
 import postgresql2
-import time
+import sp_api_rate_limiter
+import tenant_registry
 import logging
 import logger_setup
 
@@ -16,20 +17,20 @@ logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
 awd_version = '2024-05-09'
-tenants = postgresql2.get_tenants()
+tenants = tenant_registry.postgres_tenants
 
 
 throttle_retry()
-@load_all_pages()
+@load_all_pages(throttle_by_seconds=0)
 def list_all_inbound_shipments_summary(account='Bare Barrel', marketplace='US', **kwargs):
     """
     a generator function to return all pages, obtained by NextToken
     """
 
-    inbound_shipments_summary = AmazonWarehousingAndDistribution(
+    inbound_shipments_summary = sp_api_rate_limiter.call(account, marketplace, 'list_inbound_shipments', lambda: AmazonWarehousingAndDistribution(
                                     account=f'{account}-{marketplace}',
                                     marketplace=Marketplaces[marketplace], 
-                                    version=awd_version).list_inbound_shipments(**kwargs)
+                                    version=awd_version).list_inbound_shipments(**kwargs))
     return inbound_shipments_summary
 
 
@@ -147,18 +148,16 @@ def get_all_inbound_shipments(account='Bare Barrel', marketplaces=['US', 'CA', '
         for row in shipment_ids.values:
             shipment_id = row[0]
             logger.info(f"\tGetting shipment id: {shipment_id}") 
-            response = AmazonWarehousingAndDistribution(
+            response = sp_api_rate_limiter.call(account, marketplace, 'get_inbound_shipment', lambda: AmazonWarehousingAndDistribution(
                                             account=f'{account}-{marketplace}', 
                                             marketplace=Marketplaces[marketplace], 
-                                            version=awd_version).get_inbound_shipment(shipmentId=shipment_id, **kwargs)
+                                            version=awd_version).get_inbound_shipment(shipmentId=shipment_id, **kwargs))
             payload = response.payload
             data = pd.json_normalize(payload)
             data.insert(0, 'date', dt.date.today())
             data.insert(1, 'tenant_id', tenants[account])
             inbound_shipments_data = pd.concat([inbound_shipments_data, data], ignore_index=True)
 
-            time.sleep(2)
-
     # Renaming createdAt & updatedAt to match Sellercentral report 
     # and to avoid conflict with update triggers
     inbound_shipments_data.rename(
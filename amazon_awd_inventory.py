@@ -1,21 +1,21 @@
 import datetime as dt
 from sp_api.base import Marketplaces
 from sp_api.api import AmazonWarehousingAndDistribution
-from sp_api.util import throttle_retry, load_all_pages
-from sp_api.base.exceptions import SellingApiRequestThrottledException, SellingApiServerException
-from requests.exceptions import ReadTimeout, ConnectionError
+from sp_api.util import load_all_pages
 from utility import to_list
 import pandas as pd
+import tenant_registry
 import logging
 import logger_setup
 import bigquery_utils
+import sp_api_rate_limiter
 
 
 logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
 AWD_VERSION = '2024-05-09'
-TENANTS = bigquery_utils.get_tenants()
+TENANTS = tenant_registry.bigquery_tenants
 AWD_VERSION = '2024-05-09'
 
 PROJECT_ID = "modern-sublime-383117"
@@ -23,21 +23,15 @@ DEST_DATASET = "awd"
 DEST_TABLE = "inventory"
 
 
-throttle_retry()
-@load_all_pages()
+@load_all_pages(throttle_by_seconds=0)
 def list_all_inventory(account='Bare Barrel', marketplace='US', **kwargs):
     """
     a generator function to return all pages, obtained by NextToken
     """
-    try:
-        inventory = AmazonWarehousingAndDistribution(
+    return sp_api_rate_limiter.call(account, marketplace, 'list_inventory', lambda: AmazonWarehousingAndDistribution(
                                 account=f'{account}-{marketplace}', 
                                 marketplace=Marketplaces[marketplace], 
-                                version=AWD_VERSION).list_inventory(**kwargs)
-    except (SellingApiRequestThrottledException, SellingApiServerException, ReadTimeout, ConnectionError) as e:
-        logger.error(f"Error updating awd inventory for {account}: {e}")
-
-    return inventory
+                                version=AWD_VERSION).list_inventory(**kwargs))
 
 
 def get_all_inventory(account='Bare Barrel', marketplaces=['US'], **kwargs): # AWD is only available in the US for now
@@ -7,6 +7,7 @@ import pandas as pd
 import postgresql2
 import gzip
 import json
+import tenant_registry
 import logging
 import logger_setup
 
@@ -15,7 +16,7 @@ logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
 base_table_name = 'business_reports.detail_page_sales_and_traffic'
-tenants = postgresql2.get_tenants()
+tenants = tenant_registry.postgres_tenants
 
 
 def download_combine_reports(start_date, end_date, account, marketplace,  asin_granularity='PARENT', date_granularity='DAY'):
@@ -6,6 +6,7 @@ import time
 import pandas as pd
 import numpy as np
 import postgresql2
+import tenant_registry
 import logging
 import logger_setup
 from utility import to_list
@@ -16,7 +17,7 @@ logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
 table_name = 'business_reports.fba_fee_preview'
-tenants = postgresql2.get_tenants()
+tenants = tenant_registry.postgres_tenants
 
 
 def request_reports(start_date, end_date, account='Bare Barrel', marketplace='US'):
@@ -1,41 +1,42 @@
 from sp_api.base import Marketplaces
 from sp_api.api import Finances
-from sp_api.util import throttle_retry, load_all_pages
-from sp_api.base.exceptions import SellingApiRequestThrottledException, SellingApiServerException
+from sp_api.util import load_all_pages
+from google.api_core.exceptions import NotFound
 import datetime as dt
-import time
 import pandas as pd
+import tenant_registry
 import logging
 import logger_setup
 from utility import to_list
 import bigquery_utils
+import sp_api_rate_limiter
+import watermarks
 
 
 logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
-TENANTS = bigquery_utils.get_tenants()
+TENANTS = tenant_registry.bigquery_tenants
 
 PROJECT_ID = "modern-sublime-383117"
 DEST_DATASET = "finances"
 DEST_TABLE = "financial_events"
+WATERMARK_JOB = "amazon_finances"
+OVERLAP_HOURS = 48 # re-pulls events posted late since the last sync
+# identifies a shipment item's financial event, EventIndex numbers the events of an order item
+# posted at the same time, e.g. split charges or repeated adjustments
+EVENT_KEY = ["tenant_id", "marketplace", "AmazonOrderId", "OrderItemId", "PostedDate", "EventIndex"]
 
 
-@throttle_retry()
-@load_all_pages()
+@load_all_pages(throttle_by_seconds=0)
 def load_all_financial_events(account='Bare Barrel', marketplace='US', **kwargs):
     """
     a generator function to return all pages, obtained by NextToken
     """
-    try:
-        response = Finances(
-            account=f'{account}-{marketplace}',
-            marketplace=Marketplaces[marketplace]
-            ).list_financial_events(**kwargs)
-    except (SellingApiRequestThrottledException, SellingApiServerException) as error:
-        logger.warning(error)
-
-    return response
+    return sp_api_rate_limiter.call(account, marketplace, 'list_financial_events', lambda: Finances(
+        account=f'{account}-{marketplace}',
+        marketplace=Marketplaces[marketplace]
+        ).list_financial_events(**kwargs))
 
 
 def get_financial_events(account='Bare Barrel', 
@@ -67,56 +68,91 @@ def get_financial_events(account='Bare Barrel',
             df_items["tenant_id"] = TENANTS[account]
             df_items["created_at"] = dt.datetime.now(dt.timezone.utc).isoformat()
             financial_events_data = pd.concat([financial_events_data, df_items], ignore_index=True)
-            time.sleep(0.5)
-    
+
+    # events sharing the rest of the key are all posted at the same time, so they're always pulled together
+    if not financial_events_data.empty:
+        financial_events_data["EventIndex"] = financial_events_data.groupby(
+            ["AmazonOrderId", "OrderItemId", "PostedDate"], dropna=False).cumcount()
+
     return financial_events_data
 
 
+def add_event_index(table_id):
+    """
+    Adds EventIndex to a destination created before it was part of EVENT_KEY, once.
+    Its rows were deduplicated on the rest of the key, so each is the first event of its key.
+    """
+    client = bigquery_utils.get_client(PROJECT_ID)
+    try:
+        table = client.get_table(table_id)
+    except NotFound:
+        return  # created by the first merge
+    if any(field.name == "EventIndex" for field in table.schema):
+        return
+
+    logger.info(f"Adding EventIndex to {table_id}")
+    client.query(f"""
+        ALTER TABLE `{table_id}` ADD COLUMN EventIndex INT64;
+        UPDATE `{table_id}` SET EventIndex = 0 WHERE TRUE;
+    """).result()
+
+
+def sync_financial_events(account='Bare Barrel', marketplace='US', reconcile=False, lookback_days=180,
+                          overlap_hours=OVERLAP_HOURS):
+    """
+    Merges the shipment financial events posted since the last successful sync, minus an overlap
+    for late postings, into BigQuery on their event key. Without a watermark or with `reconcile`,
+    re-pulls the last `lookback_days` days.
+    """
+    tenant_id = TENANTS[account]
+    posted_before = dt.datetime.now(dt.timezone.utc) - dt.timedelta(minutes=3) # must be 2+ minutes before now
+    watermark = None if reconcile else watermarks.get_watermark(WATERMARK_JOB, tenant_id, marketplace)
+
+    if watermark:
+        posted_after = watermark - dt.timedelta(hours=overlap_hours)
+    else:
+        posted_after = dt.datetime.combine(posted_before.date() - dt.timedelta(days=lookback_days),
+                                           dt.time(), tzinfo=dt.timezone.utc)
+    logger.info(f"{'Reconciling' if reconcile else 'Syncing'} {account}-{marketplace} financial events "
+                f"posted from {posted_after} to {posted_before}")
+
+    watermarks.start_run(WATERMARK_JOB, tenant_id, marketplace)
+    try:
+        financial_events_items = get_financial_events(
+            account,
+            marketplace,
+            MarketplaceId = Marketplaces[marketplace].value,
+            PostedAfter = posted_after.isoformat(),
+            PostedBefore = posted_before.isoformat(),
+            MaxResultsPerPage = 100
+            )
+
+        # Merge data to BigQuery
+        table_id = f"{PROJECT_ID}.{DEST_DATASET}.{DEST_TABLE}"
+        add_event_index(table_id)
+        bigquery_utils.merge_to_bigquery(financial_events_items, table_id, PROJECT_ID, EVENT_KEY)
+
+    except Exception as error:
+        watermarks.fail_run(WATERMARK_JOB, tenant_id, marketplace, error)
+        raise
+
+    watermarks.advance(WATERMARK_JOB, posted_before, tenant_id, marketplace, rows_loaded=len(financial_events_items))
+
+
 if __name__ == '__main__':
     marketplaces = ['US', 'CA', 'UK']
-    lookback_180 = 180 # lookback window for daily
-    lookback_730 = 730 # lookback window for weekly
+    lookback_730 = 730 # lookback window for weekly reconciliation
 
     # Use this for backfilling
-    # posted_after = dt.datetime(2025, 11, 1, 0, 0, 0, tzinfo=dt.timezone.utc).isoformat()
-    # posted_before = dt.datetime(2025, 12, 1, 0, 0, 0, tzinfo=dt.timezone.utc).isoformat()
+    # sync_financial_events(account, marketplace, reconcile=True, lookback_days=...)
 
-    date_today = dt.datetime.now(dt.timezone.utc).date()
     weekday_num = dt.datetime.today().weekday()
     hour = dt.datetime.now().hour
 
     for account in TENANTS.keys():
         for marketplace in to_list(marketplaces):
             if weekday_num == 6 and hour == 5: # sunday at 5am
-                posted_after = date_today - dt.timedelta(days=lookback_730)
-                posted_before = date_today
-
-                financial_events_items = get_financial_events(
-                    account,
-                    marketplace,
-                    MarketplaceId = Marketplaces[marketplace].value,
-                    PostedAfter = posted_after.isoformat(),
-                    PostedBefore = posted_before.isoformat(),
-                    MaxResultsPerPage = 100
-                    )
-                
-                # Load data to BigQuery
-                table_id = f"{PROJECT_ID}.{DEST_DATASET}.{DEST_TABLE}"
-                bigquery_utils.load_to_bigquery(financial_events_items, table_id, PROJECT_ID, "append")
-
-            else: # daily at 3am
-                posted_after = date_today - dt.timedelta(days=lookback_180)
-                posted_before = date_today
-
-                financial_events_items = get_financial_events(
-                    account,
-                    marketplace,
-                    MarketplaceId = Marketplaces[marketplace].value,
-                    PostedAfter = posted_after.isoformat(),
-                    PostedBefore = posted_before.isoformat(),
-                    MaxResultsPerPage = 100
-                    )
-                
-                # Load data to BigQuery
-                table_id = f"{PROJECT_ID}.{DEST_DATASET}.{DEST_TABLE}"
-                bigquery_utils.load_to_bigquery(financial_events_items, table_id, PROJECT_ID, "append")
\ No newline at end of file
+                sync_financial_events(account, marketplace, reconcile=True, lookback_days=lookback_730)
+
+            else: # daily at 3am, incremental since the last sync
+                sync_financial_events(account, marketplace)
@@ -1,11 +1,12 @@
 from sp_api.api import FulfillmentInbound
 from sp_api.base import Marketplaces, SellingApiException, SellingApiBadRequestException, SellingApiNotFoundException
-from sp_api.util import throttle_retry, load_all_pages
+from sp_api.util import load_all_pages
 import datetime as dt
 from utility import to_list
 import pandas as pd
-import time
 import postgresql
+import sp_api_rate_limiter
+import tenant_registry
 import logging
 import logger_setup
 
@@ -13,46 +14,43 @@ import logger_setup
 logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
-tenants = postgresql.get_tenants()
+tenants = tenant_registry.postgres_tenants
 
 
-@throttle_retry()
-@load_all_pages(extras=dict(QueryType='NEXT_TOKEN'))
+@load_all_pages(throttle_by_seconds=0, extras=dict(QueryType='NEXT_TOKEN'))
 def load_all_shipments(account='Bare Barrel', marketplace='US', **kwargs):
     """
     a generator function to return all pages, obtained by NextToken
     """
-    response = FulfillmentInbound(
+    response = sp_api_rate_limiter.call(account, marketplace, 'get_shipments', lambda: FulfillmentInbound(
                             account=f'{account}-{marketplace}',
                             marketplace=Marketplaces[marketplace]
-                            ).get_shipments(**kwargs)
+                            ).get_shipments(**kwargs))
     return response
 
 
-@throttle_retry()
-@load_all_pages(extras=dict(QueryType='NEXT_TOKEN'))
+@load_all_pages(throttle_by_seconds=0, extras=dict(QueryType='NEXT_TOKEN'))
 def load_all_shipment_items(account='Bare Barrel', marketplace='US', **kwargs):
     """
     a generator function to return all pages, obtained by NextToken
     """
-    response = FulfillmentInbound(
+    response = sp_api_rate_limiter.call(account, marketplace, 'get_shipment_items', lambda: FulfillmentInbound(
                             account=f'{account}-{marketplace}',
                             marketplace=Marketplaces[marketplace]
-                            ).shipment_items(**kwargs)
+                            ).shipment_items(**kwargs))
     return response
 
 
-@throttle_retry()
-@load_all_pages(next_token_param='paginationToken')
+@load_all_pages(throttle_by_seconds=0, next_token_param='paginationToken')
 def load_all_inbound_plans(account='Bare Barrel', marketplace='US', **kwargs):
     """
     a generator function to return all pages, obtained by NextToken
     """
-    response = FulfillmentInbound(
+    response = sp_api_rate_limiter.call(account, marketplace, 'list_inbound_plans', lambda: FulfillmentInbound(
                             account=f'{account}-{marketplace}',
                             marketplace=Marketplaces[marketplace],
                             version='2024-03-20'
-                            ).list_inbound_plans(**kwargs)
+                            ).list_inbound_plans(**kwargs))
     return response
 
 
@@ -90,7 +88,6 @@ def get_all_shipments(account='Bare Barrel', marketplaces=['US', 'UK'], **kwargs
             # data.insert(0, 'marketplace', marketplace) # Marketplaces are aggregated by region
             data['tenant_id'] = tenants[account]
             shipments_data = pd.concat([shipments_data, data], ignore_index=True)
-            time.sleep(0.5)
 
     return shipments_data
 
@@ -128,7 +125,6 @@ def get_all_shipment_items(account='Bare Barrel', marketplaces=['US', 'UK'], **k
             # data.insert(0, 'marketplace', marketplace) # Marketplaces are aggregated by region
             data['tenant_id'] = tenants[account]
             shipments_data = pd.concat([shipments_data, data], ignore_index=True)
-            time.sleep(0.5)
 
     return shipments_data
 
@@ -174,7 +170,6 @@ def get_all_inbound_plans(account='Bare Barrel', marketplaces=['US', 'UK'], stat
                 # data.insert(0, 'marketplace', marketplace) # Marketplaces are aggregated by region
                 data['tenant_id'] = tenants[account]
                 inbound_data = pd.concat([inbound_data, data], ignore_index=True)
-                time.sleep(0.5)
 
     inbound_data.rename(columns={'createdAt': 'date_created_at'}, inplace=True)
 
@@ -1,11 +1,13 @@
 from sp_api.base import Marketplaces
 from sp_api.api import Inventories
-from sp_api.util import throttle_retry, load_all_pages
+from sp_api.util import load_all_pages
 from utility import to_list
 import postgresql
+import sp_api_rate_limiter
 import pandas as pd
 import datetime as dt
 import pytz
+import tenant_registry
 import logging
 import logger_setup
 
@@ -13,17 +15,17 @@ logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
 table_name = 'inventory.fba'
-tenants = postgresql.get_tenants()
+tenants = tenant_registry.postgres_tenants
 
 
-@throttle_retry()
-@load_all_pages(next_token_param='nextToken')
+@load_all_pages(throttle_by_seconds=0, next_token_param='nextToken')
 def load_all_inventories(account='Bare Barrel', marketplace='US', **kwargs):
     """
     a generator function to return all pages, obtained by NextToken
     """
-    return Inventories(account=f'{account}-{marketplace}', 
-                        marketplace=Marketplaces[marketplace]).get_inventory_summary_marketplace(**kwargs)
+    return sp_api_rate_limiter.call(account, marketplace, 'get_inventory_summaries', lambda: Inventories(
+                        account=f'{account}-{marketplace}', 
+                        marketplace=Marketplaces[marketplace]).get_inventory_summary_marketplace(**kwargs))
 
 
 def get_data(account='Bare Barrel', marketplace='US', **kwargs):
@@ -3,10 +3,11 @@ from sp_api.base import Marketplaces
 from sp_api.api import ListingsItems
 from sp_api.base.exceptions import SellingApiNotFoundException
 import postgresql
-import time
+import sp_api_rate_limiter
 import pandas as pd
 import json
 from utility import to_list, payload_to_dataframe, reposition_columns
+import tenant_registry
 import logging
 import logger_setup
 
@@ -21,7 +22,7 @@ listings_items_schema = 'listings_items'
 table_names = {'summaries': 'summaries', 'attributes': 'attributes', 'issues': 'issues', 'offers': 'offers', 
                 'fulfillment_availability': 'fulfillmentAvailability'} #, 'procurement': 'procurement'} empty
 
-tenants = postgresql.get_tenants()
+tenants = tenant_registry.postgres_tenants
 
 
 def get_all_listings_items(included_data=['summaries', 'attributes', 'issues', 'offers', 'fulfillmentAvailability', 'procurement'], 
@@ -62,33 +63,27 @@ def get_all_listings_items(included_data=['summaries', 'attributes', 'issues', '
         for sku in skus:
             logger.info(f"\tProcessing SKU: {sku}")
 
-            while True:
-                try:
-                    response = ListingsItems(account=f'{account}-{marketplace}', 
-                                            marketplace=Marketplaces[marketplace]).get_listings_item(
-                                                                                    seller_id,
-                                                                                    sku, 
-                                                                                    includedData=','.join(to_list(included_data))
-                                                                                )
-
-                    # Combies each included data set payload
-                    for data_set in included_data:
-                        data = payload_to_dataframe(response, get_key=data_set)
-                        data['sku'] = sku
-                        data['marketplace'] = marketplace
-                        data['date'] = dt.datetime.now(dt.timezone.utc).date()
-                        data['tenant_id'] = tenants[account]
-                        data = reposition_columns(data, {'sku':0, 'date': 1, 'marketplace': 2})
-                        listings_data[data_set] = pd.concat([data, listings_data[data_set]], ignore_index=True)
-
-                    time.sleep(0.25)
-                    break
-
-                except Exception as error:
-                    logger.error(error)
-                    if type(error) == SellingApiNotFoundException:
-                        break
-                    time.sleep(30)
+            try:
+                response = sp_api_rate_limiter.call(account, marketplace, 'get_listings_item', lambda: ListingsItems(
+                                        account=f'{account}-{marketplace}', 
+                                        marketplace=Marketplaces[marketplace]).get_listings_item(
+                                                                                seller_id,
+                                                                                sku, 
+                                                                                includedData=','.join(to_list(included_data))
+                                                                            ))
+            except SellingApiNotFoundException as error:
+                logger.warning(f"\tSKU {sku} not found: {error}")
+                continue
+
+            # Combies each included data set payload
+            for data_set in included_data:
+                data = payload_to_dataframe(response, get_key=data_set)
+                data['sku'] = sku
+                data['marketplace'] = marketplace
+                data['date'] = dt.datetime.now(dt.timezone.utc).date()
+                data['tenant_id'] = tenants[account]
+                data = reposition_columns(data, {'sku':0, 'date': 1, 'marketplace': 2})
+                listings_data[data_set] = pd.concat([data, listings_data[data_set]], ignore_index=True)
 
     return listings_data
 
@@ -1,13 +1,17 @@
 import datetime as dt
 from sp_api.base import Marketplaces
 from sp_api.api import Orders
-from sp_api.util import throttle_retry, load_all_pages
-from sp_api.base.exceptions import SellingApiRequestThrottledException, SellingApiServerException
-from requests.exceptions import ReadTimeout, ConnectionError
+from sp_api.util import load_all_pages
 from utility import to_list
+import sp_api_rate_limiter
+import watermarks
 import postgresql
-import time
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
+import tenant_registry
 import logging
 import logger_setup
 
@@ -16,70 +20,167 @@ logger = logging.getLogger(__name__)
 
 orders_table = 'orders.amazon_orders'
 order_items_table = 'orders.amazon_order_items'
-tenants = postgresql.get_tenants()
+watermark_job = 'amazon_orders'
+# upserted order items of interrupted updates {account-marketplace: {last_updated_after, order_ids}}
+checkpoint_path = 'order_items_checkpoint.json'
+checkpoint_lock = threading.Lock()
+tenants = tenant_registry.postgres_tenants
 
-@load_all_pages()
-@throttle_retry(tries=50)
+@load_all_pages(throttle_by_seconds=0)
 def load_all_orders(account='Bare Barrel', marketplace='US', **kwargs):
     """
     a generator function to return all pages, obtained by NextToken
     """
-    return Orders(account=f'{account}-{marketplace}', marketplace=Marketplaces[marketplace]).get_orders(**kwargs)
+    return sp_api_rate_limiter.call(account, marketplace, 'get_orders', lambda: Orders(
+        account=f'{account}-{marketplace}', marketplace=Marketplaces[marketplace]).get_orders(**kwargs))
+
+
+def load_checkpoint(key):
+    """Returns the checkpoint of an interrupted run: {'last_updated_after': str, 'order_ids': set} or None"""
+    with checkpoint_lock:
+        if not os.path.exists(checkpoint_path):
+            return None
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f).get(key)
+    if checkpoint:
+        checkpoint['order_ids'] = set(checkpoint['order_ids'])
+    return checkpoint
+
+
+def save_checkpoint(key, last_updated_after, order_ids=None):
+    """Records the orders whose items are upserted, or removes the checkpoint when `order_ids` is None"""
+    with checkpoint_lock:
+        checkpoints = {}
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                checkpoints = json.load(f)
+
+        if order_ids is None:
+            checkpoints.pop(key, None)
+        else:
+            checkpoints[key] = {'last_updated_after': last_updated_after, 'order_ids': sorted(order_ids)}
+
+        # writes a temporary file first so an interruption doesn't corrupt the checkpoint
+        with open(checkpoint_path + '.tmp', 'w') as f:
+            json.dump(checkpoints, f)
+        os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+
+def get_order_items(order_id, account='Bare Barrel', marketplace='US'):
+    """
+    Gets the items of an order as records, within the shared `get_order_items` rate limit
+    """
+    logger.info(f"Getting Order ID: {order_id}")
+    order_items = sp_api_rate_limiter.call(account, marketplace, 'get_order_items', lambda: Orders(
+        account=f'{account}-{marketplace}', marketplace=Marketplaces[marketplace]).get_order_items(order_id))
 
+    records = order_items.payload.get('OrderItems') or []
+    for record in records:
+        record['amazon_order_id'] = order_id
+        record['marketplace'] = marketplace
+        record['tenant_id'] = tenants[account]
+    return records
 
-def get_orders_items(order_ids=[], account='Bare Barrel', marketplace='US'):
+
+def iter_orders_items(order_ids=[], account='Bare Barrel', marketplace='US', batch_size=1000, max_workers=4):
     """
-    gets detail information of multiple orders and concatenate it to a dataframe
+    Fetches the items of multiple orders concurrently, buffering their records
+    and yielding (order_ids, dataframe) every `batch_size` orders.
     """
-    df = pd.DataFrame()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {executor.submit(get_order_items, order_id, account, marketplace): order_id
+                   for order_id in to_list(order_ids)}
 
-    for order_id in to_list(order_ids):
+        records, batch_order_ids = [], []
+        for future in as_completed(futures):
+            records.extend(future.result())
+            batch_order_ids.append(futures[future])
 
-        while True:
+            if len(batch_order_ids) >= batch_size:
+                yield batch_order_ids, pd.json_normalize(records, sep='_')
+                records, batch_order_ids = [], []
 
-            try:
-                logger.info(f"Getting Order ID: {order_id}")
-                order_items = Orders(account=f'{account}-{marketplace}', 
-                                     marketplace=Marketplaces[marketplace]).get_order_items(order_id)
-                data = order_items.payload.get('OrderItems')
-                data = pd.json_normalize(data, sep='_') 
-                data['amazon_order_id'] = order_id
-                data['marketplace'] = marketplace
-                data['tenant_id'] = tenants[account]
-                df = pd.concat([df, data], ignore_index=True)
-                time.sleep(1)
-                break
+        if batch_order_ids:
+            yield batch_order_ids, pd.json_normalize(records, sep='_')
+    finally:
+        # an error or an interruption doesn't wait for the remaining orders
+        executor.shutdown(wait=True, cancel_futures=True)
 
-            except (SellingApiRequestThrottledException, SellingApiServerException, ReadTimeout, ConnectionError) as error:
-                logger.error(error)
-                time.sleep(5)
 
-    return df
+def get_orders_items(order_ids=[], account='Bare Barrel', marketplace='US', max_workers=4):
+    """
+    gets detail information of multiple orders and concatenate it to a dataframe
+    """
+    batches = [data for _, data in iter_orders_items(order_ids, account, marketplace, max_workers=max_workers)]
+    if not batches:
+        return pd.DataFrame()
+    return pd.concat(batches, ignore_index=True)
 
 
-def update_data(account='Bare Barrel', marketplaces=['US', 'CA', 'UK'], **kwargs):
+def upsert_orders_items(order_ids, account='Bare Barrel', marketplace='US', last_updated_after=None,
+                        batch_size=1000, max_workers=4):
     """
-    Updates orders data based from the last updated date
+    Fetches order items concurrently and upserts them every `batch_size` orders.
+    With `last_updated_after`, upserted orders are checkpointed so a rerun of
+    the same update skips them, the checkpoint is removed once all orders are done.
     """
-    for marketplace in to_list(marketplaces):
-        logger.info(f"Getting Orders from {account}-{marketplace}. . .")
+    key = f'{account}-{marketplace}'
+    upserted_order_ids = set()
+    if last_updated_after:
+        checkpoint = load_checkpoint(key)
+        if checkpoint and checkpoint['last_updated_after'] == last_updated_after:
+            upserted_order_ids = checkpoint['order_ids']
+            logger.info(f"Resuming {key} order items, {len(upserted_order_ids)} orders already upserted")
+
+    pending_order_ids = [order_id for order_id in to_list(order_ids) if order_id not in upserted_order_ids]
+    for batch_order_ids, data in iter_orders_items(pending_order_ids, account, marketplace, batch_size, max_workers):
+        if not data.empty:
+            postgresql.upsert_bulk(order_items_table, data, file_extension='pandas')
 
-        # gets latest orders
-        if 'LastUpdatedAfter' not in kwargs:
-            with postgresql.setup_cursor() as cur:
-                cur.execute(f"""SELECT MAX(last_update_date)::TIMESTAMP FROM {orders_table} 
-                                WHERE marketplace = '{marketplace}'
-                                    AND tenant_id = '{tenants[account]}';""")
-                last_update_date = cur.fetchone()['max']
-                kwargs['LastUpdatedAfter'] = last_update_date.isoformat()
+        upserted_order_ids.update(batch_order_ids)
+        logger.info(f"\t{len(upserted_order_ids)} / {len(order_ids)} {key} orders items upserted")
+        if last_updated_after:
+            save_checkpoint(key, last_updated_after, upserted_order_ids)
 
-                if not last_update_date:
-                    kwargs['LastUpdatedAfter'] = dt.date(2020,1,1).isoformat()
+    if last_updated_after:
+        save_checkpoint(key, last_updated_after, None)
 
+
+def update_data(account='Bare Barrel', marketplaces=['US', 'CA', 'UK'], **kwargs):
+    """
+    Updates orders data based from the last updated date,
+    or from the one of an interrupted update
+    """
+    for marketplace in to_list(marketplaces):
+        logger.info(f"Getting Orders from {account}-{marketplace}. . .")
+        marketplace_kwargs = dict(kwargs)
+
+        # gets latest orders from an interrupted update, the watermark or the table on the first run
+        if 'LastUpdatedAfter' not in marketplace_kwargs:
+            checkpoint = load_checkpoint(f'{account}-{marketplace}')
+            watermark = watermarks.get_watermark(watermark_job, tenants[account], marketplace)
+            if checkpoint:
+                marketplace_kwargs['LastUpdatedAfter'] = checkpoint['last_updated_after']
+            elif watermark:
+                marketplace_kwargs['LastUpdatedAfter'] = watermark.isoformat()
+            else:
+                with postgresql.setup_cursor() as cur:
+                    cur.execute(f"""SELECT MAX(last_update_date)::TIMESTAMP FROM {orders_table} 
+                                    WHERE marketplace = '{marketplace}'
+                                        AND tenant_id = '{tenants[account]}';""")
+                    last_update_date = cur.fetchone()['max']
+
+                    if not last_update_date:
+                        marketplace_kwargs['LastUpdatedAfter'] = dt.date(2020,1,1).isoformat()
+                    else:
+                        marketplace_kwargs['LastUpdatedAfter'] = last_update_date.isoformat()
+
+        watermarks.start_run(watermark_job, tenants[account], marketplace)
         orders_data = pd.DataFrame()
         total_orders = 0
   
-        for page in load_all_orders(account, marketplace, **kwargs):    # datetime.utcnow() - timedelta(days=290)).isoformat()
+        for page in load_all_orders(account, marketplace, **marketplace_kwargs):    # datetime.utcnow() - timedelta(days=290)).isoformat()
             orders_payload = page.payload.get('Orders')
             data = pd.json_normalize(orders_payload, sep='_')
             data['marketplace'] = marketplace
@@ -87,21 +188,52 @@ def update_data(account='Bare Barrel', marketplaces=['US', 'CA', 'UK'], **kwargs
             orders_data = pd.concat([orders_data, data], ignore_index=True)
             total_orders += len(orders_payload)
             logger.info(f"\t{total_orders} orders processed")
-            time.sleep(10)
 
         if orders_data.empty:
             logger.info("No new updated orders")
+            watermarks.advance(watermark_job, None, tenants[account], marketplace, rows_loaded=0)
             continue
 
-        orders_data.columns = [postgresql.sql_standardize(col) for col in orders_data.columns]
+        orders_data.columns = postgresql.standardize_columns(orders_data.columns)
+
+        # upserts orders data first, order items reference them,
+        # advancing the watermark to the latest order update in the same transaction
+        key = f'{account}-{marketplace}'
+        last_updated_after = marketplace_kwargs['LastUpdatedAfter']
+        last_update_date = pd.to_datetime(orders_data['last_update_date'], utc=True).max().to_pydatetime()
+
+        def checkpoint_and_advance(cur, counts):
+            # the checkpoint is written before the watermark moves past these orders,
+            # so a crash while fetching their items resumes this update instead of skipping them
+            checkpoint = load_checkpoint(key)
+            if not checkpoint or checkpoint['last_updated_after'] != last_updated_after:
+                save_checkpoint(key, last_updated_after, set())
+            watermarks.advance(watermark_job, last_update_date, tenants[account], marketplace,
+                               rows_loaded=len(orders_data), cur=cur)
 
-        # gets order items data
+        postgresql.upsert_bulk(orders_table, orders_data, file_extension='pandas', before_commit=checkpoint_and_advance)
+
+        # gets & upserts order items data in batches
         order_ids = list(orders_data['amazon_order_id'].unique())
-        order_items_data = get_orders_items(order_ids, account, marketplace)
-    
-        # upserts orders data
-        postgresql.upsert_bulk(orders_table, orders_data, file_extension='pandas')
-        postgresql.upsert_bulk(order_items_table, order_items_data, file_extension='pandas')
+        upsert_orders_items(order_ids, account, marketplace, last_updated_after=last_updated_after)
+
+
+def update_all_data(accounts=None, marketplaces=['US', 'CA', 'UK'], max_workers=None):
+    """
+    Updates orders of every account & marketplace in parallel, each within its own rate limits
+    """
+    jobs = [(account, marketplace) for account in to_list(accounts or list(tenants.keys()))
+            for marketplace in to_list(marketplaces)]
+    with ThreadPoolExecutor(max_workers=max_workers or len(jobs)) as executor:
+        futures = {executor.submit(update_data, account, [marketplace]): (account, marketplace)
+                   for account, marketplace in jobs}
+        for future in as_completed(futures):
+            account, marketplace = futures[future]
+            try:
+                future.result()
+            except Exception as error:
+                logger.error(f"Failed updating orders of {account}-{marketplace}: {error}")
+                watermarks.fail_run(watermark_job, tenants[account], marketplace, error)
 
 
 # def create_orders_table(drop_table_if_exists=False):
@@ -152,12 +284,10 @@ def update_missing_order_items(account='Bare Barrel', marketplaces=['US', 'CA',
                 logger.info(f"\tNo Missing Amazon Order IDs in orders.amazon_order_items")
                 break
 
-            data = get_orders_items(order_ids, account, marketplace)
-            
-            postgresql.upsert_bulk(order_items_table, data, file_extension='pandas')
+            upsert_orders_items(order_ids, account, marketplace)
 
 
 if __name__ == '__main__':
+    update_all_data()
     for account in tenants.keys():
-        update_data(account)
         update_missing_order_items(account)
\ No newline at end of file
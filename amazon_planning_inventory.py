@@ -4,6 +4,7 @@ from amazon_reports import request_report, get_report, download_report
 import time
 import pandas as pd
 import postgresql
+import tenant_registry
 import logging
 import logger_setup
 from io import StringIO
@@ -13,7 +14,7 @@ logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
 table_name = 'inventory.fba_planning_inventory'
-tenants = postgresql.get_tenants()
+tenants = tenant_registry.postgres_tenants
 
 
 def download_combine_reports(account='Bare Barrel', marketplaces=['US', 'CA', 'UK']):
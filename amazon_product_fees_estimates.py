@@ -1,18 +1,18 @@
 from sp_api.api import ProductFees
 from sp_api.base import Marketplaces
-from sp_api.base.exceptions import SellingApiRequestThrottledException, SellingApiServerException
-import time
 import pandas as pd
+import tenant_registry
 import logging
 import logger_setup
 from google.cloud import bigquery
 import bigquery_utils
+import sp_api_rate_limiter
 
 
 logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
-TENANTS = bigquery_utils.get_tenants()
+TENANTS = tenant_registry.bigquery_tenants
 
 PROJECT_ID = "modern-sublime-383117"
 SOURCE_DATASET = "listings_items"
@@ -102,80 +102,74 @@ def fetch_fba_fees(df):
         for batch_df in chunked(group_df, 20):
             requests = build_requests(batch_df, account, marketplace)
 
-            try:
-                response = ProductFees(
-                        account=f'{account}-{marketplace}',
-                        marketplace=Marketplaces[marketplace]
-                    ).get_product_fees_estimate(requests)
-
-                # Check if data was fetched successfully
-                for res in response.payload:
-                    if res.get("Status") != "Success":
-                        error = res.get("Error", {})
-                        logger.warning(
-                            f"Fee estimate failed for SKU: "
-                            f"{res.get('FeesEstimateIdentifier', {}).get('IdValue')} | "
-                            f"{error.get('Code')} - {error.get('Message')}"
-                        )
-                        results.append({
-                            "tenant_id": tenant_id,
-                            "marketplace": marketplace,
-                            "sku": res.get("FeesEstimateIdentifier", {}).get("IdValue"),
-                            "price_to_estimate_fees_amount": res.get("FeesEstimateIdentifier", {}).get("PriceToEstimateFees", {}).get("ListingPrice", {}).get("Amount"),
-                            "price_to_estimate_fees_currency_code": res.get("FeesEstimateIdentifier", {}).get("PriceToEstimateFees", {}).get("ListingPrice", {}).get("CurrencyCode"),
-                            "fees_estimated_at": None,
-                            "est_total_fees": None,
-                            "est_referral_fee": None,
-                            "est_variable_closing_fee": None,
-                            "est_per_item_fee": None,
-                            "est_fba_fee": None,
-                            "error_code": res.get("Error", {}).get("Code"),
-                            "error_message": res.get("Error", {}).get("Message")
-                        })
-                        continue  # store failures in output for visibility
-                    
-                    identifier = res.get("FeesEstimateIdentifier", {})
-                    sku = identifier.get("IdValue")
-
-                    fees_estimated_at = res.get("FeesEstimate", {}).get("TimeOfFeesEstimation")
-                    total_fees = res.get("FeesEstimate", {}).get("TotalFeesEstimate", {}).get("Amount")
-
-                    # Get fees
-                    fees = res.get("FeesEstimate", {}).get("FeeDetailList", [])
-                    referral_fee = None
-                    variable_closing_fee = None
-                    per_item_fee = None
-                    fba_fee = None
-                    for fee in fees:
-                        if fee.get("FeeType") == "ReferralFee":
-                            referral_fee = fee.get("FinalFee", {}).get("Amount")
-                        if fee.get("FeeType") == "VariableClosingFee":
-                            variable_closing_fee = fee.get("FinalFee", {}).get("Amount")
-                        if fee.get("FeeType") == "PerItemFee":
-                            per_item_fee = fee.get("FinalFee", {}).get("Amount")
-                        if fee.get("FeeType") == "FBAFees":
-                            fba_fee = fee.get("FinalFee", {}).get("Amount")
-
+            response = sp_api_rate_limiter.call(account, marketplace, 'get_my_fees_estimates', lambda: ProductFees(
+                    account=f'{account}-{marketplace}',
+                    marketplace=Marketplaces[marketplace]
+                ).get_product_fees_estimate(requests))
+
+            # Check if data was fetched successfully
+            for res in response.payload:
+                if res.get("Status") != "Success":
+                    error = res.get("Error", {})
+                    logger.warning(
+                        f"Fee estimate failed for SKU: "
+                        f"{res.get('FeesEstimateIdentifier', {}).get('IdValue')} | "
+                        f"{error.get('Code')} - {error.get('Message')}"
+                    )
                     results.append({
                         "tenant_id": tenant_id,
                         "marketplace": marketplace,
-                        "sku": sku,
+                        "sku": res.get("FeesEstimateIdentifier", {}).get("IdValue"),
                         "price_to_estimate_fees_amount": res.get("FeesEstimateIdentifier", {}).get("PriceToEstimateFees", {}).get("ListingPrice", {}).get("Amount"),
                         "price_to_estimate_fees_currency_code": res.get("FeesEstimateIdentifier", {}).get("PriceToEstimateFees", {}).get("ListingPrice", {}).get("CurrencyCode"),
-                        "fees_estimated_at": fees_estimated_at,
-                        "est_total_fees": total_fees,
-                        "est_referral_fee": referral_fee,
-                        "est_variable_closing_fee": variable_closing_fee,
-                        "est_per_item_fee": per_item_fee,
-                        "est_fba_fee": fba_fee
+                        "fees_estimated_at": None,
+                        "est_total_fees": None,
+                        "est_referral_fee": None,
+                        "est_variable_closing_fee": None,
+                        "est_per_item_fee": None,
+                        "est_fba_fee": None,
+                        "error_code": res.get("Error", {}).get("Code"),
+                        "error_message": res.get("Error", {}).get("Message")
                     })
-
-                    logger.info(f"Done getting estimated fees for SKU: {sku}")
-            except (SellingApiRequestThrottledException, SellingApiServerException) as error:
-                logger.warning(error)
-
-            # Rate limit protection (~0.5 RPS)
-            time.sleep(2)
+                    continue  # store failures in output for visibility
+                
+                identifier = res.get("FeesEstimateIdentifier", {})
+                sku = identifier.get("IdValue")
+
+                fees_estimated_at = res.get("FeesEstimate", {}).get("TimeOfFeesEstimation")
+                total_fees = res.get("FeesEstimate", {}).get("TotalFeesEstimate", {}).get("Amount")
+
+                # Get fees
+                fees = res.get("FeesEstimate", {}).get("FeeDetailList", [])
+                referral_fee = None
+                variable_closing_fee = None
+                per_item_fee = None
+                fba_fee = None
+                for fee in fees:
+                    if fee.get("FeeType") == "ReferralFee":
+                        referral_fee = fee.get("FinalFee", {}).get("Amount")
+                    if fee.get("FeeType") == "VariableClosingFee":
+                        variable_closing_fee = fee.get("FinalFee", {}).get("Amount")
+                    if fee.get("FeeType") == "PerItemFee":
+                        per_item_fee = fee.get("FinalFee", {}).get("Amount")
+                    if fee.get("FeeType") == "FBAFees":
+                        fba_fee = fee.get("FinalFee", {}).get("Amount")
+
+                results.append({
+                    "tenant_id": tenant_id,
+                    "marketplace": marketplace,
+                    "sku": sku,
+                    "price_to_estimate_fees_amount": res.get("FeesEstimateIdentifier", {}).get("PriceToEstimateFees", {}).get("ListingPrice", {}).get("Amount"),
+                    "price_to_estimate_fees_currency_code": res.get("FeesEstimateIdentifier", {}).get("PriceToEstimateFees", {}).get("ListingPrice", {}).get("CurrencyCode"),
+                    "fees_estimated_at": fees_estimated_at,
+                    "est_total_fees": total_fees,
+                    "est_referral_fee": referral_fee,
+                    "est_variable_closing_fee": variable_closing_fee,
+                    "est_per_item_fee": per_item_fee,
+                    "est_fba_fee": fba_fee
+                })
+
+                logger.info(f"Done getting estimated fees for SKU: {sku}")
 
     results_df = pd.DataFrame(results)
     results_df["recorded_at"] = pd.Timestamp.now(tz="UTC")
@@ -1,11 +1,11 @@
 import datetime as dt
 from sp_api.base import Marketplaces
 from sp_api.api import Products
-from sp_api.base.exceptions import SellingApiRequestThrottledException
 from utility import to_list, reposition_columns
 import postgresql
-import time
+import sp_api_rate_limiter
 import pandas as pd
+import tenant_registry
 import logging
 import logger_setup
 
@@ -14,7 +14,7 @@ logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
 product_pricing_table = 'product_pricing.competitive_pricing'
-tenants = postgresql.get_tenants()
+tenants = tenant_registry.postgres_tenants
 
 
 def get_competitive_pricing(asin_list, customer_type='Consumer', item_condition='New', account='Bare Barrel', marketplace='US'):
@@ -42,23 +42,16 @@ def get_competitive_pricing(asin_list, customer_type='Consumer', item_condition=
         asins = asin_list[i:i+max_asins]
         total_processed += len(asins)
 
-        while True:            
-
-            try:
-                logger.info('\t' + f"Processing {total_processed} / {len(asin_list)}. . .")
-                response = Products(account=f'{account}-{marketplace}', marketplace=Marketplaces[marketplace]).get_competitive_pricing_for_asins(asin_list=asins, item_condition='New', customer_type=customer_type)
-                data = pd.json_normalize(response.payload, sep='_')
-                data['date'] = dt.date.today()
-                data['customer_type'] = customer_type
-                data['marketplace'] = marketplace
-                data['tenant_id'] = tenants[account]
-                combined_data = pd.concat([data, combined_data], ignore_index=True)
-                time.sleep(2)
-                break
-
-            except SellingApiRequestThrottledException as error:
-                logger.warning(f'\t{error}')
-                time.sleep(5)
+        logger.info('\t' + f"Processing {total_processed} / {len(asin_list)}. . .")
+        response = sp_api_rate_limiter.call(account, marketplace, 'get_competitive_pricing', lambda: Products(
+            account=f'{account}-{marketplace}', marketplace=Marketplaces[marketplace]
+            ).get_competitive_pricing_for_asins(asin_list=asins, item_condition='New', customer_type=customer_type))
+        data = pd.json_normalize(response.payload, sep='_')
+        data['date'] = dt.date.today()
+        data['customer_type'] = customer_type
+        data['marketplace'] = marketplace
+        data['tenant_id'] = tenants[account]
+        combined_data = pd.concat([data, combined_data], ignore_index=True)
 
     combined_data = reposition_columns(combined_data, {'date': 1, 'marketplace': 2, 'customer_type': 3})
     return combined_data
@@ -10,6 +10,7 @@ import postgresql
 import gzip
 import json
 from utility import get_day_of_week, to_list
+import tenant_registry
 import logging
 import logger_setup
 # import os
@@ -20,7 +21,7 @@ logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
 table_name = 'brand_analytics.search_query_performance_weekly_asin' # Brand view not yet available on sp-api!
-tenants = postgresql.get_tenants()
+tenants = tenant_registry.postgres_tenants
 
 
 def request_reports(asin, start_date, end_date, account='Bare Barrel', marketplace='US'):
@@ -0,0 +1,200 @@
+import os
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+import postgresql
+from utility import list_files, combine_files
+import logging
+import logger_setup
+
+logger_setup.setup_logging(__file__)
+logger = logging.getLogger(__name__)
+
+
+def timed(function, *args, **kwargs):
+    """Returns the result and the elapsed seconds of a function call"""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def synthetic_campaigns(n_rows=1_000_000, seed=0):
+    """
+    Synthetic sponsored_products.campaign-like dataframe, already casted the way upsert_bulk does.
+
+    Returns:
+        data (pd.DataFrame), column_types (list): [(postgresql_data_type, udt_name)]
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 95, n_rows), unit='D')
+    impressions = pd.array(rng.integers(0, 50_000, n_rows), dtype='Int64')
+    impressions[rng.random(n_rows) < 0.05] = pd.NA
+
+    data = pd.DataFrame({
+        'date': dates,
+        'tenant_id': pd.array(rng.integers(1, 3, n_rows), dtype='Int64'),
+        'marketplace': rng.choice(['US', 'CA', 'UK'], n_rows),
+        'campaign_id': pd.array(rng.integers(10**14, 10**15, n_rows), dtype='Int64'),
+        'campaign_name': [f"SP - Campaign {i % 5000} - Exact" for i in range(n_rows)],
+        'campaign_status': rng.choice(['ENABLED', 'PAUSED', 'ARCHIVED'], n_rows),
+        'impressions': impressions,
+        'clicks': pd.array(rng.integers(0, 500, n_rows), dtype='Int64'),
+        'cost': rng.integers(0, 100_000, n_rows) / 100,
+        'sales_7d': rng.integers(0, 500_000, n_rows) / 100,
+        'purchases_7d': pd.array(rng.integers(0, 50, n_rows), dtype='Int64'),
+        'campaign_budget_amount': rng.choice([10.0, 25.0, 50.0, np.nan], n_rows),
+        'top_of_search_impression_share': rng.random(n_rows),
+        'is_active': rng.random(n_rows) < 0.7,
+        'report_timestamp': pd.Timestamp('2024-04-05 01:02:03') + pd.to_timedelta(rng.integers(0, 10**6, n_rows), unit='s'),
+    })
+    column_types = [
+        ('date', 'date'), ('integer', 'int4'), ('text', 'text'), ('bigint', 'int8'), ('text', 'text'),
+        ('text', 'text'), ('integer', 'int4'), ('integer', 'int4'), ('numeric', 'numeric'),
+        ('numeric', 'numeric'), ('integer', 'int4'), ('numeric', 'numeric'), ('double precision', 'float8'),
+        ('boolean', 'bool'), ('timestamp without time zone', 'timestamp'),
+    ]
+    return data, column_types
+
+
+def benchmark_copy_formats(n_rows=1_000_000, load=False):
+    """
+    Compares upsert_bulk's serializers on a synthetic campaign table.
+    Set load=True to also COPY each buffer into a temporary table.
+
+    Returns:
+        results (dict): {serializer: {'serialize': seconds, 'copy': seconds, 'bytes': size}}
+    """
+    data, column_types = synthetic_campaigns(n_rows)
+    buffers, results = {}, {}
+    for name, serializer in postgresql.serializers.items():
+        buffers[name], seconds = timed(lambda: serializer['serialize'](serializer['prepare'](data.copy()), column_types))
+        size = len(buffers[name].getvalue())
+        results[name] = {'serialize': seconds, 'bytes': size}
+
+    if load:
+        columns = ', '.join(f"{col} {data_type if data_type != 'ARRAY' else udt_name[1:] + '[]'}"
+                            for col, (data_type, udt_name) in zip(data.columns, column_types))
+        with postgresql.setup_cursor() as cur:
+            cur.execute(f"CREATE TEMPORARY TABLE benchmark_campaign ({columns});")
+            for name, serializer in postgresql.serializers.items():
+                cur.execute("TRUNCATE benchmark_campaign;")
+                _, results[name]['copy'] = timed(
+                    cur.copy_expert, f"COPY benchmark_campaign FROM STDIN WITH ({serializer['copy_options']})", buffers[name])
+
+    for name, result in results.items():
+        logger.info(f"{name}: {result}")
+    return results
+
+
+def synthetic_business_report(n_rows=200_000, seed=0):
+    """
+    Synthetic raw (uncasted) dataframe with the columns upsert_bulk converts the most:
+    percentages, time zones, arrays, jsonb and booleans.
+
+    Returns:
+        data (pd.DataFrame), converted_schema (list): [(column_name, python_data_type, postgresql_data_type)]
+    """
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        'date': (pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 95, n_rows), unit='D')).strftime('%Y-%m-%d'),
+        'sessions': rng.integers(0, 5_000, n_rows).astype(str),
+        'unit_session_percentage': [f"{value:.2f}%" for value in rng.random(n_rows) * 100],
+        'buy_box_percentage': [f"{value:.2f}%" for value in rng.random(n_rows) * 100],
+        'ordered_product_sales': rng.integers(0, 500_000, n_rows) / 100,
+        'last_updated_date': (pd.Timestamp('2024-04-05 01:02:03', tz='UTC')
+                              + pd.to_timedelta(rng.integers(0, 10**6, n_rows), unit='s')).astype(str),
+        'keywords': [['bottle', 'insulated', 'steel'][:i % 4] for i in range(n_rows)],
+        'attributes': [{'item_name': [{'value': f"Bottle {i % 100}", 'language_tag': 'en_US'}], 'size': i % 3}
+                       for i in range(n_rows)],
+        'is_buy_box_winner': rng.choice(['True', 'False', 'false', '0'], n_rows),
+    })
+    converted_schema = [
+        ('date', 'datetime64[ns]', 'date'), ('sessions', 'Int64', 'integer'),
+        ('unit_session_percentage', float, 'numeric'), ('buy_box_percentage', float, 'numeric'),
+        ('ordered_product_sales', float, 'numeric'),
+        ('last_updated_date', 'datetime64[ns, ', 'timestamp with time zone'),
+        ('keywords', 'object', 'ARRAY'), ('attributes', 'object', 'jsonb'),
+        ('is_buy_box_winner', bool, 'boolean'),
+    ]
+    return data, converted_schema
+
+
+def benchmark_cast_plan(n_rows=200_000, array_literals=True):
+    """
+    Times compiling and applying upsert_bulk's cast plan, in total and per column, without a database.
+
+    Returns:
+        results (dict): {'compile': seconds, 'apply': seconds, 'columns': {column_name: seconds}}
+    """
+    data, converted_schema = synthetic_business_report(n_rows)
+
+    cast_plan, compile_seconds = timed(postgresql.compile_cast_plan, converted_schema, array_literals)
+    _, apply_seconds = timed(postgresql.apply_cast_plan, data.copy(), cast_plan)
+    columns = {column_name: timed(postgresql.apply_cast_plan, data[[column_name]].copy(), [(column_name, conversions)])[1]
+               for column_name, conversions in cast_plan}
+
+    results = {'compile': compile_seconds, 'apply': apply_seconds, 'columns': columns}
+    logger.info(f"cast plan: {results}")
+    return results
+
+
+def synthetic_sqp_directory(directory, n_files=5_000, n_rows=50, seed=0):
+    """
+    Writes `n_files` SQP-like weekly csvs of `n_rows` search queries each,
+    overlapping by half on (reporting_date, asin, search_query) with the previous file.
+    """
+    rng = np.random.default_rng(seed)
+    for i in range(n_files):
+        queries = np.arange(i * n_rows // 2, i * n_rows // 2 + n_rows)
+        data = pd.DataFrame({
+            'reporting_date': '2024-01-06',
+            'asin': 'B000000001',
+            'search_query': [f"query {query}" for query in queries],
+            'impressions': rng.integers(0, 10_000, n_rows),
+            'clicks': rng.integers(0, 500, n_rows),
+            'purchases': rng.integers(0, 50, n_rows),
+        })
+        data.to_csv(os.path.join(directory, f"US_Search_Query_{i:05d}.csv"), index=False)
+
+
+def concat_quadratic(file_paths, read_file):
+    """The previous combine_data loop, re-copying the combined dataframe for every file"""
+    combined_data = pd.DataFrame()
+    for file_path in file_paths:
+        combined_data = pd.concat([read_file(file_path), combined_data], ignore_index=True)
+    return combined_data
+
+
+def benchmark_combine(n_files=5_000, n_rows=50, max_workers=8):
+    """
+    Compares the quadratic concat loop with utility.combine_files on a synthetic directory of csvs.
+
+    Returns:
+        results (dict): {method: {'seconds': seconds, 'rows': n_rows}}
+    """
+    primary_keys = ['reporting_date', 'asin', 'search_query']
+    with tempfile.TemporaryDirectory() as directory:
+        synthetic_sqp_directory(directory, n_files, n_rows)
+        file_paths = list_files(directory, '.csv')
+
+        methods = {
+            'quadratic_concat': lambda: concat_quadratic(file_paths, pd.read_csv),
+            'combine_files_sequential': lambda: combine_files(file_paths, pd.read_csv, max_workers=1),
+            'combine_files': lambda: combine_files(file_paths, pd.read_csv, max_workers=max_workers),
+            'combine_files_dedupe': lambda: combine_files(file_paths, pd.read_csv, primary_keys, max_workers=max_workers),
+        }
+        results = {}
+        for name, method in methods.items():
+            data, seconds = timed(method)
+            results[name] = {'seconds': seconds, 'rows': len(data)}
+
+    for name, result in results.items():
+        logger.info(f"{name}: {result}")
+    return results
+
+
+if __name__ == '__main__':
+    print(benchmark_copy_formats(load=True))
+    print(benchmark_cast_plan())
+    print(benchmark_combine())
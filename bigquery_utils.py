@@ -1,6 +1,7 @@
-import pandas_gbq
 from google.auth import default as google_auth_default
 from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
+import uuid
 import logging
 import logger_setup
 import pandas as pd
@@ -13,29 +14,161 @@ logger = logging.getLogger(__name__)
 PROJECT_ID = "modern-sublime-383117"
 
 
-def load_to_bigquery(df, table_id, project_id, load_type):
+# load_type: write disposition of the load job
+write_dispositions = {
+    'append': bigquery.WriteDisposition.WRITE_APPEND,
+    'replace': bigquery.WriteDisposition.WRITE_TRUNCATE,
+    'fail': bigquery.WriteDisposition.WRITE_EMPTY,
+}
+
+
+def get_client(project_id):
+    credentials, project = google_auth_default()    # automatically loaded from env
+    return bigquery.Client(project=project_id, credentials=credentials)
+
+
+def load_dataframe(client, df, table_id, write_disposition, schema=None, partition_column=None, cluster_columns=None):
+    """
+    Loads a dataframe as Parquet (through Arrow) in a load job and waits for it.
+    A table created by the load is partitioned by day on `partition_column` and clustered by `cluster_columns`,
+    an existing table keeps its own partitioning and clustering.
+    """
+    job_config = bigquery.LoadJobConfig(
+        write_disposition=write_disposition,
+        source_format=bigquery.SourceFormat.PARQUET,
+        schema=schema,
+    )
+    if partition_column:
+        job_config.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY, field=partition_column)
+    if cluster_columns:
+        job_config.clustering_fields = list(cluster_columns)
+    client.load_table_from_dataframe(df, table_id, job_config=job_config).result()
+
+
+def merge_dataframe(client, df, table, key_columns, partition_column=None):
     """
-    Load dataframe to a BigQuery table.
+    Stages a dataframe in an expiring table with the destination's column types
+    and merges it on `key_columns`: matched rows are updated, others inserted.
+    Only the partitions of the staged rows are scanned when partitioned on a key column.
+
+    Returns:
+        affected rows (int)
+    Raises:
+        ValueError: if rows share a key, a target row can only be merged from one source row
+    """
+    duplicated = df.duplicated(subset=key_columns, keep=False)
+    if duplicated.any():
+        raise ValueError(f"{duplicated.sum()} rows share their {key_columns} key with another row, "
+                         f"e.g. {df.loc[duplicated, key_columns].head(3).to_dict('records')}")
+    table_id = f"{table.project}.{table.dataset_id}.{table.table_id}"
+    staging_table_id = f"{table_id}_staging_{uuid.uuid4().hex[:8]}"
+    schema = [field for field in table.schema if field.name in df.columns]
+
+    staging_table = bigquery.Table(staging_table_id, schema=schema)
+    staging_table.expires = pd.Timestamp.now(tz="UTC") + pd.Timedelta(hours=1)    # cleaned up even if the merge fails
+    client.create_table(staging_table)
+
+    try:
+        logger.info(f"Staging {len(df)} rows in {staging_table_id}...")
+        load_dataframe(client, df, staging_table_id, bigquery.WriteDisposition.WRITE_TRUNCATE, schema)
+
+        columns = [f"`{column}`" for column in df.columns]
+        on = " AND ".join(f"(T.`{column}` = S.`{column}` OR (T.`{column}` IS NULL AND S.`{column}` IS NULL))"
+                          for column in key_columns)
+        if partition_column in key_columns:
+            # prunes the destination's partitions to the staged ones, as literals
+            # since BigQuery only prunes on constant filters
+            dates = pd.to_datetime(df[partition_column], utc=True, format='ISO8601').dropna().dt.date
+            if not dates.empty:
+                on += (f" AND DATE(T.`{partition_column}`) BETWEEN"
+                       f" DATE '{dates.min().isoformat()}' AND DATE '{dates.max().isoformat()}'")
+        update_set = ", ".join(f"{column} = S.{column}" for column in columns
+                               if column.strip('`') not in key_columns)
+        sql = f"""
+            MERGE `{table_id}` T
+            USING `{staging_table_id}` S
+            ON {on}
+            {f"WHEN MATCHED THEN UPDATE SET {update_set}" if update_set else ""}
+            WHEN NOT MATCHED THEN INSERT ({", ".join(columns)}) VALUES ({", ".join(f"S.{column}" for column in columns)})
+        """
+        query_job = client.query(sql)
+        query_job.result()
+        return query_job.num_dml_affected_rows
+
+    finally:
+        client.delete_table(staging_table_id, not_found_ok=True)
+
+
+def write_to_bigquery(df, table_id, project_id, load_type, key_columns=None, partition_column=None, cluster_columns=None):
+    """
+    Writes a dataframe to a BigQuery table as Parquet in a load job, raising errors.
+    A missing table is created, partitioned by day on `partition_column` and clustered by `cluster_columns`.
+    Existing tables aren't repartitioned, BigQuery can't partition a table in place: recreate it with
+    CREATE TABLE ... PARTITION BY DATE(partition_column) CLUSTER BY ... AS SELECT * FROM the old table.
 
     Args:
         df: dataframe
         table_id: BigQuery table ID
         project_id: BigQuery project ID
-        load_type: append or replace
+        load_type: append, replace, fail (if the table has data)
+                   or merge - upserts rows on `key_columns` through a staging table
+        key_columns: columns identifying a row, required by merge
+        partition_column: date/timestamp column partitioning a new table
+        cluster_columns: columns clustering a new table
     """
+    if load_type != 'merge' and load_type not in write_dispositions:
+        raise ValueError(f"Unknown load_type: {load_type}")
+    if load_type == 'merge' and not key_columns:
+        raise ValueError("load_type 'merge' requires key_columns")
+
+    if df.empty:
+        logger.info(f"No rows to load into {table_id}")
+        return
+
+    logger.info("Loading DataFrame to BigQuery...")
+    client = get_client(project_id)
+
     try:
-        logger.info("Loading DataFrame to BigQuery...")
-        credentials, project = google_auth_default()
-        pandas_gbq.to_gbq(
-            df, 
-            destination_table = table_id, 
-            project_id = project_id, 
-            credentials = credentials,    # automatically loaded from env
-            if_exists = load_type
-        )
-        logger.info("Data loaded successfully.")
+        table = client.get_table(table_id)
+    except NotFound:
+        # nothing to merge into, the load creates the table
+        logger.info(f"Creating {table_id} partitioned by {partition_column}, clustered by {cluster_columns}")
+        table, load_type = None, 'fail'
+
+    if load_type == 'merge':
+        affected_rows = merge_dataframe(client, df, table, key_columns, partition_column)
+        logger.info(f"Merged {len(df)} rows into {table_id}: {affected_rows} affected")
+    else:
+        load_dataframe(client, df, table_id, write_dispositions[load_type],
+                       partition_column=partition_column, cluster_columns=cluster_columns)
+
+    logger.info("Data loaded successfully.")
+    record_load(table_id, len(df))
+
+
+def load_to_bigquery(df, table_id, project_id, load_type, key_columns=None, partition_column=None, cluster_columns=None):
+    """
+    Load dataframe to a BigQuery table, logging errors. See write_to_bigquery.
+
+    Args:
+        df: dataframe
+        table_id: BigQuery table ID
+        project_id: BigQuery project ID
+        load_type: append, replace, fail or merge
+    """
+    try:
+        write_to_bigquery(df, table_id, project_id, load_type, key_columns, partition_column, cluster_columns)
     except Exception as e:
-        logger.info("Error loading data to BigQuery:", e)
+        logger.info(f"Error loading data to BigQuery: {e}")
+
+
+def merge_to_bigquery(df, table_id, project_id, key_columns, partition_column=None, cluster_columns=None):
+    """
+    Upserts a dataframe into a BigQuery table on `key_columns`, nulls match nulls, raising errors.
+    See write_to_bigquery.
+    """
+    write_to_bigquery(df, table_id, project_id, 'merge', key_columns, partition_column, cluster_columns)
 
 
 def get_tenants():
@@ -43,26 +176,31 @@ def get_tenants():
     Get all tenants from the database
     Returns dict
     """
-    try:
-        client = bigquery.Client(project=PROJECT_ID)
+    client = bigquery.Client(project=PROJECT_ID)
 
-        sql = "SELECT tenant_id, company FROM `public.tenants`;"
+    sql = "SELECT tenant_id, company FROM `public.tenants`;"
 
-        query_job = client.query(sql)
-        query_job.result()  # wait for completion
-        df = query_job.to_dataframe()
-        data = df.set_index('company').to_dict()['tenant_id']
+    query_job = client.query(sql)
+    query_job.result()  # wait for completion
+    df = query_job.to_dataframe()
+    return df.set_index('company').to_dict()['tenant_id']
 
-        return data
 
+def record_load(table_id, rows_loaded):
+    """Advances the table's load watermark, read by already_loaded_today"""
+    try:
+        # imported here so BigQuery-only scripts don't need postgres to import this module
+        import watermarks
+        watermarks.advance(f"bigquery:{table_id}", pd.Timestamp.now(tz="UTC").to_pydatetime(), rows_loaded=rows_loaded)
     except Exception as e:
-        logger.info("Error getting tenants: ", e)
+        logger.warning(f"Error recording watermark of {table_id}: {e}")
 
 
 def already_loaded_today(project_id, dest_dataset, dest_table, date_column_name):
     """
     Check if data has been loaded for the day.
     Used in guard clause to stop execution if data has been loaded for the day.
+    Reads the table's load watermark, tables without one are scanned for their max date.
 
     Args:
         project_id: BigQuery project ID
@@ -72,6 +210,16 @@ def already_loaded_today(project_id, dest_dataset, dest_table, date_column_name)
     
     Returns TRUE or FALSE
     """
+    try:
+        import watermarks
+        loaded = watermarks.loaded_today(f"bigquery:{project_id}.{dest_dataset}.{dest_table}")
+    except Exception as e:
+        logger.warning(f"Error reading watermark of {dest_dataset}.{dest_table}: {e}")
+        loaded = None
+    if loaded is not None:
+        logger.info(f"Loaded today according to its watermark: {loaded}")
+        return loaded
+
     client = bigquery.Client(project=PROJECT_ID)
 
     sql = f"""
@@ -1,9 +1,8 @@
 import requests
 import pandas as pd
 from datetime import date, timedelta
-import pandas_gbq
 from google.cloud import bigquery
-from google.auth import default as google_auth_default
+import bigquery_utils
 from decimal import Decimal
 import json
 import logging
@@ -16,6 +15,9 @@ logger = logging.getLogger(__name__)
 with open("config.json") as f:
     config = json.load(f)
 
+# identifies a rate
+key_columns = ['recorded_at', 'base', 'target']
+
 
 def fetch_rates(currency_from, currency_to, start_date, end_date):
     """
@@ -77,26 +79,17 @@ def payload_to_dataframe(payload):
 
 def load_to_bigquery(df, table_id, project_id):
     """
-    Load dataframe to a BigQuery table.
+    Merges dataframe into a BigQuery table on recorded_at, base & target,
+    partitioned by recorded_at and clustered by base & target when created.
     """
-    try:
-        logger.info("Loading DataFrame to BigQuery...")
-        credentials, project = google_auth_default()
-        pandas_gbq.to_gbq(
-            df, 
-            destination_table=table_id, 
-            project_id=project_id, 
-            credentials=credentials,    # automatically loaded from env
-            if_exists='append'
-        )
-        logger.info("Data loaded successfully.")
-    except Exception as e:
-        logger.info("Error loading data to BigQuery:", e)
+    bigquery_utils.load_to_bigquery(df, table_id, project_id, 'merge', key_columns=key_columns,
+                                    partition_column='recorded_at', cluster_columns=['base', 'target'])
 
 
 def remove_duplicates(project_id):
     """
     Recreates table after removing duplicates relative to recorded_at, source, and target columns and orders by recorded_at.
+    Only needed for rows appended before loads were merged, it rewrites the whole table.
     """
 
     try:
@@ -142,5 +135,3 @@ if __name__ == '__main__':
 
     if not df.empty:
         load_to_bigquery(df, table_id=table_id, project_id=project_id)
-    
-    remove_duplicates(project_id=project_id)
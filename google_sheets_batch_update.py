@@ -1,18 +1,25 @@
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from google.oauth2.service_account import Credentials
-from gspread_dataframe import set_with_dataframe
+from gspread.utils import rowcol_to_a1
 import pandas as pd
 from google_sheets_data_sources_query import worksheet_queries
 import postgresql
+import worksheet_summaries
+import hashlib
+import json
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+import tenant_registry
 import logging
 import logger_setup
 
 logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
-tenants = postgresql.get_tenants()
+tenants = tenant_registry.postgres_tenants
 
 # Google Sheets parameters
 google_sheet_data_sources = {
@@ -47,11 +54,254 @@ credentials = Credentials.from_service_account_file(
     scopes=scopes
 )
 
+# Authorized client shared by every export, see get_client
+gc = None
+gc_lock = threading.Lock()
 
-def batch_update_data_sources(url, worksheets='All', account='Bare Barrel'):
+# Fingerprints of the rows last written to each worksheet, see worksheet_value_ranges
+snapshot_directory = 'google_sheets_snapshots'
+
+
+def get_client():
+    """Authorizes Google Sheets once per process"""
+    global gc
+    with gc_lock:
+        if gc is None:
+            logger.info("Authorizing Google Sheets")
+            gc = gspread.authorize(credentials)
+        return gc
+
+
+def cell_value(value):
+    """Renders a value the way gspread_dataframe's set_with_dataframe writes it"""
+    if pd.isnull(value) is True:
+        return ''
+    value = repr(value) if isinstance(value, float) else str(value)
+    # a leading apostrophe would be read by Sheets as a text prefix
+    if value.startswith("'"):
+        value = f"'{value}"
+    return value
+
+
+def dataframe_to_values(df):
+    """Rows of rendered cells, headers first"""
+    return [[cell_value(column) for column in df.columns]] + \
+           [[cell_value(value) for value in row] for row in df.astype(object).values.tolist()]
+
+
+def row_fingerprint(row):
+    return hashlib.blake2b('\x1f'.join(row).encode(), digest_size=8).hexdigest()
+
+
+def snapshot_path(sheet, worksheet):
+    return os.path.join(snapshot_directory, f"{sheet.id}_{worksheet.id}.json")
+
+
+def load_snapshot(sheet, worksheet):
+    """Returns the snapshot of the last write to the worksheet or None"""
+    path = snapshot_path(sheet, worksheet)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_snapshot(sheet, worksheet, snapshot):
+    os.makedirs(snapshot_directory, exist_ok=True)
+    path = snapshot_path(sheet, worksheet)
+    # writes a temporary file first so an interruption doesn't corrupt the snapshot
+    with open(path + '.tmp', 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(path + '.tmp', path)
+
+
+def modified_time_path(sheet):
+    return os.path.join(snapshot_directory, f"{sheet.id}.json")
+
+
+def save_modified_time(sheet):
+    """Records the spreadsheet's Drive modifiedTime after writing it, see invalidate_stale_snapshots"""
+    os.makedirs(snapshot_directory, exist_ok=True)
+    path = modified_time_path(sheet)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'modified_time': sheet.get_lastUpdateTime()}, f)
+    os.replace(path + '.tmp', path)
+
+
+def invalidate_stale_snapshots(sheet):
+    """
+    Removes the spreadsheet's snapshots when it was modified since our last write,
+    e.g. a cell edited by hand or written from another host, so every row is written again.
+    """
+    path = modified_time_path(sheet)
+    recorded = None
+    if os.path.exists(path):
+        with open(path) as f:
+            recorded = json.load(f).get('modified_time')
+    if recorded is not None and recorded == sheet.get_lastUpdateTime():
+        return
+
+    logger.info(f"	{sheet.title} was modified since the last write, discarding its snapshots")
+    if os.path.isdir(snapshot_directory):
+        for filename in os.listdir(snapshot_directory):
+            if filename.startswith(f"{sheet.id}_"):
+                os.remove(os.path.join(snapshot_directory, filename))
+
+
+def changed_row_ranges(fingerprints, previous_fingerprints):
+    """
+    Returns:
+        ranges (list): (start, end) indexes of consecutive rows that differ from the previous write,
+            rows that no longer exist included
+    """
+    changed = [index for index in range(max(len(fingerprints), len(previous_fingerprints)))
+               if index >= len(fingerprints) or index >= len(previous_fingerprints)
+               or fingerprints[index] != previous_fingerprints[index]]
+    ranges = []
+    for index in changed:
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return [tuple(r) for r in ranges]
+
+
+def worksheet_value_ranges(worksheet, df, row=1, col=1, snapshot=None):
+    """
+    Diffs the dataframe against the snapshot of the last write and returns the ranges to be written.
+    Without a usable snapshot, e.g. the worksheet or its columns changed since, the whole dataframe is written.
+
+    Args:
+        worksheet (gspread.Worksheet)
+        df (pd.DataFrame)
+        row, col (int): top left cell of the headers
+        snapshot (dict): load_snapshot of the worksheet
+
+    Returns:
+        value_ranges (list): ValueRange dicts of values.batchUpdate
+        snapshot (dict): snapshot to save once written
+        required_size (tuple): rows & cols the worksheet needs
+    """
+    values = dataframe_to_values(df)
+    fingerprints = [row_fingerprint(values_row) for values_row in values]
+    n_cols = len(df.columns)
+
+    usable = (snapshot is not None
+              and snapshot['row'] == row and snapshot['col'] == col
+              and snapshot['n_cols'] == n_cols
+              and snapshot['grid'] == [worksheet.row_count, worksheet.col_count])
+    previous_fingerprints = snapshot['fingerprints'] if usable else []
+    if not usable:
+        logger.info("\tNo usable snapshot, writing all rows")
+
+    title = worksheet.title.replace("'", "''")
+    value_ranges = []
+    for start, end in changed_row_ranges(fingerprints, previous_fingerprints):
+        # rows that no longer exist are blanked
+        rows = values[start:end + 1] + [[''] * n_cols] * max(0, end + 1 - max(start, len(values)))
+        value_ranges.append({
+            'range': f"'{title}'!{rowcol_to_a1(row + start, col)}:{rowcol_to_a1(row + end, col + n_cols - 1)}",
+            'values': rows
+        })
+
+    required_size = (max(worksheet.row_count, row + len(values) - 1), max(worksheet.col_count, col + n_cols - 1))
+    snapshot = {'row': row, 'col': col, 'n_cols': n_cols, 'grid': list(required_size), 'fingerprints': fingerprints}
+    return value_ranges, snapshot, required_size
+
+
+def query_data_source(worksheet_name, account):
+    """Runs the worksheet's query for the account"""
+    logger.info(f"\tGetting {account} {worksheet_name} data from database...")
+    tenant_id = str(tenants[account])
+    query = worksheet_queries[worksheet_name]
+    # tenant_id = f"({', '.join(repr(v) for v in tenant_id)},)" # makes sure it ends with trailing comma
+    # query = query % tenant_id
+    return postgresql.copy_to_dataframe(query.replace('%s', tenant_id), decimals=True)
+
+
+def open_data_sources(gc, url, executor, worksheets='All', account='Bare Barrel'):
+    """
+    Opens the Google Sheet and starts the queries of its worksheets in `executor`,
+    so they run while other spreadsheets are uploading.
+
+    Returns
+        sheet (gspread.Spreadsheet)
+        frames (dict): {worksheet (gspread.Worksheet): Future of the worksheet's dataframe}
+    """
+    logger.info(f"Opening URL {url}")
+    sheet = gc.open_by_url(url)
+    logger.info(sheet)
+
+    # Gets worksheets to be updated with a single metadata request
+    sheet_worksheets = {worksheet.title: worksheet for worksheet in sheet.worksheets()}
+    if worksheets == 'All':
+        worksheet_names = [title for title in sheet_worksheets if title in worksheet_queries]
+    elif isinstance(worksheets, str):
+        worksheet_names = [worksheets]
+    elif isinstance(worksheets, list):
+        worksheet_names = worksheets
+
+    frames = {}
+    for worksheet_name in worksheet_names:
+        if worksheet_name not in sheet_worksheets:
+            raise gspread.exceptions.WorksheetNotFound(worksheet_name)
+        frames[sheet_worksheets[worksheet_name]] = executor.submit(query_data_source, worksheet_name, account)
+    return sheet, frames
+
+
+def write_data_sources(sheet, frames, incremental=True):
+    """
+    Writes the worksheets' dataframes with one grid-resize batchUpdate, if any worksheet needs to grow,
+    and one values.batchUpdate for the whole spreadsheet.
+    Snapshots are only trusted while the spreadsheet's Drive modifiedTime is still the one
+    recorded after our last write.
+
+    Args
+        sheet (gspread.Spreadsheet)
+        frames (dict): {worksheet: dataframe or Future of it}
+        incremental (bool): False rewrites every row
+    """
+    invalidate_stale_snapshots(sheet)
+
+    data, resize_requests, snapshots = [], [], []
+    for worksheet, df in frames.items():
+        if isinstance(df, Future):
+            df = df.result()
+        row, col = google_sheets_custom_row_col.get(worksheet.title, [1, 1])
+        snapshot = load_snapshot(sheet, worksheet) if incremental else None
+        value_ranges, snapshot, (rows, cols) = worksheet_value_ranges(worksheet, df, row, col, snapshot)
+        logger.info(f"\t{worksheet.title}: {sum(len(value_range['values']) for value_range in value_ranges)} rows "
+                    f"in {len(value_ranges)} ranges to write")
+        if not value_ranges:
+            continue
+
+        if (rows, cols) != (worksheet.row_count, worksheet.col_count):
+            resize_requests.append({'updateSheetProperties': {
+                'properties': {'sheetId': worksheet.id, 'gridProperties': {'rowCount': rows, 'columnCount': cols}},
+                'fields': 'gridProperties(rowCount,columnCount)'
+            }})
+        data.extend(value_ranges)
+        snapshots.append((worksheet, snapshot))
+
+    if not data:
+        logger.info('\tNo changes')
+        return
+
+    if resize_requests:
+        sheet.batch_update({'requests': resize_requests})
+    sheet.values_batch_update({'valueInputOption': 'USER_ENTERED', 'data': data})
+    for worksheet, snapshot in snapshots:
+        save_snapshot(sheet, worksheet, snapshot)
+    save_modified_time(sheet)
+    logger.info(f"\tSuccess! Updated {len(snapshots)} worksheets of {sheet.title}")
+
+
+def batch_update_data_sources(url, worksheets='All', account='Bare Barrel', incremental=True, max_workers=4):
     '''
     Updates google sheets data sources by specifying url.
     It automatically detects worksheets to be updated by checking the sheet name in the `worksheet_queries`.
+    Incremental updates only write the rows that changed since the last update, see `worksheet_value_ranges`.
+    The worksheets' queries run concurrently and all of them are written in a single request.
 
     #IMPORTANT#!
     It requires to have a Google project in the Google Cloud Platform and share the sheet to the google bot as an editor.
@@ -59,64 +309,78 @@ def batch_update_data_sources(url, worksheets='All', account='Bare Barrel'):
     Args
         url (str): url of the Google Sheet
         sheets (str, list): Worksheets to be updated
+        incremental (bool): False rewrites every row
+        max_workers (int): concurrent queries
     Returns
         None
     '''
-    logger.info("Authorizing Google Sheets")
-    gc = gspread.authorize(credentials)
+    # brings the summary tables read by the queries up to date
+    worksheet_summaries.refresh_worksheets(list(worksheet_queries) if worksheets == 'All'
+                                           else [worksheets] if isinstance(worksheets, str) else worksheets)
 
-    # Open Google Sheet
-    logger.info(f"Opening URL {url}")
-    sheet = gc.open_by_url(url)
-    logger.info(sheet)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        sheet, frames = open_data_sources(get_client(), url, executor, worksheets, account)
+        write_data_sources(sheet, frames, incremental)
 
-    # Gets worksheet names to be updated
-    if worksheets == 'All':
-        worksheet_names = [worksheet.title for worksheet in sheet.worksheets() if worksheet.title in worksheet_queries]
-    elif isinstance(worksheets, str):
-        worksheet_names = [worksheets]
-    elif isinstance(worksheets, list):
-        worksheet_names = worksheets
 
-    # Batch Update Google Sheet
-    for worksheet_name in worksheet_names:
-        try:
-            logger.info(f"\nOpening {account} worksheet {worksheet_name}")
-            worksheet = sheet.worksheet(worksheet_name)
+def export_data_sources(accounts=None, incremental=True, query_workers=4, upload_workers=2):
+    """
+    Updates every spreadsheet of `google_sheet_data_sources` as a pipeline: all spreadsheets are opened
+    and their queries started up front, then each spreadsheet is written as soon as its queries finish.
+    `upload_workers` bounds the spreadsheets written at once, keeping within the Sheets API write quota
+    (each spreadsheet makes at most 2 write requests).
 
-            logger.info("\tGetting data from database...")
-            tenant_id = str(tenants[account])
-            query = worksheet_queries[worksheet_name]
-            # tenant_id = f"({', '.join(repr(v) for v in tenant_id)},)" # makes sure it ends with trailing comma
-            # query = query % tenant_id
-            df = postgresql.sql_to_dataframe(query.replace('%s', tenant_id))
+    Args
+        accounts (list): tenants to be exported, all by default
+        incremental (bool): False rewrites every row
+        query_workers (int): concurrent database queries
+        upload_workers (int): concurrent spreadsheet uploads
 
+    Raises
+        Exception: after every other spreadsheet is exported, if any of them failed
+    """
+    gc = get_client()
+    spreadsheets = [(account, url) for account in (accounts or tenants.keys())
+                    for url in google_sheet_data_sources[account].values()]
+    start = time.monotonic()
 
+    # brings the summary tables read by the queries up to date, once for every spreadsheet
+    worksheet_summaries.refresh_worksheets(list(worksheet_queries))
 
-            logger.info('\tUpdating worksheet data...')
-            if worksheet_name in google_sheets_custom_row_col:
-                set_with_dataframe(worksheet, df, 
-                                   row=google_sheets_custom_row_col[worksheet_name][0], 
-                                   col=google_sheets_custom_row_col[worksheet_name][1])
-            else:
-                set_with_dataframe(worksheet, df)
+    with ThreadPoolExecutor(max_workers=query_workers) as query_executor, \
+         ThreadPoolExecutor(max_workers=upload_workers) as upload_executor:
 
-            logger.info('\tSuccess!')
-            time.sleep(2.5)
+        def export_spreadsheet(sheet, frames):
+            write_data_sources(sheet, frames, incremental)
+            logger.info(f"{sheet.title} exported in {time.monotonic() - start:.1f}s")
 
+        # opening a spreadsheet starts its queries
+        opening = {upload_executor.submit(open_data_sources, gc, url, query_executor, account=account): url
+                   for account, url in spreadsheets}
 
-        except Exception as e:
-            logger.error(e)
-            raise e
-        
+        errors, futures = [], {}
+        for future in as_completed(opening):
+            try:
+                sheet, frames = future.result()
+            except Exception as e:
+                logger.error(f"{opening[future]} failed to open: {e}")
+                errors.append(e)
+                continue
+            futures[upload_executor.submit(export_spreadsheet, sheet, frames)] = sheet.title
 
-if __name__ == '__main__':
-    # batch_update_data_sources(google_sheet_data_sources['Rymora']['[Supply C.][SC][Rymora] WW Data Sources'], 'FBA-Inv')
-    
-    for account in tenants.keys():
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"{futures[future]} failed: {e}")
+                errors.append(e)
+
+    logger.info(f"Exported {len(spreadsheets) - len(errors)}/{len(spreadsheets)} spreadsheets in {time.monotonic() - start:.1f}s")
+    if errors:
+        raise errors[0]
 
-        for google_sheet in google_sheet_data_sources[account]:
 
-            sheet_url = google_sheet_data_sources[account][google_sheet]
+if __name__ == '__main__':
+    # batch_update_data_sources(google_sheet_data_sources['Rymora']['[Supply C.][SC][Rymora] WW Data Sources'], 'FBA-Inv')
 
-            batch_update_data_sources(sheet_url, account=account)
\ No newline at end of file
+    export_data_sources()
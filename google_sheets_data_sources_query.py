@@ -41,34 +41,29 @@ worksheet_queries = {
                 where tenant_id = %s
                 order by date asc, marketplace asc, parent_asin;''',
 
+    # SP-* read the summaries of worksheet_summaries, refreshed before each export
     'SP-US': '''-- API data source. (04-02-2023 to present)
                 select
                     t1.date,
                     t1.marketplace,
-                    t3.name portfolio_name,
+                    t2.name portfolio_name,
                     case
-                        when t3.name like '%-%' then split_part(t3.name, '-', 1)
+                        when t2.name like '%-%' then split_part(t2.name, '-', 1)
                     else null
                     end as product_code,
-                    t1.campaign_budget_currency_code currency,
-                    sum(t1.cost) total_cost,
-                    sum(t1.units_sold_clicks_7d) total_units_sold_clicks_7d,
-                    sum(t1.clicks) total_clicks,
-                    sum(t1.impressions) total_impressions,
+                    t1.currency,
+                    sum(t1.total_cost) total_cost,
+                    sum(t1.total_units_sold_clicks_7d) total_units_sold_clicks_7d,
+                    sum(t1.total_clicks) total_clicks,
+                    sum(t1.total_impressions) total_impressions,
                     sum(t1.sales_7d) sales_7d
-                from sponsored_products.campaign t1
-                left join (select distinct on (campaign_id)
-                            campaign_id,
-                            portfolio_id
-                        from sponsored_products.targeting
-                        order by campaign_id, date desc) as t2
-                    on t1.campaign_id = t2.campaign_id
-                left join amazon_advertising_portfolios t3
-                    on t2.portfolio_id = t3.portfolio_id
+                from sponsored_products.portfolio_daily_summary t1
+                left join amazon_advertising_portfolios t2
+                    on t1.portfolio_id = t2.portfolio_id
                 where t1.marketplace = 'US'
                     and t1.tenant_id = %s
                 group by t1.marketplace, portfolio_name, t1.date, currency
-                having sum(t1.impressions) > 0
+                having sum(t1.total_impressions) > 0
 
                 UNION
 
@@ -82,41 +77,34 @@ worksheet_queries = {
                     else null
                     end as product_code,
                     currency,
-                    sum(spend) total_cost,
-                    sum("7_day_total_orders") total_units_sold_clicks_7d,
-                    sum(clicks) total_clicks,
-                    sum(impressions) total_impressions,
-                    sum("7_day_total_sales") sales_7d
-                from sponsored_products.campaign_console
+                    total_cost,
+                    total_units_sold_clicks_7d,
+                    total_clicks,
+                    total_impressions,
+                    sales_7d
+                from sponsored_products.console_portfolio_daily_summary
                 where marketplace = 'US' and date < '04-02-2023'
                     and tenant_id = %s
-                group by marketplace, portfolio_name, date, currency
                 order by date asc, marketplace desc, portfolio_name;''',
 
     'SP-CA': '''-- API data source
                 select
                     t1.date,
                     t1.marketplace,
-                    t3.name portfolio_name,
+                    t2.name portfolio_name,
                     case
-                        when t3.name like '%-%' then split_part(t3.name, '-', 1)
+                        when t2.name like '%-%' then split_part(t2.name, '-', 1)
                     else null
                     end as product_code,
-                    t1.campaign_budget_currency_code currency,
-                    sum(t1.cost) total_cost,
-                    sum(t1.units_sold_clicks_7d) total_units_sold_clicks_7d,
-                    sum(t1.clicks) total_clicks,
-                    sum(t1.impressions) total_impressions,
+                    t1.currency,
+                    sum(t1.total_cost) total_cost,
+                    sum(t1.total_units_sold_clicks_7d) total_units_sold_clicks_7d,
+                    sum(t1.total_clicks) total_clicks,
+                    sum(t1.total_impressions) total_impressions,
                     sum(t1.sales_7d) sales_7d
-                from sponsored_products.campaign t1
-                left join (select distinct on (campaign_id)
-                            campaign_id,
-                            portfolio_id
-                        from sponsored_products.targeting
-                        order by campaign_id, date desc) as t2
-                    on t1.campaign_id = t2.campaign_id
-                left join amazon_advertising_portfolios t3
-                    on t2.portfolio_id = t3.portfolio_id
+                from sponsored_products.portfolio_daily_summary t1
+                left join amazon_advertising_portfolios t2
+                    on t1.portfolio_id = t2.portfolio_id
                 where t1.marketplace = 'CA'
                     and t1.tenant_id = %s
                 group by t1.marketplace, portfolio_name, t1.date, currency;''',
@@ -125,26 +113,20 @@ worksheet_queries = {
                 select
                     t1.date,
                     t1.marketplace,
-                    t3.name portfolio_name,
+                    t2.name portfolio_name,
                     case
-                        when t3.name like '%-%' then split_part(t3.name, '-', 1)
+                        when t2.name like '%-%' then split_part(t2.name, '-', 1)
                     else null
                     end as product_code,
-                    t1.campaign_budget_currency_code currency,
-                    sum(t1.cost) total_cost,
-                    sum(t1.units_sold_clicks_7d) total_units_sold_clicks_7d,
-                    sum(t1.clicks) total_clicks,
-                    sum(t1.impressions) total_impressions,
+                    t1.currency,
+                    sum(t1.total_cost) total_cost,
+                    sum(t1.total_units_sold_clicks_7d) total_units_sold_clicks_7d,
+                    sum(t1.total_clicks) total_clicks,
+                    sum(t1.total_impressions) total_impressions,
                     sum(t1.sales_7d) sales_7d
-                from sponsored_products.campaign t1
-                left join (select distinct on (campaign_id)
-                            campaign_id,
-                            portfolio_id
-                        from sponsored_products.targeting
-                        order by campaign_id, date desc) as t2
-                    on t1.campaign_id = t2.campaign_id
-                left join amazon_advertising_portfolios t3
-                    on t2.portfolio_id = t3.portfolio_id
+                from sponsored_products.portfolio_daily_summary t1
+                left join amazon_advertising_portfolios t2
+                    on t1.portfolio_id = t2.portfolio_id
                 where t1.marketplace = 'UK'
                     and t1.tenant_id = %s
                 group by t1.marketplace, portfolio_name, t1.date, currency;''',
@@ -1,5 +1,6 @@
 import os
 import postgresql2
+import watermarks
 import logging
 import logger_setup
 import pandas as pd
@@ -13,6 +14,7 @@ logger_setup.setup_logging(__file__)
 logger = logging.getLogger(__name__)
 
 table_name = 'rankings.h10_keyword_tracker'
+watermark_job = 'h10_keyword_tracker'
 
 
 def clean_data(file_path):
@@ -72,19 +74,24 @@ sync_with_rclone(google_drive_source, destination_folder, config_path='rclone.co
 stat_info = os.stat(destination_folder)
 
 # Convert epoch time to datetime
-modification_time = dt.datetime.fromtimestamp(stat_info.st_mtime)
-
-# Compares database last updated date to the metadata file created date
-query = f"""SELECT MAX(updated_at) 
-            FROM {table_name};"""
-
-max_updated_date = postgresql2.sql_to_dataframe(query)['max'][0]
-
-logger.info(f"Database's latest created date: {max_updated_date}")
+modification_time = dt.datetime.fromtimestamp(stat_info.st_mtime, tz=dt.timezone.utc)
+
+# Compares the modification time of the last loaded folder to the current one,
+# the first run compares with the table's last updated date
+watermark = watermarks.get_watermark(watermark_job)
+if watermark is None:
+    query = f"""SELECT MAX(updated_at) 
+                FROM {table_name};"""
+    watermark = postgresql2.sql_to_dataframe(query)['max'][0]
+    if watermark is not None and watermark.tzinfo is None:
+        watermark = watermark.astimezone(dt.timezone.utc)
+
+logger.info(f"Database's latest created date: {watermark}")
 logger.info(f"Metadata file's created date: {modification_time}")
 
-if max_updated_date < modification_time:
+if watermark is None or watermark < modification_time:
     logger.info("New data found in metadata file. Updating database...")
+    watermarks.start_run(watermark_job)
 
     # Update database
     for file in os.listdir(destination_folder):
@@ -93,6 +100,7 @@ if max_updated_date < modification_time:
             logger.info(f"\tUpdating database with file: {file}")
             update_data(filepath)
 
+    watermarks.advance(watermark_job, modification_time)
     logger.info("\tDatabase updated successfully!")
 
 else:
@@ -0,0 +1,1696 @@
+import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+import psycopg2.extensions
+import json
+import os
+import atexit
+import threading
+import pandas as pd
+import numpy as np
+import datetime as dt
+import re
+import io
+import csv
+import time
+import weakref
+import struct
+from decimal import Decimal
+from itertools import chain, repeat
+from functools import partial, lru_cache
+from collections.abc import Iterator
+import logging
+import logger_setup
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger_setup.setup_logging(__file__)
+logger = logging.getLogger(__name__)
+
+with open("config.json") as f:
+    config = json.load(f)
+
+# Connection pools by (process id, database name), so forked processes don't share connections
+connection_pools = {}
+connection_pools_lock = threading.Lock()
+
+
+def connection_string(dbname=config['postgres_db']):
+    return f"dbname={dbname} user={config['postgres_user']} host={config['postgres_host']} port={config['postgres_port']} password={config['postgres_password']}"
+
+
+def get_connection_pool(dbname=config['postgres_db']):
+    """
+    Gets or creates the process' ThreadedConnectionPool of a database.
+    Sizes are set by `postgres_pool_minconn` & `postgres_pool_maxconn` in config.json.
+    """
+    key = (os.getpid(), dbname)
+    with connection_pools_lock:
+        if key not in connection_pools:
+            connection_pools[key] = psycopg2.pool.ThreadedConnectionPool(
+                config.get('postgres_pool_minconn', 1), config.get('postgres_pool_maxconn', 10), connection_string(dbname)
+            )
+        return connection_pools[key]
+
+
+def checkout_connection(dbname=config['postgres_db']):
+    """
+    Gets a healthy connection from the database's pool.
+    Broken connections are discarded and replaced. If the pool is exhausted,
+    a new connection outside the pool is opened.
+
+    Returns:
+        conn, pool (None if the connection isn't pooled)
+    """
+    pool = get_connection_pool(dbname)
+    for _ in range(config.get('postgres_pool_maxconn', 10) + 1):
+        try:
+            conn = pool.getconn()
+        except psycopg2.pool.PoolError:
+            logger.warning(f"Connection pool of {dbname} exhausted, opening a connection outside the pool")
+            return psycopg2.connect(connection_string(dbname)), None
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return conn, pool
+        except psycopg2.Error:
+            logger.info("Discarding a broken pooled connection")
+            staging_tables.pop(conn, None)
+            pool.putconn(conn, close=True)
+
+    raise psycopg2.OperationalError(f"Couldn't get a healthy connection to {dbname}")
+
+
+def return_connection(conn, pool):
+    """
+    Returns a connection to its pool. Uncommitted transactions are rolled back.
+    Broken and unpooled connections are closed.
+    """
+    if pool is None or pool.closed:
+        conn.close()
+        return
+
+    close = bool(conn.closed)
+    if not close and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        # Rolled back temporary tables no longer exist
+        staging_tables.pop(conn, None)
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            close = True
+    if close:
+        staging_tables.pop(conn, None)
+    pool.putconn(conn, close=close)
+
+
+def close_connection_pools():
+    "Closes all connections of this process' pools"
+    with connection_pools_lock:
+        for (pid, dbname), pool in list(connection_pools.items()):
+            if pid == os.getpid():
+                pool.closeall()
+                del connection_pools[(pid, dbname)]
+
+
+atexit.register(close_connection_pools)
+
+
+class setup_cursor():
+    """
+    Sets up psycopg2 cursor by specifying database with the default configuration. 
+    The configuration file is found on the residing directory. 
+    Connections are borrowed from a pool and returned on exit or close().
+    
+    Args: 
+        autocommit (bool): Omits the conn.commit()
+        cursor_factory (psycopg2.extras.*): By default, it's psycopg2.extras.NamedTupleCursor
+    Returns:
+        conn [if autocommit is False], conn.cursor()
+    """
+    def __init__(self, dbname=config['postgres_db'], autocommit=True, cursor_factory=psycopg2.extras.RealDictCursor):
+        self.dbname = dbname
+        self.autocommit = autocommit
+        self.cursor_factory = cursor_factory
+        self.conn = None
+        self.cur = None
+        self.pool = None
+        self.config = config
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type:
+            # logger.info("An error occurred:", str(exc_val))
+            logger.info(f"An error occurred: {exc_val}")
+        self.close()
+
+    def connect(self, dbname=None):
+        if not dbname:
+            dbname = self.dbname
+        if self.conn:
+            self.close()
+        # Borrows a connection to the database
+        self.conn, self.pool = checkout_connection(dbname)
+        self.conn.set_session(autocommit=self.autocommit)
+        self.cur = self.conn.cursor(cursor_factory=self.cursor_factory)
+        if self.autocommit:
+            return self.cur
+        return self.conn, self.cur
+
+    def commit_transactions(self):
+        self.conn.commit()
+
+    def close(self):
+        # Closing cursor and returning connection
+        if self.cur:
+            if not self.cur.closed:
+                self.cur.close()
+            self.cur = None
+        if self.conn:
+            return_connection(self.conn, self.pool)
+            self.conn = None
+            self.pool = None
+
+
+def sql_to_dataframe(query, vars=None):
+   """
+   Import data from a PostgreSQL database using a SELECT query 
+   """
+   with setup_cursor(autocommit=True, cursor_factory=psycopg2.extras.NamedTupleCursor) as cur:
+        # The execute returns a list of tuples:
+        cur.execute(query, vars)
+        tuples_list = cur.fetchall()
+        column_names = [column[0] for column in cur.description]
+    
+        # Transforms the list into a pandas DataFrame:
+        df = pd.DataFrame(tuples_list, columns=column_names)
+        return df
+
+
+# Result column types decoded into pandas columns by type oid, other types keep psycopg2's python types
+integer_oids = (20, 21, 23)             # bigint, smallint, integer
+float_oids = (700, 701, 1700)           # real, double precision, numeric
+BOOLEAN_OID, DATE_OID, TIMESTAMP_OID, TIMESTAMPTZ_OID, NUMERIC_OID = 16, 1082, 1114, 1184, 1700
+text_oids = (25, 1042, 1043, 19)        # text, character, character varying, name
+
+
+def query_to_sql(cur, query, vars=None):
+    """Binds vars and removes the trailing semicolon, so the query can be nested"""
+    if vars is not None:
+        query = cur.mogrify(query, vars).decode('utf-8')
+    return query.strip().rstrip(';')
+
+
+def typecast_uniques(series, typecaster):
+    """Applies `typecaster` once per unique non-null value, nulls become None"""
+    codes, uniques = pd.factorize(series)
+    values = np.empty(len(uniques) + 1, dtype='object')
+    for i, value in enumerate(uniques):
+        values[i] = typecaster(value)
+    return values[codes]   # code -1 (null) takes the last, None
+
+
+def decode_date(value, cur=None):
+    """COPY text date to datetime.date, psycopg2 parses the ones outside ISO format, e.g. infinity"""
+    try:
+        return dt.date.fromisoformat(value)
+    except ValueError:
+        return psycopg2.extensions.DATE(value, cur)
+
+
+def session_timezone(cur):
+    """The connection's TimeZone setting, in which psycopg2 returns timestamptz values"""
+    return cur.connection.info.parameter_status('TimeZone') if cur is not None else None
+
+
+def decode_timestamps(series, oid, cur=None, text=False):
+    """
+    Timestamps to datetime64, timestamptz in the session's time zone like psycopg2 returns them.
+    Python datetimes like psycopg2 when any of them doesn't fit datetime64[ns]
+    (before 1677, after 2262, infinity) or the time zone isn't known to pandas, instead of NaT.
+    """
+    try:
+        timestamps = pd.to_datetime(series, format='ISO8601', utc=oid == TIMESTAMPTZ_OID)
+        timezone = session_timezone(cur)
+        if oid == TIMESTAMPTZ_OID and timezone:
+            timestamps = timestamps.dt.tz_convert(timezone)
+        return timestamps
+    except (ValueError, OverflowError, KeyError):
+        if not text:
+            return series
+        typecaster = psycopg2.extensions.PYDATETIMETZ if oid == TIMESTAMPTZ_OID else psycopg2.extensions.PYDATETIME
+        return typecast_uniques(series, lambda value: typecaster(value, cur))
+
+
+def decode_columns(data, type_oids, cur=None, text=False, decimals=False):
+    """
+    Casts result columns by their type oid: integers to Int64, numeric to float,
+    booleans to boolean, timestamps to datetime64 and dates to datetime.date like psycopg2.
+
+    Args:
+        data (pd.DataFrame): result columns
+        type_oids (list): type oid of each column, cursor.description[i].type_code
+        cur (cursor): its session time zone is applied to timestamptz,
+            and it's used by psycopg2's typecasters of the other types when text=True
+        text (bool): values are COPY text instead of python objects
+        decimals (bool): numeric as decimal.Decimal like psycopg2 instead of float
+    Returns:
+        data (pd.DataFrame)
+    """
+    for column, oid in zip(data.columns, type_oids):
+        series = data[column]
+        if oid == NUMERIC_OID and decimals:
+            # psycopg2 already returns Decimal, COPY text is parsed by its typecaster below
+            if text:
+                data[column] = typecast_uniques(series, lambda value: psycopg2.extensions.DECIMAL(value, cur))
+        elif oid in integer_oids:
+            # COPY text is already read as Int64
+            if not text:
+                data[column] = pd.to_numeric(series).astype('Int64')
+        elif oid in float_oids:
+            if not text:
+                data[column] = pd.to_numeric(series, errors='coerce').astype(float)
+        elif oid == BOOLEAN_OID:
+            data[column] = (series.map({'t': True, 'f': False}) if text else series).astype('boolean')
+        elif oid == DATE_OID and text:
+            data[column] = typecast_uniques(series, lambda value: decode_date(value, cur))
+        elif oid in (TIMESTAMP_OID, TIMESTAMPTZ_OID):
+            data[column] = decode_timestamps(series, oid, cur, text)
+        elif text and oid in text_oids:
+            data[column] = series.where(series.notna(), None)
+        elif text and oid in psycopg2.extensions.string_types:
+            # arrays, json, intervals... parsed like the text protocol, once per unique value
+            typecaster = psycopg2.extensions.string_types[oid]
+            if oid in (114, 3802) and orjson is not None:
+                # json, jsonb
+                typecaster = lambda value, cur: orjson.loads(value)
+            data[column] = typecast_uniques(series, lambda value: typecaster(value, cur))
+    return data
+
+
+def copy_to_dataframe(query, vars=None, decimals=False):
+    """
+    Fast way to import a query's results. Streams them with `COPY (query) TO STDOUT`
+    and decodes the csv straight into typed columns instead of a python object per row.
+
+    Args:
+        query (str): SELECT query
+        vars (tuple|dict): query parameters
+        decimals (bool): numeric as decimal.Decimal like sql_to_dataframe instead of float
+    Returns:
+        df (pd.DataFrame)
+    """
+    with setup_cursor() as cur:
+        sql = query_to_sql(cur, query, vars)
+        # Result column names & types, without running the query
+        cur.execute(f"SELECT * FROM (\n{sql}\n) AS query LIMIT 0;")
+        column_names = [column.name for column in cur.description]
+        type_oids = [column.type_code for column in cur.description]
+
+        csv_buffer = io.StringIO()
+        cur.copy_expert(f"COPY (\n{sql}\n) TO STDOUT WITH (FORMAT CSV, NULL '\\N')", csv_buffer)
+        csv_buffer.seek(0)
+
+        # Everything is read as text except numbers, nulls are \N
+        decoded_float_oids = [oid for oid in float_oids if not (decimals and oid == NUMERIC_OID)]
+        dtypes = {i: ('Int64' if oid in integer_oids else float if oid in decoded_float_oids else 'object')
+                  for i, oid in enumerate(type_oids)}
+        na_values = {i: ['\\N', 'NaN'] if oid in decoded_float_oids else ['\\N'] for i, oid in enumerate(type_oids)}
+        df = pd.read_csv(csv_buffer, header=None, names=range(len(column_names)), dtype=dtypes,
+                         keep_default_na=False, na_values=na_values, float_precision='round_trip')
+        df = decode_columns(df, type_oids, cur, text=True, decimals=decimals)
+        df.columns = column_names
+        return df
+
+
+def iter_sql_to_dataframe(query, vars=None, chunksize=100_000):
+    """
+    Imports a query's results in chunks with a named server-side cursor,
+    so they can be processed without holding everything in memory.
+
+    Args:
+        query (str): SELECT query
+        vars (tuple|dict): query parameters
+        chunksize (int): rows per chunk
+    Yields:
+        df (pd.DataFrame): typed like copy_to_dataframe
+    """
+    # Named cursors must run inside a transaction
+    with setup_cursor(autocommit=False, cursor_factory=None) as (conn, cur):
+        sql = query_to_sql(cur, query, vars)
+        with conn.cursor(name=f"iter_sql_to_dataframe_{id(cur)}") as server_cursor:
+            server_cursor.itersize = chunksize
+            server_cursor.execute(sql)
+            while True:
+                rows = server_cursor.fetchmany(chunksize)
+                if not rows:
+                    break
+                column_names = [column.name for column in server_cursor.description]
+                type_oids = [column.type_code for column in server_cursor.description]
+                df = pd.DataFrame.from_records(rows, columns=range(len(column_names)), coerce_float=True)
+                df = decode_columns(df, type_oids, cur)
+                df.columns = column_names
+                yield df
+        conn.rollback()
+
+
+# camel_to_snake & sql_standardize patterns, compiled once
+single_capital_number_re = re.compile(r'([A-Z][0-9][A-Z])')
+spaced_number_capital_re = re.compile(r' ([0-9]+[A-Z] )')
+consecutive_capitals_re = re.compile(r'([A-Z]{2,})')
+separated_capitals_re = re.compile(r'_[A-Z]{2,}')
+capital_boundary_re = re.compile(r'(?<!^)(?=[A-Z]+)')
+number_boundary_re = re.compile(r'(?<!^)(?<!\d)(?<!_[a-z])(?=\d+[a-z]*)')
+file_extension_re = re.compile(r'\..+')
+parenthesis_re = re.compile(r'\(.+\)')
+special_characters_re = re.compile(r'\W+')
+underscores_re = re.compile(r'_+')
+
+
+def convert_to_lower(match):
+    # avoids further getting regrex
+    return match.group(0).lower()
+
+
+@lru_cache(maxsize=4096)
+def camel_to_snake(name):
+    """Transform camelCase names to snake_case names"""
+    # separates single capital letters with number in the middle (e.g. B2B)
+    name = single_capital_number_re.sub(r'_\1_', name)
+    name = single_capital_number_re.sub(convert_to_lower, name)
+    # separates digit/s with a succeeding capital letter in between spaces (e.g. 'Cart Adds: 2D Shipping')
+    name = spaced_number_capital_re.sub(convert_to_lower, name)
+    # separates 2 or more consecutive capital letters (e.g. SKU, ASIN)
+    name = consecutive_capitals_re.sub(r'_\1_', name)
+    name = separated_capitals_re.sub(convert_to_lower, name)
+    # separates capital from small (e.g. salesSameDay)
+    name = capital_boundary_re.sub('_', name)
+    # separates numbers preceded by small letters (e.g. unitsSold14d)
+    name = number_boundary_re.sub(r'_',  name)
+    name = name.strip('_').replace('__', '_')
+    return name.lower()
+
+
+def is_camel_case(string):
+    # Check if the string contains uppercase letters and lowercase letters
+    if not any(c.isupper() for c in string) or not any(c.islower() for c in string):
+        return False
+    # Check if the string starts with a lowercase letter
+    if not string[0].islower():
+        return False
+    # Check if the string contains any whitespace or special characters
+    if re.search(r"\W", string):
+        return False
+    # Check if the string contains any underscores
+    if '_' in string:
+        return False
+    # Check if the string contains consecutive uppercase letters
+    if re.search(r"[A-Z]{2,}", string):
+        return False
+    return True
+
+
+@lru_cache(maxsize=4096)
+def sql_standardize(name, remove_parenthesis=True, remove_file_extension=False):
+    """Standardizes column & table names according to SQL naming convention.
+    Automatically detects if camelCase is used.
+    Column & table names that starts with a numeric character will always
+    enclose it with quotes. For example, 14_day_sales would be "14_day_sales".
+    Explanation for the parser limitation here: https://stackoverflow.com/questions/15917064/table-or-column-name-cannot-start-with-numeric
+    Results are memoized, the same few hundred names are standardized for every chunk.
+
+    Args:
+        name (str): column / table name
+        remove_parenthesis (bool): removes parenthesis and inside of it
+
+    Returns: 
+        name (str): cleaned name
+    """
+    # Remove file extension
+    if remove_file_extension:
+        name = file_extension_re.sub('', name)
+    # Remove parenthesis and inside of it
+    if remove_parenthesis:
+        name = parenthesis_re.sub('', name)
+    # # Checks if camelCased
+    # if is_camel_case(name):
+    #     return camel_to_snake(name)
+    name = camel_to_snake(name)
+    # Convert to lowercase
+    name = name.lower()
+    # Replace special characters with underscores
+    name = special_characters_re.sub('_', name)
+    # Remove leading and trailing underscores
+    name = name.strip('_')
+    # Replace consecutive underscores with a single underscore
+    name = underscores_re.sub('_', name)
+    # Encloses with parenthesis
+    if name[0].isdigit():
+        name = f'"{name}"'
+    return name
+
+
+def standardize_columns(columns, remove_parenthesis=True):
+    """sql_standardize of every column name, e.g. data.columns = standardize_columns(data.columns)"""
+    return [sql_standardize(column, remove_parenthesis) for column in columns]
+
+
+def create_table(cur, file_path, file_extension='auto', table_name='filename', created_at=True, updated_at=True, keys=None):
+    """
+    Reads an excel, csv or json file, then normalizes table columns with generic data types
+    IMPORTANT: Need to specify file_extension file_extension for io.StringIO files.
+    """
+    # Reads file
+    pd_read_file = {
+        'csv': pd.read_csv, 'xls': pd.read_excel, 'xlsx': pd.read_excel, 
+        'json': pd.read_json, 'json_normalize': partial(pd.json_normalize, sep='_'),
+        'pandas': pd.DataFrame
+    }
+
+    if file_extension == 'auto':
+        if '.' in file_path:
+            file_extension = file_path.split('.')[1]
+
+        elif isinstance(file_path, pd.DataFrame):
+            file_extension == 'pandas'
+
+    data = pd_read_file[file_extension](file_path)
+
+    if data.empty:
+        logger.info("The Dataframe is empty.\n\tCancelling table creation. . .")
+        return
+
+    # Create the SQL CREATE TABLE statement
+    if table_name == 'filename':
+        base_filename = os.path.basename(file_path)
+        table_name = sql_standardize(base_filename, remove_file_extension=True)
+    create_table_sql = f"CREATE TABLE {table_name} ("
+
+    # Iterate through each column, cleans & identifies data type
+    for column_name in data.columns:
+        # Transforms date columns
+        if 'date' in column_name.lower():
+            contains_list = data[column_name].apply(lambda x: isinstance(x, list)).any()
+            if not contains_list: # Lists causes error in pd.to_datetime
+                data[column_name] = pd.to_datetime(data[column_name], errors='ignore')
+        else:
+        # Transforms objects to numeric, if 
+            contains_list = data[column_name].apply(lambda x: isinstance(x, list)).any()
+            if not contains_list: # Lists causes error in pd.to_numeric
+                data[column_name] = pd.to_numeric(data[column_name], errors='ignore')
+
+        standardized_column_name = sql_standardize(column_name)
+        data_type = str(data[column_name].dtype)
+
+        # Map pandas data types to generic PostgreSQL data types
+        not_null_col_values = data.loc[data[column_name].notnull(), column_name]
+        if 'int' in data_type:
+            data_type = 'integer'
+            int_bytes = int(data[column_name].fillna(0).max()).bit_length() / 8
+            if int_bytes > 4:
+                data_type = 'bigint'
+
+        elif 'float' in data_type:
+            data_type = 'numeric'
+
+        elif 'datetime' in data_type:
+            # identifies if datetime col has time and time zone
+            has_time = ~(not_null_col_values.dt.time == pd.to_datetime('00:00:00').time()).all()
+            data_type = 'date'
+            if has_time:
+                data_type = 'timestamp'
+                # check for time zone
+                has_time_zone = not_null_col_values.dt.tz
+                if has_time_zone:
+                    data_type = 'timestamp with time zone'
+
+        elif 'bool' in data_type:
+            data_type = 'boolean'
+
+        # jsonb / dict columns
+        elif not_null_col_values.transform(lambda x: x.apply(type).eq(dict)).all():
+            data_type = 'jsonb'
+
+        # Array / list
+        elif not_null_col_values.transform(lambda x: x.apply(type).eq(list)).all():
+            # filters out empty lists
+            not_null_col_values = not_null_col_values[not_null_col_values.apply(lambda x: len(x) > 0)]
+
+            # unknown cols that contains only empty lists are converted into jsonb
+            if not_null_col_values.shape[0] == 0:
+                data_type = 'jsonb'
+            elif type(not_null_col_values.values[0][0]) == str:
+                data_type = 'text[]'
+            elif type(not_null_col_values.values[0][0]) == int:
+                data_type = 'integer[]'
+            elif type(not_null_col_values.values[0][0]) == dict:
+                data_type = 'jsonb'
+            
+        else:
+            data_type = 'text'
+    
+        # Add the column and its data type to the CREATE TABLE statement
+        create_table_sql += f"{standardized_column_name} {data_type}, "
+
+    # Add created_at and updated_at to query
+    if created_at:
+        create_table_sql += "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+    if updated_at:
+        create_table_sql += "updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+
+    # Add primary and foreign key constraints
+    if keys:
+        create_table_sql += '\n' + keys + ', '
+
+    # Remove trailing comma and space and enclose it
+    create_table_sql = create_table_sql[:-2]
+    create_table_sql += ")"
+
+    # Complete the CREATE TABLE statement
+    create_table_sql += ";"
+    logger.info(create_table_sql)
+    # Execute the CREATE TABLE statement
+    cur.execute(create_table_sql)
+    invalidate_table_metadata(table_name)
+
+
+def create_updated_at_triggers(cur):
+    "Create a trigger function to update the 'updated_at' column"
+    cur.execute("""CREATE OR REPLACE FUNCTION update_updated_at()
+                    RETURNS TRIGGER AS $$
+                    BEGIN
+                        NEW.updated_at = CURRENT_TIMESTAMP;
+                        RETURN NEW;
+                    END;
+                    $$ LANGUAGE plpgsql;""")
+
+
+def update_updated_at_trigger(cur, table_names=[]):
+    """The CREATE TRIGGER statement creates a trigger named 
+    update_updated_at_trigger that fires before an update operation on 
+    the table. It executes the update_updated_at() trigger function for 
+    each row being updated, which sets the updated_at column to the current date and time."""
+    if isinstance(table_names, str):
+        table_names = [table_names]
+    table_names = " ".join(table_names)
+    cur.execute(f"""CREATE TRIGGER update_updated_at_trigger
+                    BEFORE UPDATE ON {table_names}
+                    FOR EACH ROW
+                    EXECUTE FUNCTION update_updated_at();""")
+
+
+# PostgreSQL binary COPY format: https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+BINARY_COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+BINARY_COPY_TRAILER = struct.pack('!h', -1)
+NULL_FIELD = struct.pack('!i', -1)
+PG_EPOCH_DAYS = 10957   # days between 1970-01-01 and 2000-01-01
+PG_EPOCH_MICROSECONDS = PG_EPOCH_DAYS * 86400 * 1000000
+# string representations of nulls after casting to str, same as the csv path
+NULL_STRINGS = {'', 'None', 'nan', 'NaN'}
+
+fixed_width_binary_types = {
+    'smallint': '>i2',
+    'integer': '>i4',
+    'bigint': '>i8',
+    'real': '>f4',
+    'double precision': '>f8',
+    'boolean': '?',
+}
+text_binary_types = ('text', 'character varying', 'character', 'json')
+# numeric structs by number of base-10000 digits
+numeric_structs = {}
+# element type oids of supported array udt_names
+array_element_oids = {
+    '_text': (25, None),
+    '_varchar': (1043, None),
+    '_bpchar': (1042, None),
+    '_int2': (21, 'h'),
+    '_int4': (23, 'i'),
+    '_int8': (20, 'q'),
+}
+
+
+def pack_fixed_width(values, nulls, dtype):
+    """Packs a numpy array into length-prefixed binary fields of the same width"""
+    width = np.dtype(dtype).itemsize
+    if np.dtype(dtype).kind == 'i' and values.size:
+        limits = np.iinfo(dtype)
+        checked_values = values[~nulls]
+        if checked_values.size and (checked_values.min() < limits.min or checked_values.max() > limits.max):
+            raise OverflowError(f"Values out of range for {dtype}")
+
+    fields = np.empty(len(values), dtype=[('length', '>i4'), ('value', dtype)])
+    fields['length'] = width
+    fields['value'] = values
+    raw = fields.tobytes()
+    step = width + 4
+    packed = [raw[i:i + step] for i in range(0, len(raw), step)]
+    for i in np.flatnonzero(nulls):
+        packed[i] = NULL_FIELD
+    return packed
+
+
+def pack_factorized(values, nulls, pack):
+    """Packs only the unique values of a column, since dimensions & metrics repeat a lot"""
+    codes, uniques = pd.factorize(values)
+    # code -1 of missing values picks the last item
+    packed_uniques = [pack(value) for value in uniques.tolist()] + [NULL_FIELD]
+    packed = [packed_uniques[code] for code in codes.tolist()]
+    for i in np.flatnonzero(nulls):
+        packed[i] = NULL_FIELD
+    return packed
+
+
+def pack_text(value, prefix=b''):
+    encoded = prefix + value.encode('utf-8')
+    return struct.pack('!i', len(encoded)) + encoded
+
+
+def pack_numeric(value):
+    """Packs a float into PostgreSQL's base-10000 binary numeric, keeping the digits of its repr"""
+    if value != value:
+        return struct.pack('!ihhHH', 8, 0, 0, 0xC000, 0)
+    if value == float('inf') or value == float('-inf'):
+        return struct.pack('!ihhHH', 8, 0, 0, 0xD000 if value > 0 else 0xF000, 0)
+
+    text = repr(value)
+    if 'e' in text:
+        # scientific notation, e.g. 1e-07
+        text = format(Decimal(text), 'f')
+    negative = text[0] == '-'
+    integer, _, fraction = text.lstrip('-').partition('.')
+    dscale = len(fraction)
+
+    # base-10000 digits, the fraction is padded to whole groups of 4
+    padding = -dscale % 4
+    number = int(integer + fraction) * 10 ** padding
+    groups = []
+    while number:
+        number, group = divmod(number, 10000)
+        groups.append(group)
+    weight = len(groups) - (dscale + padding) // 4 - 1
+    groups.reverse()
+
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        weight, negative = 0, False
+
+    if len(groups) not in numeric_structs:
+        numeric_structs[len(groups)] = struct.Struct(f'!ihhHH{len(groups)}H')
+    return numeric_structs[len(groups)].pack(8 + 2 * len(groups), len(groups), weight,
+                                             0x4000 if negative else 0, dscale, *groups)
+
+
+def pack_array(values, element_oid, element_format):
+    """
+    Packs a one-dimensional list into a binary array.
+    Nulls become empty arrays like the csv path.
+    element_format is the struct format of integer elements, None for text elements.
+    """
+    if values is None or not hasattr(values, '__len__') or len(values) == 0:
+        return struct.pack('!iiii', 12, 0, 0, element_oid)
+
+    has_null = 0
+    elements = []
+    for element in values:
+        if element is None:
+            has_null = 1
+            elements.append(NULL_FIELD)
+        elif element_format is None:
+            elements.append(pack_text(str(element)))
+        else:
+            elements.append(struct.pack(f'!i{element_format}', struct.calcsize(element_format), element))
+
+    payload = struct.pack('!iiiii', 1, has_null, element_oid, len(elements), 1) + b''.join(elements)
+    return struct.pack('!i', len(payload)) + payload
+
+
+def pack_column(series, postgresql_data_type, udt_name):
+    """
+    Encodes an already casted column to a list of binary COPY fields.
+
+    Args:
+        series (pd.Series): column casted by upsert_bulk
+        postgresql_data_type (str): information_schema.columns.data_type
+        udt_name (str): information_schema.columns.udt_name, used for array element types
+    Returns:
+        list of bytes
+    """
+    nulls = series.isna().to_numpy()
+
+    if postgresql_data_type in ('smallint', 'integer', 'bigint'):
+        values = series.to_numpy(dtype='int64', na_value=0)
+        return pack_fixed_width(values, nulls, fixed_width_binary_types[postgresql_data_type])
+
+    if postgresql_data_type in ('real', 'double precision'):
+        values = series.to_numpy(dtype=float, na_value=0.0)
+        return pack_fixed_width(values, nulls, fixed_width_binary_types[postgresql_data_type])
+
+    if postgresql_data_type == 'boolean':
+        values = series.to_numpy(dtype=bool, na_value=False)
+        return pack_fixed_width(values, nulls, fixed_width_binary_types[postgresql_data_type])
+
+    if postgresql_data_type == 'numeric':
+        return pack_factorized(series.to_numpy(dtype=float, na_value=np.nan), nulls, pack_numeric)
+
+    if postgresql_data_type in ('date', 'timestamp', 'timestamp without time zone', 'timestamp with time zone'):
+        if isinstance(series.dtype, pd.DatetimeTZDtype):
+            # time zone aware values are converted to UTC like the cast plan does for every timestamp type
+            series = series.dt.tz_convert('UTC').dt.tz_localize(None)
+        if postgresql_data_type == 'date':
+            values = np.where(nulls, 0, series.to_numpy(dtype='datetime64[D]').astype('int64') - PG_EPOCH_DAYS)
+            return pack_fixed_width(values, nulls, '>i4')
+        values = np.where(nulls, 0, series.to_numpy(dtype='datetime64[us]').astype('int64') - PG_EPOCH_MICROSECONDS)
+        return pack_fixed_width(values, nulls, '>i8')
+
+    if postgresql_data_type == 'jsonb' or postgresql_data_type in text_binary_types:
+        # jsonb binary format version 1 is the json text
+        prefix = b'\x01' if postgresql_data_type == 'jsonb' else b''
+        return pack_factorized(
+            series.astype(str).to_numpy(), nulls,
+            lambda value: NULL_FIELD if value in NULL_STRINGS else pack_text(value, prefix)
+        )
+
+    if postgresql_data_type == 'ARRAY' and udt_name in array_element_oids:
+        element_oid, element_format = array_element_oids[udt_name]
+        return [pack_array(values, element_oid, element_format) for values in series]
+
+    raise ValueError(f"{postgresql_data_type} ({udt_name}) is not supported by binary COPY. Use a csv serializer")
+
+
+def to_binary_copy(data, column_types):
+    """
+    Serializes a dataframe to PostgreSQL's binary COPY format.
+
+    Args:
+        data (pd.DataFrame): casted dataframe ordered by the table's ordinal position
+        column_types (list): [(postgresql_data_type, udt_name)] for each column of data
+    Returns:
+        io.BytesIO
+    """
+    packed_columns = [pack_column(data[column], postgresql_data_type, udt_name)
+                      for column, (postgresql_data_type, udt_name) in zip(data.columns, column_types)]
+    tuple_header = struct.pack('!h', len(packed_columns))
+
+    binary_buffer = io.BytesIO()
+    binary_buffer.write(BINARY_COPY_HEADER)
+    binary_buffer.write(b''.join(chain.from_iterable(zip(repeat(tuple_header), *packed_columns))))
+    binary_buffer.write(BINARY_COPY_TRAILER)
+    binary_buffer.seek(0)
+    return binary_buffer
+
+
+def to_csv_copy(data):
+    """
+    Serializes a dataframe to a csv buffer for COPY.
+    Null values should already be replaced with empty strings.
+
+    Returns:
+        io.StringIO
+    """
+    # Create an in-memory CSV
+    csv_buffer = io.StringIO()
+
+    # transforms csv/excel to tab delimited file
+    data.to_csv(csv_buffer, index=False, header=False, quoting=csv.QUOTE_NONNUMERIC)
+
+    # removes nulls=""
+    csv_buffer.seek(0)
+    lines = csv_buffer.readlines()
+    new_lines = [line.replace(',""', ',') for line in lines]
+    csv_buffer.close()
+    csv_buffer = io.StringIO()
+    csv_buffer.writelines(new_lines)
+    csv_buffer.seek(0)
+    return csv_buffer
+
+
+def to_minimal_csv_copy(data):
+    """
+    Serializes a dataframe to a csv buffer for COPY, only quoting fields with special characters.
+    Null values should already be replaced with empty strings.
+
+    Returns:
+        io.StringIO
+    """
+    csv_buffer = io.StringIO()
+    data.to_csv(csv_buffer, index=False, header=False, quoting=csv.QUOTE_MINIMAL, na_rep='')
+    csv_buffer.seek(0)
+    return csv_buffer
+
+
+def replace_nulls(data):
+    """Replaces null values & their string representations with empty strings, the csv null"""
+    non_int_columns = [col for col, dtype in data.dtypes.items() if dtype != 'Int64']
+    data[non_int_columns] = data[non_int_columns].replace(['None', 'nan', 'NaN', np.nan], ['', '', '', ''])
+    return data
+
+
+# upsert_bulk serialization strategies
+#   prepare: null handling before removing duplicates, serialize: (data, column_types) to a COPY buffer
+#   copy_options: of COPY FROM STDIN, array_literals: casts lists to array literals
+serializers = {
+    'legacy_csv': {
+        'prepare': replace_nulls,
+        'serialize': lambda data, column_types: to_csv_copy(data),
+        'copy_options': "FORMAT CSV, DELIMITER ',', QUOTE '\"'",
+        'array_literals': True,
+    },
+    'minimal_csv': {
+        'prepare': replace_nulls,
+        'serialize': lambda data, column_types: to_minimal_csv_copy(data),
+        'copy_options': "FORMAT CSV, DELIMITER ',', QUOTE '\"', NULL ''",
+        'array_literals': True,
+    },
+    'binary': {
+        'prepare': lambda data: data,
+        'serialize': to_binary_copy,
+        'copy_options': "FORMAT BINARY",
+        'array_literals': False,
+    },
+}
+
+
+def drop_duplicate_rows(data, list_columns=(), subset=None, keep='first'):
+    """
+    Removes duplicated rows, on all columns or only on the `subset` (e.g. primary key) columns.
+    Lists are compared as tuples since they aren't hashable.
+    """
+    columns = subset or list(data.columns)
+    list_columns = [col for col in list_columns if col in columns]
+    if not list_columns:
+        return data.drop_duplicates(subset=subset, keep=keep)
+    hashable_data = data[columns].assign(**{col: data[col].map(tuple, na_action='ignore') for col in list_columns})
+    return data[~hashable_data.duplicated(keep=keep)]
+
+
+# Table metadata cache by `schema.table`, refreshed after `table_metadata_ttl` seconds
+table_metadata_cache = {}
+TABLE_METADATA_TTL = config.get('table_metadata_ttl', 600)
+# Temporary staging tables created per connection: {conn: {temp_table_name: columns}}
+staging_tables = weakref.WeakKeyDictionary()
+
+
+def get_table_metadata(cur, table_name):
+    """
+    Gets the columns, data types, generated columns and primary key of a table.
+    It's cached per process and refreshed after TABLE_METADATA_TTL seconds.
+
+    Args:
+        cur (psycopg2.extras.RealDictCursor)
+        table_name (str): schema.table
+    Returns:
+        metadata (dict): {'columns': [{column_name, data_type, udt_name, is_generated}],
+                          'primary_key': constraint name or None, 'primary_key_columns': [],
+                          'fetched_at': time.monotonic()}
+    """
+    metadata = table_metadata_cache.get(table_name)
+    if metadata and time.monotonic() - metadata['fetched_at'] < TABLE_METADATA_TTL:
+        return metadata
+
+    # Extracts table's schema (column names & data type)
+    cur.execute("""SELECT column_name, data_type, udt_name, is_generated FROM information_schema.columns
+                    WHERE table_schema || '.' || table_name = %s
+                    ORDER BY ordinal_position;""", (table_name,))
+    columns = [dict(row) for row in cur.fetchall()]
+
+    # Primary key constraint name and its columns
+    cur.execute("""SELECT tc.constraint_name, kcu.column_name
+                    FROM information_schema.table_constraints tc
+                    JOIN information_schema.key_column_usage kcu
+                        ON kcu.constraint_schema = tc.constraint_schema
+                        AND kcu.constraint_name = tc.constraint_name
+                        AND kcu.table_name = tc.table_name
+                    WHERE tc.table_schema || '.' || tc.table_name = %s
+                    AND tc.constraint_type = 'PRIMARY KEY'
+                    ORDER BY kcu.ordinal_position;""", (table_name,))
+    primary_key = cur.fetchall()
+
+    metadata = {
+        'columns': columns,
+        'primary_key': primary_key[0]['constraint_name'] if primary_key else None,
+        'primary_key_columns': [row['column_name'] for row in primary_key],
+        'fetched_at': time.monotonic(),
+    }
+    table_metadata_cache[table_name] = metadata
+    return metadata
+
+
+def invalidate_table_metadata(table_name=None):
+    """Removes a table (schema.table) from the metadata cache. Clears all tables if not specified."""
+    if table_name is None:
+        table_metadata_cache.clear()
+        return
+    if '.' not in table_name:
+        table_name = 'public.' + table_name
+    table_metadata_cache.pop(table_name, None)
+
+
+def prepare_staging_table(conn, cur, table_name, metadata):
+    """
+    Creates a temporary table with the same columns and types as the final table,
+    without `created_at`, `updated_at` and generated columns.
+    It's created once per connection and reused while the table's columns don't change.
+    Rows are deleted on commit.
+
+    Returns:
+        temp_table_name (str)
+    """
+    temp_table_name = "temp_" + re.sub(r'\W', '_', table_name)
+    dropped_columns = ['created_at', 'updated_at'] + [item['column_name'] for item in metadata['columns']
+                                                       if item['is_generated'] != 'NEVER']
+    columns = tuple(item['column_name'] for item in metadata['columns'] if item['column_name'] not in dropped_columns)
+
+    created_tables = staging_tables.setdefault(conn, {})
+    if created_tables.get(temp_table_name) == columns:
+        return temp_table_name
+
+    cur.execute(
+        f"""
+        DROP TABLE IF EXISTS {temp_table_name};
+        CREATE TEMPORARY TABLE {temp_table_name} (LIKE {table_name})
+        ON COMMIT DELETE ROWS;
+        ALTER TABLE {temp_table_name}
+            {', '.join(f'DROP COLUMN IF EXISTS {column}' for column in dropped_columns)};
+        """
+    )
+    created_tables[temp_table_name] = columns
+    return temp_table_name
+
+
+pd_read_file = {
+    'csv': pd.read_csv, 'xls': pd.read_excel, 'xlsx': pd.read_excel,
+    'json': pd.read_json, 'json_normalize': partial(pd.json_normalize, sep='_'),
+    'pandas': pd.DataFrame
+}
+
+
+def read_chunks(file_path, file_extension='auto', chunksize=None):
+    """
+    Yields dataframes to be upserted.
+
+    Args:
+        file_path (str|os.path|pd.DataFrame|iterator of pd.DataFrame): path to csv / excel / json / pd.DataFrame,
+            or an iterator that yields dataframes, e.g. pd.read_csv(..., chunksize=n)
+        chunksize (int): csv files are read `chunksize` rows at a time. Other sources are sliced.
+    """
+    if isinstance(file_path, pd.DataFrame):
+        data = file_path
+
+    elif isinstance(file_path, Iterator) and file_extension in ('auto', 'pandas'):
+        # already chunked
+        yield from file_path
+        return
+
+    else:
+        if file_extension == 'auto':
+            file_extension = str(file_path).split('.')[1]
+
+        if chunksize and file_extension == 'csv':
+            yield from pd.read_csv(file_path, chunksize=chunksize)
+            return
+
+        data = pd_read_file[file_extension](file_path)
+
+    if not chunksize or len(data) <= chunksize:
+        yield data
+        return
+
+    for start in range(0, len(data), chunksize):
+        yield data.iloc[start:start + chunksize].copy()
+
+
+def dumps_json(value):
+    """json.dumps with orjson when it's installed. Null floats are dumped as `NaN`, which is copied as null."""
+    if isinstance(value, float) and value != value:
+        return 'NaN'
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+        except orjson.JSONEncodeError:
+            # e.g. integers over 64 bits
+            pass
+    return json.dumps(value)
+
+
+def parse_percent(series):
+    """Percentage strings (e.g. '12.5%') to fractions"""
+    if series.dtype == 'object' and series.str.contains('%', regex=False).any():
+        return series.str.replace('%', '', regex=False).astype(float) / 100
+    return series
+
+
+def to_utc_timestamps(series):
+    """Casts to time zone aware datetimes in UTC, naive values are taken as UTC"""
+    return pd.to_datetime(series, utc=True)
+
+
+def to_naive_timestamps(series):
+    """Casts to naive datetimes, time zone aware values are converted to UTC first"""
+    series = pd.to_datetime(series)
+    if isinstance(series.dtype, pd.DatetimeTZDtype):
+        series = series.dt.tz_convert('UTC').dt.tz_localize(None)
+    return series.astype('datetime64[ns]')
+
+
+def to_array_literal(series):
+    """Lists to PostgreSQL array literals, nulls to empty arrays"""
+    nulls = series.isna().to_numpy()
+    return pd.Series(['{}' if null else '{' + ', '.join(value) + '}' for value, null in zip(series.to_numpy(), nulls)],
+                     index=series.index, dtype='object')
+
+
+def to_json(series):
+    return pd.Series([dumps_json(value) for value in series.to_numpy()], index=series.index, dtype='object')
+
+
+def to_boolean(series):
+    """Casts to boolean without transforming 'False', 'false' & '0' strings to `True`"""
+    if series.dtype != 'bool':
+        series = series.replace({'False': False, 'false': False, '0': 0})
+    return series.astype(bool)
+
+
+def compile_cast_plan(converted_schema, array_literals=True):
+    """
+    Compiles the conversions of each column to the data types of the table, so
+    they're decided once per table instead of on every chunk.
+
+    Args:
+        converted_schema (list): [(column_name, python_data_type, postgresql_data_type)]
+        array_literals (bool): lists to array literals for csv serializers, binary keeps the lists
+    Returns:
+        cast_plan (list): [(column_name, [conversion functions])]
+    """
+    cast_plan = []
+    for column_name, data_type, postgresql_data_type in converted_schema:
+        conversions = []
+        # percentage str columns
+        if data_type in (int, float):
+            conversions.append(parse_percent)
+
+        if postgresql_data_type == 'timestamp with time zone':
+            conversions.append(to_utc_timestamps)
+        elif postgresql_data_type in ('date', 'timestamp', 'timestamp without time zone'):
+            conversions.append(to_naive_timestamps)
+        elif postgresql_data_type == 'ARRAY':
+            # adjust array representation, binary COPY encodes the lists as they are
+            if array_literals:
+                conversions.append(to_array_literal)
+            conversions.append(partial(pd.Series.astype, dtype=data_type))
+        elif postgresql_data_type == 'jsonb':
+            conversions.append(to_json)
+        elif postgresql_data_type == 'boolean':
+            conversions.append(to_boolean)
+        else:
+            conversions.append(partial(pd.Series.astype, dtype=data_type))
+
+        logger.info(f"{column_name}, {postgresql_data_type}: {data_type}")
+        cast_plan.append((column_name, conversions))
+    return cast_plan
+
+
+def get_cast_plan(metadata, converted_schema, array_literals=True):
+    """Gets the compiled cast plan of a table, cached along with its metadata"""
+    cast_plans = metadata.setdefault('cast_plans', {})
+    if array_literals not in cast_plans:
+        cast_plans[array_literals] = compile_cast_plan(converted_schema, array_literals)
+    return cast_plans[array_literals]
+
+
+def apply_cast_plan(data, cast_plan):
+    """
+    Casts dataframe columns with a compiled cast plan.
+
+    Args:
+        data (pd.DataFrame): with standardized column names
+        cast_plan (list): from compile_cast_plan
+    Returns:
+        data (pd.DataFrame)
+    """
+    for column_name, conversions in cast_plan:
+        # creates null non-existing columns
+        if column_name not in data.columns:
+            data[column_name] = np.nan
+            logger.info(f"\tMissing column: {column_name}")
+            continue
+        series = data[column_name]
+        for conversion in conversions:
+            series = conversion(series)
+        data[column_name] = series
+    return data
+
+
+def cast_data(data, converted_schema, array_literals=True):
+    """
+    Casts dataframe columns to the data types of the table.
+
+    Args:
+        data (pd.DataFrame): with standardized column names
+        converted_schema (list): [(column_name, python_data_type, postgresql_data_type)]
+        array_literals (bool): lists to array literals for csv serializers, binary keeps the lists
+    Returns:
+        data (pd.DataFrame)
+    """
+    return apply_cast_plan(data, compile_cast_plan(converted_schema, array_literals))
+
+
+def upsert_bulk(table_name, file_path, file_extension='auto', serializer='minimal_csv', chunksize=None, skip_unchanged=False,
+                keep='last', before_commit=None, format=None) -> dict:
+    """
+    Fast way to upsert multiple entries at once
+
+    table_name (str):
+    file_path (str|os.path|pd.DataFrame|iterator of pd.DataFrame): path to csv / excel / json / pd.DataFrame
+        or an iterator of dataframes. Each chunk is casted & copied to the same temporary table
+        and merged at once, so memory is bounded by the chunk size.
+    chunksize (int): rows per chunk. csv files are read with `chunksize`, dataframes are sliced.
+    serializer (str): how chunks are copied, one of `serializers`
+        'legacy_csv': every non-numeric field quoted
+        'minimal_csv': only fields with special characters quoted
+        'binary': casted columns encoded directly into PostgreSQL's binary COPY format
+    skip_unchanged (bool): only updates conflicting rows whose non-key columns changed,
+        identical rows aren't rewritten nor fire `update_updated_at_trigger`.
+    keep (str): 'first' | 'last', which of the rows sharing a primary key is upserted, in input order.
+        Tables without a primary key drop fully duplicated rows.
+    before_commit (callable): before_commit(cur, counts), runs in the upsert's transaction,
+        e.g. to advance a watermark atomically with the load.
+    format (str): deprecated, 'binary' is serializer='binary' and 'csv' the default csv serializer
+    Returns:
+        counts (dict): {'inserted': int, 'updated': int, 'unchanged': int}
+    """
+    if format is not None:
+        logger.warning(f"upsert_bulk(format={format!r}) is deprecated, use serializer=")
+        if format not in ('csv', 'binary'):
+            raise ValueError(f"Unknown COPY format: {format}")
+        if format == 'binary':
+            serializer = 'binary'
+    if serializer not in serializers:
+        raise ValueError(f"Unknown serializer: {serializer}")
+    if keep not in ('first', 'last'):
+        raise ValueError(f"keep must be 'first' or 'last', not {keep!r}")
+    serializer = serializers[serializer]
+
+    # adds public to schema if not present
+    if '.' not in table_name:
+        table_name = 'public.' + table_name
+    logger.info(f"Upserting {table_name}")
+    with setup_cursor(autocommit=False) as (conn, cur):
+        # Table's schema (column names & data type) and primary key
+        metadata = get_table_metadata(cur, table_name)
+        info_schema = metadata['columns']
+
+        # SQL standardize and pop out `created_at` & `updated_at`
+        schema = [(item['column_name'], item['data_type']) for item in info_schema 
+                        if item['column_name'] not in ('created_at', 'updated_at') and item['is_generated'] == 'NEVER']
+        udt_names = {item['column_name']: item['udt_name'] for item in info_schema}
+
+        # Mapping PostgreSQL data types to Python/pandas data types
+        type_mapping = {
+            'integer': 'Int64',
+            'bigint': 'Int64', 
+            'smallint': 'Int64',
+            'numeric': float,
+            'real': float,
+            'double precision': float,
+            'boolean': bool,
+            'date': 'datetime64[ns]',  # You can convert it to a proper Python date type if needed
+            'timestamp': 'datetime64[ns]',  # You can convert it to a proper Python datetime type if needed
+            'timestamp without time zone': 'datetime64[ns]',
+            'timestamp with time zone': 'datetime64[ns, UTC]',
+            'character varying': str,
+            'ARRAY': 'object',
+            'jsonb': 'object'
+        }
+
+        # Convert schema data types to Python data types
+        converted_schema = []
+        for column_name, data_type in schema:
+            python_data_type = type_mapping.get(data_type, str) # str if not exists
+            converted_schema.append((sql_standardize(column_name), python_data_type, data_type))
+
+        primary_key_columns = standardize_columns(metadata['primary_key_columns'])
+
+        # Create string with set of columns to be updated
+        update_set = ", ".join([f"{column[0]}=EXCLUDED.{column[0]}" for column in converted_schema])
+        on_conflict = f"DO UPDATE SET {update_set}"
+        if skip_unchanged:
+            # Only rewrites rows with a changed non-key column
+            non_key_columns = [column[0] for column in converted_schema if column[0] not in primary_key_columns]
+            if non_key_columns:
+                on_conflict += (f" WHERE ({', '.join(f'target.{column}' for column in non_key_columns)})"
+                                f" IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in non_key_columns)})")
+            else:
+                on_conflict = "DO NOTHING"
+
+        # Creates temporary empty table with same columns and types as
+        # the final table, once per connection
+        temp_table_name = prepare_staging_table(conn, cur, table_name, metadata)
+
+        # Conversions of each column, compiled once per table
+        cast_plan = get_cast_plan(metadata, converted_schema, serializer['array_literals'])
+
+        # orders columns by their ordinal position
+        ordered_columns = [column[0] for column in converted_schema]
+        column_types = [(data_type, udt_names[column_name]) for column_name, data_type in schema]
+        # array columns keep their lists when they aren't casted to array literals
+        list_columns = [] if serializer['array_literals'] else [
+            sql_standardize(column_name) for column_name, data_type in schema if data_type == 'ARRAY']
+
+        # Copies each chunk to the created temporary table in DB
+        copied_chunks = 0
+        for data in read_chunks(file_path, file_extension, chunksize):
+            # standardize column names
+            data.columns = standardize_columns(data.columns)
+            logger.info(data.columns)
+
+            data = apply_cast_plan(data, cast_plan)
+
+            missing_new_columns = [col for col in ordered_columns if col not in data.columns]
+            if missing_new_columns:
+                logger.info(f"\nNew columns not in the database: {missing_new_columns}")
+                raise Exception
+            data = data[ordered_columns]
+
+            # Removes rows duplicated on the primary key, or fully duplicated rows without one
+            data = drop_duplicate_rows(data, list_columns, subset=primary_key_columns or None, keep=keep)
+
+            # Replace null values with proper null format of the serializer
+            data = serializer['prepare'](data)
+
+            # Copy serialized data to the created temporary table in DB
+            cur.copy_expert(f"COPY {temp_table_name} FROM STDIN WITH ({serializer['copy_options']})",
+                            serializer['serialize'](data, column_types))
+
+            copied_chunks += 1
+            logger.info(f"\tCopied chunk {copied_chunks}: {len(data)} rows")
+
+        # Chunks may repeat keys of previous chunks: keeps one row per primary key,
+        # in copy order (ctid) since the staging table is only appended to in this transaction
+        if copied_chunks <= 1:
+            staged = f"SELECT * FROM {temp_table_name}"
+        elif primary_key_columns:
+            staged = (f"SELECT DISTINCT ON ({', '.join(primary_key_columns)}) * FROM {temp_table_name}"
+                      f" ORDER BY {', '.join(primary_key_columns)}, ctid {'DESC' if keep == 'last' else 'ASC'}")
+        else:
+            staged = f"SELECT DISTINCT * FROM {temp_table_name}"
+
+        # Inserts copied data from the temporary table to the final table
+        # updating existing values at each new conflict.
+        # xmax is 0 for inserted rows, conflicting rows that weren't updated aren't returned
+        cur.execute(
+            f"""
+            WITH staged AS (
+                {staged}
+            ), upserted AS (
+                INSERT INTO {table_name} AS target ({', '.join(ordered_columns)})
+                SELECT * FROM staged
+                {
+                    f"ON CONFLICT ON CONSTRAINT {metadata['primary_key']} {on_conflict}"
+                    if metadata['primary_key'] else ""
+                }
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT (SELECT COUNT(*) FROM staged) AS staged,
+                COUNT(*) FILTER (WHERE inserted) AS inserted,
+                COUNT(*) FILTER (WHERE NOT inserted) AS updated
+            FROM upserted;
+            """
+        )
+        result = cur.fetchone()
+        counts = {'inserted': result['inserted'], 'updated': result['updated'],
+                  'unchanged': result['staged'] - result['inserted'] - result['updated']}
+
+        if before_commit:
+            before_commit(cur, counts)
+
+        # Empties temporary table on commit
+        conn.commit()
+        logger.info(f"\tUpsert Success: {counts}\n")
+        return counts
+
+
+def create_metadata(cur):
+    "Metadata of column names"
+    cur.execute("""
+        CREATE TABLE metadata (
+            table_name TEXT PRIMARY KEY,
+            created TIMESTAMP,
+            column_details JSON
+        );""")
+
+
+def create_cerebro_amazon(cur):
+    # "ABA SFR" DECIMAL removed from cerebro
+    cur.execute("""
+        CREATE TABLE cerebro_amazon (
+            country VARCHAR(5),
+            category VARCHAR(25),
+            asin VARCHAR(15),
+            date DATE,
+            "Keyword Phrase" VARCHAR(150),
+            "ABA Total Click Share" NUMERIC(4,1),
+            "ABA Total Conv. Share" NUMERIC(4,1), 
+            "Keyword Sales" INT,
+            "Cerebro IQ Score" INT,
+            "Search Volume" INT,
+            "Search Volume Trend" SMALLINT,
+            "H10 PPC Sugg. Bid" NUMERIC(5,2),
+            "H10 PPC Sugg. Min Bid" NUMERIC(5,2),
+            "H10 PPC Sugg. Max Bid" NUMERIC(5,2),
+            "Sponsored ASINs" SMALLINT,
+            "Competing Products" INT,
+            "CPR"  SMALLINT,
+            "Title Density"  SMALLINT,
+            "Amazon Recommended"  SMALLINT,
+            "Sponsored"  SMALLINT,
+            "Organic"  SMALLINT,
+            "Sponsored Rank (avg)"  SMALLINT,
+            "Sponsored Rank (count)"  SMALLINT,
+            "Amazon Recommended Rank (avg)" SMALLINT,
+            "Amazon Recommended Rank (count)" SMALLINT,
+            "Position (Rank)" SMALLINT,
+            "Relative Rank" SMALLINT,
+            "Competitor Rank (avg)" NUMERIC(4,1),
+            "Ranking Competitors (count)" SMALLINT,
+            "Competitor Performance Score" NUMERIC(4,1),
+            created TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            PRIMARY KEY (country, category, date, "Keyword Phrase")
+        );
+    """)
+    return
+
+
+def create_product_amazon(cur):
+    cur.execute("""
+        CREATE TABLE product_amazon (
+            asin VARCHAR(15) PRIMARY KEY, 
+            product_name VARCHAR(200) NOT NULL,
+            product_code VARCHAR(10),
+            sku VARCHAR(50) NOT NULL
+            category VARCHAR(30) NOT NULL,
+            active BOOLEAN
+        );
+    """)
+
+
+def create_search_query_performance_asin_view(cur):
+    cur.execute("""
+                    CREATE TABLE search_query_performance_asin_view (
+                        country VARCHAR(3) NOT NULL,
+                        asin VARCHAR(10) NOT NULL,
+                        reporting_range VARCHAR(6) NOT NULL,
+                        week INT NOT NULL,
+                        start_date DATE NOT NULL,
+                        end_date DATE NOT NULL,
+                        search_query VARCHAR(310),
+                        search_query_score INT,
+                        search_query_volume INT,
+                        impressions_total_count INT,
+                        impressions_asin_count INT,
+                        impressions_asin_share NUMERIC(8,2),
+                        clicks_total_count INT,
+                        clicks_click_rate NUMERIC(8,2),
+                        clicks_asin_count INT,
+                        clicks_asin_share NUMERIC(8,2),
+                        clicks_price_median NUMERIC(8,2),
+                        clicks_asin_price_median NUMERIC(8,2),
+                        clicks_same_day_shipping_speed INT,
+                        clicks_1d_shipping_speed INT,
+                        clicks_2d_shipping_speed INT,
+                        cart_adds_total_count INT,
+                        cart_adds_cart_add_rate NUMERIC(8,2),
+                        cart_adds_asin_count INT,
+                        cart_adds_asin_share NUMERIC(8,2),
+                        cart_adds_price_median NUMERIC(8,2),
+                        cart_adds_asin_price_median NUMERIC(8,2),
+                        cart_adds_same_day_shipping_speed INT,
+                        cart_adds_1d_shipping_speed INT,
+                        cart_adds_2d_shipping_speed INT,
+                        purchases_total_count INT,
+                        purchases_purchase_rate NUMERIC(8,2),
+                        purchases_asin_count INT,
+                        purchases_asin_share NUMERIC(8,2),
+                        purchases_price_median NUMERIC(8,2),
+                        purchases_asin_price_median NUMERIC(8,2),
+                        purchases_same_day_shipping_speed INT,
+                        purchases_1d_shipping_speed INT,
+                        purchases_2d_shipping_speed INT,
+                        reporting_date DATE,
+                        created TIMESTAMP WITH TIME ZONE DEFAULT now(),
+                        PRIMARY KEY (country, asin, reporting_range, reporting_date, search_query)
+);""")
+
+
+
+def create_search_query_performance_brand_view(cur):
+    cur.execute("""
+                    CREATE TABLE search_query_performance_brand_view (
+                        country VARCHAR(3) NOT NULL,
+                        reporting_range VARCHAR(6) NOT NULL,
+                        week INT NOT NULL,
+                        start_date DATE NOT NULL,
+                        end_date DATE NOT NULL,
+                        search_query VARCHAR(310),
+                        search_query_score INT,
+                        search_query_volume INT,
+                        impressions_total_count INT,
+                        impressions_brand_count INT,
+                        impressions_brand_share NUMERIC(8,2),
+                        clicks_total_count INT,
+                        clicks_click_rate NUMERIC(8,2),
+                        clicks_brand_count INT,
+                        clicks_brand_share NUMERIC(8,2),
+                        clicks_price_median NUMERIC(8,2),
+                        clicks_brand_price_median NUMERIC(8,2),
+                        clicks_same_day_shipping_speed INT,
+                        clicks_1d_shipping_speed INT,
+                        clicks_2d_shipping_speed INT,
+                        cart_adds_total_count INT,
+                        cart_adds_cart_add_rate NUMERIC(8,2),
+                        cart_adds_brand_count INT,
+                        cart_adds_brand_share NUMERIC(8,2),
+                        cart_adds_price_median NUMERIC(8,2),
+                        cart_adds_brand_price_median NUMERIC(8,2),
+                        cart_adds_same_day_shipping_speed INT,
+                        cart_adds_1d_shipping_speed INT,
+                        cart_adds_2d_shipping_speed INT,
+                        purchases_total_count INT,
+                        purchases_purchase_rate NUMERIC(8,2),
+                        purchases_brand_count INT,
+                        purchases_brand_share NUMERIC(8,2),
+                        purchases_price_median NUMERIC(8,2),
+                        purchases_brand_price_median NUMERIC(8,2),
+                        purchases_same_day_shipping_speed INT,
+                        purchases_1d_shipping_speed INT,
+                        purchases_2d_shipping_speed INT,
+                        reporting_date DATE,
+                        created TIMESTAMP WITH TIME ZONE DEFAULT now(),
+                        PRIMARY KEY (country, reporting_range, reporting_date, search_query)
+    );""")
+
+
+def create_sponsored_products_amazon(cur):
+    cur.execute("""
+        CREATE TABLE sponsored_products_amazon (
+            start_date DATE NOT NULL,
+            end_date DATE NOT NULL,
+            portfolio_name VARCHAR(100),
+            currency VARCHAR(3) NOT NULL,
+            campaign_name VARCHAR(100) NOT NULL,
+            ad_group_name VARCHAR(80) NOT NULL,
+            targeting VARCHAR(128) NOT NULL,
+            match_type VARCHAR(6),
+            customer_search_term VARCHAR(249),
+            impressions INT,
+            clicks SMALLINT,
+            ctr NUMERIC(5,2),
+            cpc NUMERIC(4,2),
+            spend NUMERIC(7,2),
+            total_sales NUMERIC(7,2),
+            acos NUMERIC(5,2),
+            roas NUMERIC(6,2),
+            total_orders SMALLINT,
+            total_units SMALLINT,
+            cvr NUMERIC(3,2),
+            advertised_sku_units SMALLINT,
+            other_sku_units SMALLINT,
+            advertised_sku_sales NUMERIC(6,2),
+            other_sku_sales NUMERIC(6,2),
+            created TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            PRIMARY KEY (start_date, end_date, portfolio_name, currency, campaign_name, ad_group_name, targeting, match_type, customer_search_term)
+        );""")
+
+
+def insert_sponsored_products_amazon(cur):
+    query = """INSERT INTO metadata(table_name, created, column_details) 
+                        VALUES ('sponsored_products_amazon', NOW(), 
+                                '{"start_date": "Start Date",
+                                    "end_date": "End Date",
+                                    "portfolio_name": "Portfolio Name",
+                                    "currency": "Currency",
+                                    "campaign_name": "Campaign Name",
+                                    "ad_group_name": "Ad Group Name",
+                                    "targeting": "Targeting",
+                                    "match_type": "Match Type",
+                                    "customer_search_term": "Customer Search Term",
+                                    "impressions": "Impressions",
+                                    "clicks": "Clicks",
+                                    "ctr": "Click-Thru Rate (CTR)",
+                                    "cpc": "Cost Per Click (CPC)",
+                                    "spend": "Spend",
+                                    "total_sales": "7 Day Total Sales",
+                                    "acos": "Total Advertising Cost of Sales (ACOS)",
+                                    "roas": "Total Return on Advertising Spend (ROAS)",
+                                    "total_orders": "7 Day Total Orders (#)",
+                                    "total_units": "7 Day Total Units (#)",
+                                    "cvr": "7 Day Conversion Rate",
+                                    "advertised_sku_units": "7 Day Advertised SKU Units (#)",
+                                    "other_sku_units": "7 Day Other SKU Units (#)",
+                                    "advertised_sku_sales": "7 Day Advertised SKU Sales",
+                                    "other_sku_sales": "7 Day Other SKU Sales"}');"""
+    cur.execute(query)
+
+
+def create_sponsored_display_report(cur):
+    cur.execute("""CREATE TABLE Sponsored_Display_Report (
+                    record_id INT NOT NULL AUTO_INCREMENT,
+                    campaign_id VARCHAR(255),
+                    campaign_name VARCHAR(255),
+                    ad_group_id VARCHAR(255),
+                    ad_group_name VARCHAR(255),
+                    targeting_type VARCHAR(255),
+                    targeting_expression VARCHAR(255),
+                    start_date DATE,
+                    end_date DATE,
+                    currency VARCHAR(255),
+                    impressions INT,
+                    clicks INT,
+                    click_through_rate DECIMAL(10,2),
+                    cost_per_click DECIMAL(10,2),
+                    spend DECIMAL(10,2),
+                    attributed_conversions_1d INT,
+                    attributed_conversions_7d INT,
+                    attributed_conversions_14d INT,
+                    attributed_conversions_30d INT,
+                    attributed_sales_1d DECIMAL(10,2),
+                    attributed_sales_7d DECIMAL(10,2),
+                    attributed_sales_14d DECIMAL(10,2),
+                    attributed_sales_30d DECIMAL(10,2),
+                    attributed_units_ordered_1d INT,
+                    attributed_units_ordered_7d INT,
+                    attributed_units_ordered_14d INT,
+                    attributed_units_ordered_30d INT,
+                    total_units_ordered_1d INT,
+                    total_units_ordered_7d INT,
+                    total_units_ordered_14d INT,
+                    total_units_ordered_30d INT,
+                    conversion_rate_1d DECIMAL(10,2),
+                    conversion_rate_7d DECIMAL(10,2),
+                    conversion_rate_14d DECIMAL(10,2),
+                    conversion_rate_30d DECIMAL(10,2),
+                    campaign_status VARCHAR(255),
+                    PRIMARY KEY (record_id) );""")
+
+
+def create_sponsored_product_search_term_report (cur):
+    cur.execute("""CREATE TABLE sponsored_product_search_term_report (
+                    date DATE,
+                    portfolio_name VARCHAR(255),
+                    currency VARCHAR(3),
+                    campaign_name VARCHAR(255),
+                    ad_group_name VARCHAR(255),
+                    targeting VARCHAR(255),
+                    match_type VARCHAR(255),
+                    cutomer_search_term VARCHAR(255),
+                    impressions INTEGER,
+                    clicks INTEGER,
+                    ctr NUMERIC,
+                    cpc NUMERIC,
+                    spend NUMERIC,
+                    7_day_total_sales NUMERIC,
+                    total_advertising_cost_of_sales NUMERIC,
+                    total_roas NUMERIC,
+                    7_day_total_orders INTEGER,
+                    7_day_total_units INTEGER,
+                    7_day_conversion_rate NUMERIC,
+                    7_day_advertised_sku_units INTEGER,
+                    7_day_other_sku_units INTEGER,
+                    7_day_advertised_sku_sales NUMERIC,
+                    7_day_other_sku_sales NUMERIC
+                    );""")
+
+
+def create_h10_keyword_tracker(cur):
+    cur.execute("""CREATE TABLE h10_keyword_tracker (
+                    title VARCHAR(200),
+                    asin VARCHAR(15),
+                    keyword VARCHAR(100),
+                    marketplace VARCHAR(15),
+                    search_volume INT,
+                    organic_rank INT,
+                    sponsored_position INT,
+                    date_added TIMESTAMP,
+                    PRIMARY KEY(asin, keyword, marketplace, date_added),
+                    FOREIGN KEY(asin)
+                        REFERENCES product_amazon(asin)
+                        ON UPDATE CASCADE
+                );""")
+
+
+def copy_h10_keyword_tracker(cur, path):
+    try:
+        # cleans data
+        data = pd.read_csv(path)
+        columns = ['Search Volume', 'Organic Rank', 'Sponsored Position']
+        data[columns] = data[columns].replace('-', 0).replace('>306', 306).astype(int)
+        data['Date Added'] = pd.to_datetime(data['Date Added'])
+
+        # excludes old data
+        query = '''SELECT MAX(date_added) FROM h10_keyword_tracker;'''
+        last_date_added = sql_to_dataframe(query)['max'].item()
+        if last_date_added:
+            data = data[data['Date Added'] > last_date_added]
+        # saves
+        temp_csv = os.path.join('H10 Keyword Tracker', 'keyword_tracker_temp.csv')
+        data.to_csv(temp_csv, index=False, sep='\t')
+
+        with open(temp_csv, 'rb') as file:
+            next(file)
+            cur.copy_from(file, 'h10_keyword_tracker', sep='\t', null='0', 
+                                        columns=(col.replace(' ','_').lower() for col in data.columns))
+    except Exception as e:
+        logger.error(e)
+
+
+def create_sponsored_tables(cur, directory):
+    """Create sponsored tables by specifying a directory"""
+    with setup_cursor() as cur:
+        for root, path, files in os.walk(directory):
+            for file in files:
+                file_path = os.path.join(root, file)
+                table_name = sql_standardize(file, remove_file_extension=False)
+                logger.info(f"Creating table {table_name}")
+                create_table(cur, file_path)
+                logger.info("Updating triggers")
+                update_updated_at_trigger(cur, table_name)
+                logger.info("Upserting bulk")
+                upsert_bulk(table_name, file_path)
+
+
+def get_tenants():
+    """
+    Get all tenants from the database
+    Returns dict
+    """
+    data = sql_to_dataframe("SELECT tenant_id, company FROM tenants")
+    # converts to dict
+    data = data.set_index('company').to_dict()['tenant_id']
+    return data
\ No newline at end of file
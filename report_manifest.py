@@ -0,0 +1,102 @@
+import sqlite3
+import hashlib
+import threading
+import datetime as dt
+import os
+import logging
+import logger_setup
+
+logger_setup.setup_logging(__file__)
+logger = logging.getLogger(__name__)
+
+
+class ReportManifest():
+    """
+    Durable record of the reports of a run: reportId, status, file path & upsert status,
+    saved in a local SQLite file so a crashed run resumes instead of re-requesting everything.
+
+    A run is identified by its account and report names. Starting a run with the same reports
+    as an unfinished run younger than `max_age_hours` resumes it.
+
+    Args:
+        path (str): SQLite file
+        max_age_hours (int): unfinished runs older than this aren't resumed, their reports expired
+    """
+    def __init__(self, path=os.path.join('PPC Data', 'report_manifest.sqlite'), max_age_hours=72):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_age_hours = max_age_hours
+        self.run_id = None
+        # workers update the manifest from their threads
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_key TEXT NOT NULL,
+                    started_at TEXT NOT NULL,
+                    finished_at TEXT
+                );
+                CREATE TABLE IF NOT EXISTS reports (
+                    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+                    report_name TEXT NOT NULL,
+                    report_id TEXT,
+                    status TEXT,
+                    file_path TEXT,
+                    upsert_status TEXT,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (run_id, report_name)
+                );
+            """)
+
+    def start_run(self, account, report_names):
+        """
+        Resumes the latest unfinished run of the same reports or starts a new one.
+
+        Returns:
+            reports (dict): {report_name: {report_id, status, file_path, upsert_status}} of a resumed run
+        """
+        run_key = hashlib.sha1('\n'.join([account] + sorted(report_names)).encode('utf-8')).hexdigest()
+        min_started_at = (dt.datetime.now(dt.timezone.utc) - dt.timedelta(hours=self.max_age_hours)).isoformat()
+
+        with self.lock, self.conn:
+            run = self.conn.execute("""SELECT run_id FROM runs
+                                       WHERE run_key = ? AND finished_at IS NULL AND started_at >= ?
+                                       ORDER BY run_id DESC LIMIT 1""", (run_key, min_started_at)).fetchone()
+            if run:
+                self.run_id = run['run_id']
+                rows = self.conn.execute("SELECT * FROM reports WHERE run_id = ?", (self.run_id,)).fetchall()
+                logger.info(f"Resuming report run {self.run_id} with {len(rows)} recorded reports")
+                return {row['report_name']: dict(row) for row in rows}
+
+            self.run_id = self.conn.execute("INSERT INTO runs (run_key, started_at) VALUES (?, ?)",
+                                            (run_key, dt.datetime.now(dt.timezone.utc).isoformat())).lastrowid
+            logger.info(f"Starting report run {self.run_id}")
+            return {}
+
+    def update(self, report_name, **fields):
+        """Records fields (report_id, status, file_path, upsert_status) of a report in the current run"""
+        fields['updated_at'] = dt.datetime.now(dt.timezone.utc).isoformat()
+        columns = ', '.join(fields)
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"""INSERT INTO reports (run_id, report_name, {columns})
+                    VALUES (?, ?, {', '.join('?' for _ in fields)})
+                    ON CONFLICT (run_id, report_name) DO UPDATE SET
+                    {', '.join(f'{column} = excluded.{column}' for column in fields)}""",
+                (self.run_id, report_name, *fields.values())
+            )
+
+    def finish_run(self):
+        """Marks the current run as finished, so it won't be resumed"""
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE runs SET finished_at = ? WHERE run_id = ?",
+                              (dt.datetime.now(dt.timezone.utc).isoformat(), self.run_id))
+
+    def close(self):
+        self.conn.close()
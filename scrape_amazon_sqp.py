@@ -1,15 +1,18 @@
 from playwright.sync_api import Playwright
 from playwright.async_api import async_playwright, expect
 import json
+import csv
 import pandas as pd
 import datetime as dt
 import re
 import asyncio
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import postgresql2
-from utility import get_day_of_week, reposition_columns
+from utility import get_day_of_week, reposition_columns, list_files, combine_files
 from playwright_setup import setup_playwright, login_amazon
+import tenant_registry
 import logging
 import logger_setup
 
@@ -26,7 +29,7 @@ table_names = {
     'brand': 'brand_analytics.search_query_performance_brand_view',
 }
 
-tenants = postgresql2.get_tenants()
+tenants = tenant_registry.postgres_tenants
 
 
 async def generate_download(
@@ -244,78 +247,109 @@ async def download_reports(page=None, n_downloads=100, account='Bare Barrel'):
     return downloaded_filepaths
 
 
-def combine_data(directory=None, file_paths=[], file_extension='.csv'):
+sqp_columns = {
+    'Search Query': 'search_query',
+    'Reporting Date': 'reporting_date'
+}
+col_positions = {
+    'asin': {
+        'reporting_date': 0,
+        'reporting_range': 1,
+        'marketplace': 2,
+        'asin': 3,
+        'search_query': 4,
+    },
+    'brand': {
+        'reporting_date': 0,
+        'reporting_range': 1,
+        'marketplace': 2,
+        'search_query': 3,
+    },
+}
+table_primary_keys = {
+    'asin': ['reporting_date', 'reporting_range', 'marketplace', 'asin', 'search_query'],
+    'brand': ['reporting_date', 'reporting_range', 'marketplace', 'search_query'],
+}
+asin_pattern = re.compile('ASIN', re.IGNORECASE)
+reporting_range_pattern = re.compile('Reporting Range', re.IGNORECASE)
+non_word_pattern = re.compile(r'\W')
+marketplace_pattern = re.compile(r'/(\w*)_Search_Query')
+
+
+def read_sqp_file(file_path):
+    """
+    Reads a downloaded SQP csv in one pass: the metadata header (asin, reporting range)
+    then the body, adding marketplace. Dates & normalization are left to combine_data,
+    which runs them once over all files.
+    Returns None for empty files.
+    """
+    logger.info(f"Combining {file_path}")
+    with open(file_path, newline='', encoding='utf-8') as file:
+        metadata = next(csv.reader([file.readline()]), [])
+        data = pd.read_csv(file)
+
+    if data.empty:
+        logger.info("\tEmpty data")
+        return None
+
+    # cleans & adds metadata
+    for col in metadata:
+        splitted_col = col.split('=')
+        if len(splitted_col) > 1:
+            value = non_word_pattern.sub('', splitted_col[1])
+
+        if asin_pattern.search(col):
+            data['asin'] = value
+
+        elif reporting_range_pattern.search(col):
+            data['reporting_range'] = value
+
+    data['marketplace'] = marketplace_pattern.search(file_path)[1]
+    data.rename(columns=sqp_columns, inplace=True)
+
+    return data
+
+
+def combine_data(directory=None, file_paths=None, file_extension='.csv', max_workers=None, min_files_per_process=64):
     """
     Combines files in a directory and/or in file_paths.
     Inserts `marketplace` and `date`.
+    Files are parsed across a process pool when there are at least
+    `min_files_per_process` files per worker, else across threads.
+    Rows duplicated on the primary keys are merged, each column keeping its last non-null value
+    in `file_paths` order.
     Returns pandas dataframe.
     """
+    file_paths = list(file_paths or [])
+
     # gets all similar file types in a directory
     if directory:
-        for dirpath, dirnames, filenames in os.walk(directory):
-            for filename in filenames:
-                if file_extension in filename:
-                    file_paths.append(os.path.join(dirpath, filename))
+        file_paths += list_files(directory, file_extension)
+
+    if not file_paths:
+        return pd.DataFrame()
+
+    # process pool for large backfills, batches of files per task to save on pickling
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers > 1 and len(file_paths) >= max_workers * min_files_per_process:
+        executor_class, chunksize = ProcessPoolExecutor, min_files_per_process
+    else:
+        executor_class, chunksize = ThreadPoolExecutor, 1
 
     # combines data
-    combined_data = pd.DataFrame()
-
-    for file_path in file_paths:
-        logger.info(f"Combining {file_path}")
-        metadata = pd.read_csv(file_path, nrows=0)
-        data = pd.read_csv(file_path, skiprows=1)
-
-        if data.empty:
-            logger.info("\tEmpty data")
-            continue
-
-        # cleans & adds metadata
-        for col in metadata.columns:
-            splitted_col = col.split('=')
-            if len(splitted_col) > 1:
-                value = re.sub(r'\W', '', splitted_col[1])
-
-            if re.search('ASIN', col, re.IGNORECASE):
-                data['asin'] = value
-
-            elif re.search('Reporting Range', col, re.IGNORECASE):
-                data['reporting_range'] = value
-
-        data['marketplace'] = re.search(r'/(\w*)_Search_Query', file_path)[1]
-
-        # calculates week number, start & end date
-        data.rename(columns={
-                'Search Query': 'search_query',
-                'Reporting Date': 'reporting_date'
-            }, inplace=True)
-        data['reporting_date'] = pd.to_datetime(data['reporting_date'])
-        data['end_date'] = data['reporting_date']
-        data['start_date'] = data['end_date'] - dt.timedelta(days=6)
-        data['week'] = data['end_date'].dt.isocalendar().week
-
-        # reposition
-        view = re.search(r'(ASIN|Brand)', file_path)[1].lower()
-        col_positions = {
-            'asin': {
-                'reporting_date': 0,
-                'reporting_range': 1,
-                'marketplace': 2,
-                'asin': 3,
-                'search_query': 4,
-            },
-            'brand': {
-                'reporting_date': 0,
-                'reporting_range': 1,
-                'marketplace': 2,
-                'search_query': 3,
-            },
-        }
-        data = reposition_columns(data, col_positions[view])
+    combined_data = combine_files(file_paths, read_sqp_file, max_workers=max_workers,
+                                  executor_class=executor_class, chunksize=chunksize)
+
+    if combined_data.empty:
+        return combined_data
 
-        combined_data = pd.concat([data, combined_data], ignore_index=True)
+    # calculates week number, start & end date
+    combined_data['reporting_date'] = pd.to_datetime(combined_data['reporting_date'])
+    combined_data['end_date'] = combined_data['reporting_date']
+    combined_data['start_date'] = combined_data['end_date'] - dt.timedelta(days=6)
+    combined_data['week'] = combined_data['end_date'].dt.isocalendar().week
 
     # force normalization
-    # combined_data['search_query'] = combined_data['search_query'].str.strip().str.lower()
     combined_data['search_query'] = (
         combined_data['search_query']
         .astype(str)
@@ -324,35 +358,17 @@ def combine_data(directory=None, file_paths=[], file_extension='.csv'):
     )
     combined_data['marketplace'] = combined_data['marketplace'].str.strip().str.upper()
     combined_data['reporting_range'] = combined_data['reporting_range'].str.strip().str.lower()
-    combined_data['reporting_date'] = (
-        pd.to_datetime(combined_data['reporting_date'])
-        .dt.strftime('%Y-%m-%d')
-    )
-
-    # drop duplicates on primary keys
-    if 'asin' in combined_data.columns:
-        pkeys = ['reporting_date', 'reporting_range', 'marketplace', 'asin', 'search_query']
-    else:
-        pkeys = ['reporting_date', 'reporting_range', 'marketplace', 'search_query']
+    combined_data['reporting_date'] = combined_data['reporting_date'].dt.strftime('%Y-%m-%d')
 
-    # combined_data = (
-    #     combined_data
-    #     .sort_values("reporting_date")
-    #     .drop_duplicates(subset=pkeys, keep="last")
-    # )
+    # primary keys of the combined view, ASIN files add the asin column
+    view = 'asin' if 'asin' in combined_data.columns else 'brand'
+    pkeys = table_primary_keys[view]
 
-    # drop nulls
+    # drop nulls & merge duplicates on primary keys, reposition once
     combined_data = combined_data.dropna(subset=pkeys)
-
-    # HARD dedupe
-    combined_data = combined_data.groupby(pkeys, as_index=False).last()
-
-    # debug
-    print("Final rows:", len(combined_data))
-    print("Unique keys:", len(combined_data.drop_duplicates(subset=pkeys)))
-
-    if combined_data.duplicated(subset=pkeys).any():
-        raise Exception("STILL DUPLICATES BEFORE UPSERT")
+    combined_data = combined_data.groupby(pkeys, as_index=False, sort=False).last()
+    combined_data = reposition_columns(combined_data, col_positions[view])
+    logger.info(f"Combined {len(combined_data)} rows from {len(file_paths)} files")
 
     return combined_data
 
@@ -398,7 +414,8 @@ async def scrape_sqp(
 
         # inserts to amazon db
         table_name = table_names[view]
-        downloaded_filepaths = list(set(downloaded_filepaths))
+        # removes repeated downloads, keeping the download order
+        downloaded_filepaths = list(dict.fromkeys(downloaded_filepaths))
         data = combine_data(file_paths=downloaded_filepaths)
         data['tenant_id'] = tenants[account]
 
@@ -14,6 +14,7 @@ import postgresql
 from utility import get_day_of_week, reposition_columns
 from playwright_setup import setup_playwright, login_amazon
 from tzlocal import get_localzone
+import tenant_registry
 import logging
 import logger_setup
 
@@ -24,7 +25,7 @@ with open('config.json') as f:
     config = json.load(f)
 
 table_name = 'rankings.h10_keyword_tracker'
-tenants = postgresql.get_tenants()
+tenants = tenant_registry.postgres_tenants
 
 def clean_data(file_path):
     data = pd.read_csv(file_path)
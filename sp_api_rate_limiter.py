@@ -0,0 +1,123 @@
+import time
+import threading
+from sp_api.base.exceptions import SellingApiRequestThrottledException
+import logging
+import logger_setup
+
+logger_setup.setup_logging(__file__)
+logger = logging.getLogger(__name__)
+
+# Documented default usage plans {operation: (requests per second, burst)}
+# https://developer-docs.amazon.com/sp-api/docs/usage-plans-and-rate-limits
+default_rate_limits = {
+    'get_orders': (0.0167, 20),
+    'get_order_items': (0.5, 30),
+    'get_listings_item': (5, 10),
+    'get_competitive_pricing': (0.5, 1),
+    'get_my_fees_estimates': (0.5, 1),
+    'list_financial_events': (0.5, 30),
+    'get_shipments': (2, 30),
+    'get_shipment_items': (2, 30),
+    'list_inbound_plans': (2, 6),
+    'list_inbound_shipments': (1, 1),
+    'get_inbound_shipment': (2, 2),
+    'list_inventory': (2, 2),
+    'get_inventory_summaries': (2, 2),
+}
+
+
+class TokenBucket():
+    """
+    Thread-safe token bucket: holds up to `burst` tokens, refilled at `rate` tokens per second.
+    Every request takes a token, waiting for one when the bucket is empty.
+    `clock` & `sleep` can be replaced to drive the bucket without waiting, e.g. in tests.
+    """
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """Takes a token, blocking until one is available"""
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+    def update_rate(self, rate):
+        """Sets the rate returned by Amazon in the `x-amzn-RateLimit-Limit` header"""
+        try:
+            rate = float(rate)
+        except (TypeError, ValueError):
+            return
+        if rate > 0 and rate != self.rate:
+            with self.lock:
+                self.refill()
+                self.rate = rate
+
+    def throttled(self):
+        """Empties the bucket after a 429, the next request waits a full refill"""
+        with self.lock:
+            self.tokens = 0.0
+            self.updated_at = self.clock()
+
+
+# Rate limiters shared by every job of the process {(account, marketplace, operation): TokenBucket}
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(account, marketplace, operation):
+    """Returns the token bucket of an operation, seeded with its documented rate & burst"""
+    key = (account, marketplace, operation)
+    with rate_limiters_lock:
+        if key not in rate_limiters:
+            rate, burst = default_rate_limits.get(operation, (1, 1))
+            rate_limiters[key] = TokenBucket(rate, burst)
+        return rate_limiters[key]
+
+
+def call(account, marketplace, operation, request, tries=10):
+    """
+    Calls `request()` once the operation's rate limiter allows it and updates the limiter
+    from the response's rate limit header. Throttled requests are retried `tries` times.
+
+    Args:
+        account (str)
+        marketplace (str)
+        operation (str): key of `default_rate_limits`, e.g. 'get_order_items'
+        request (callable): makes the SP-API call, e.g. lambda: Orders(...).get_order_items(order_id)
+        tries (int)
+
+    Returns:
+        response (ApiResponse)
+    """
+    rate_limiter = get_rate_limiter(account, marketplace, operation)
+
+    for attempt in range(1, tries + 1):
+        rate_limiter.acquire()
+        try:
+            response = request()
+        except SellingApiRequestThrottledException as error:
+            if attempt == tries:
+                raise
+            logger.warning(f"{operation} throttled in {account}-{marketplace}, attempt {attempt}/{tries}")
+            rate_limiter.update_rate((getattr(error, 'headers', None) or {}).get('x-amzn-RateLimit-Limit'))
+            rate_limiter.throttled()
+            continue
+
+        rate_limiter.update_rate(getattr(response, 'rate_limit', None))
+        return response
@@ -0,0 +1,134 @@
+import datetime as dt
+import json
+import os
+import threading
+from collections.abc import Mapping
+import logging
+import logger_setup
+
+logger_setup.setup_logging(__file__)
+logger = logging.getLogger(__name__)
+
+# Tenants of every backend cached on disk {backend: {'fetched_at': str, 'tenants': {company: tenant_id}}}
+cache_path = 'tenants_cache.json'
+cache_lock = threading.Lock()
+ttl = dt.timedelta(hours=24)
+
+
+def load_postgres_tenants():
+    # imported here so importing a module doesn't connect to a backend it may not use
+    import postgresql_engine
+    return postgresql_engine.get_tenants()
+
+
+def load_bigquery_tenants():
+    import bigquery_utils
+    return bigquery_utils.get_tenants()
+
+
+def read_cache(backend):
+    """Returns the cached {'fetched_at': datetime, 'tenants': dict} of the backend or None"""
+    with cache_lock:
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with open(cache_path) as f:
+                cached = json.load(f).get(backend)
+        except (OSError, ValueError) as error:
+            logger.warning(f"Ignoring unreadable {cache_path}: {error}")
+            return None
+    if not cached:
+        return None
+    return {'fetched_at': dt.datetime.fromisoformat(cached['fetched_at']), 'tenants': cached['tenants']}
+
+
+def write_cache(backend, tenants):
+    with cache_lock:
+        cache = {}
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path) as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                cache = {}
+        cache[backend] = {'fetched_at': dt.datetime.now(dt.timezone.utc).isoformat(), 'tenants': tenants}
+
+        # writes a temporary file first so an interruption doesn't corrupt the cache
+        with open(cache_path + '.tmp', 'w') as f:
+            json.dump(cache, f)
+        os.replace(cache_path + '.tmp', cache_path)
+
+
+class TenantRegistry(Mapping):
+    """
+    Read-only {company: tenant_id} loaded on first use instead of at import.
+    Tenants are read from the on-disk cache while it's younger than `ttl`, otherwise from the backend.
+    If the backend can't be reached, an expired cache is used.
+
+    Tests inject tenants with `set`, e.g. tenant_registry.postgres_tenants.set({'Bare Barrel': 1}),
+    which every module holding the registry sees.
+    """
+    def __init__(self, backend, loader):
+        self.backend = backend
+        self.loader = loader
+        self.tenants = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.tenants is None:
+                self.tenants = self.fetch()
+            return self.tenants
+
+    def load_backend(self):
+        # plain ints, backends may return numpy ones
+        return {company: int(tenant_id) for company, tenant_id in self.loader().items()}
+
+    def fetch(self):
+        cached = read_cache(self.backend)
+        if cached and dt.datetime.now(dt.timezone.utc) - cached['fetched_at'] < ttl:
+            return cached['tenants']
+
+        try:
+            tenants = self.load_backend()
+        except Exception as error:
+            if not cached:
+                raise
+            logger.warning(f"Using {self.backend} tenants cached at {cached['fetched_at']}, loading failed: {error}")
+            return cached['tenants']
+
+        write_cache(self.backend, tenants)
+        return tenants
+
+    def refresh(self):
+        """Reloads the tenants from the backend"""
+        with self.lock:
+            tenants = self.load_backend()
+            write_cache(self.backend, tenants)
+            self.tenants = tenants
+
+    def set(self, tenants):
+        """Replaces the tenants, without loading nor caching them"""
+        with self.lock:
+            self.tenants = dict(tenants)
+
+    def reset(self):
+        """Forgets the loaded or set tenants, they're loaded again on next use"""
+        with self.lock:
+            self.tenants = None
+
+    def __getitem__(self, company):
+        return self.load()[company]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+    def __repr__(self):
+        return f"TenantRegistry({self.backend!r}, {self.tenants if self.tenants is not None else 'not loaded'})"
+
+
+postgres_tenants = TenantRegistry('postgres', load_postgres_tenants)
+bigquery_tenants = TenantRegistry('bigquery', load_bigquery_tenants)
@@ -0,0 +1,27 @@
+import json
+import os
+import sys
+import tempfile
+
+# Modules read config.json & logging_config.json from the working directory at import,
+# tests run in a scratch directory with minimal ones
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+os.makedirs('logging', exist_ok=True)
+
+with open('logging_config.json', 'w') as f:
+    json.dump({
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {'file': {'class': 'logging.FileHandler', 'filename': 'tests.log'}},
+        'root': {'level': 'INFO', 'handlers': ['file']},
+    }, f)
+
+with open('config.json', 'w') as f:
+    json.dump({
+        'postgres_db': 'test',
+        'postgres_user': 'test',
+        'postgres_host': 'localhost',
+        'postgres_port': 5432,
+        'postgres_password': '',
+    }, f)
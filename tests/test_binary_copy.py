@@ -0,0 +1,101 @@
+import datetime as dt
+import io
+import struct
+
+import numpy as np
+import pandas as pd
+
+from postgresql_engine import (to_binary_copy, pack_numeric, pack_array, BINARY_COPY_HEADER, BINARY_COPY_TRAILER,
+                               PG_EPOCH_DAYS)
+
+
+def read_copy(buffer, columns):
+    """Splits a binary COPY stream into rows of raw fields, None for NULL"""
+    stream = io.BytesIO(buffer.getvalue())
+    assert stream.read(len(BINARY_COPY_HEADER)) == BINARY_COPY_HEADER
+    rows = []
+    while True:
+        (count,) = struct.unpack('!h', stream.read(2))
+        if count == -1:
+            break
+        assert count == columns
+        row = []
+        for _ in range(count):
+            (length,) = struct.unpack('!i', stream.read(4))
+            row.append(None if length == -1 else stream.read(length))
+        rows.append(row)
+    assert stream.read() == b''
+    return rows
+
+
+def read_numeric(field):
+    ndigits, weight, sign, dscale = struct.unpack('!hhHH', field[:8])
+    groups = list(struct.unpack(f'!{ndigits}H', field[8:]))
+    assert len(field) == 8 + 2 * ndigits
+    return groups, weight, sign, dscale
+
+
+def test_framing_and_nulls():
+    data = pd.DataFrame({'id': pd.array([1, None, 3], dtype='Int64'), 'name': ['a', None, 'ccc']})
+    buffer = to_binary_copy(data, [('bigint', 'int8'), ('text', 'text')])
+    raw = buffer.getvalue()
+    assert raw.startswith(b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0))
+    assert raw.endswith(BINARY_COPY_TRAILER)
+    assert read_copy(buffer, 2) == [
+        [struct.pack('!q', 1), b'a'],
+        [None, None],
+        [struct.pack('!q', 3), b'ccc'],
+    ]
+
+
+def test_empty_dataframe_is_header_and_trailer():
+    data = pd.DataFrame({'id': pd.Series([], dtype='int64')})
+    assert to_binary_copy(data, [('integer', 'int4')]).getvalue() == BINARY_COPY_HEADER + BINARY_COPY_TRAILER
+
+
+def test_numeric_digit_groups():
+    data = pd.DataFrame({'value': [12345.678, -0.5, 0.0, 1e-07, 100000000.0, np.nan, -12345.678]})
+    rows = read_copy(to_binary_copy(data, [('numeric', 'numeric')]), 1)
+    numerics = [None if field is None else read_numeric(field) for (field,) in rows]
+    assert numerics == [
+        ([1, 2345, 6780], 1, 0x0000, 3),
+        ([5000], -1, 0x4000, 1),
+        ([], 0, 0x0000, 1),
+        ([10], -2, 0x0000, 7),
+        ([1], 2, 0x0000, 1),
+        None,
+        ([1, 2345, 6780], 1, 0x4000, 3),
+    ]
+
+
+def test_numeric_special_values():
+    assert read_numeric(pack_numeric(float('nan'))[4:]) == ([], 0, 0xC000, 0)
+    assert read_numeric(pack_numeric(float('inf'))[4:]) == ([], 0, 0xD000, 0)
+    assert read_numeric(pack_numeric(float('-inf'))[4:]) == ([], 0, 0xF000, 0)
+
+
+def test_arrays():
+    data = pd.DataFrame({'ids': [[1, None, 3], [], None], 'tags': [['a', 'bc'], None, ['d']]})
+    rows = read_copy(to_binary_copy(data, [('ARRAY', '_int4'), ('ARRAY', '_text')]), 2)
+
+    assert rows[0][0] == (struct.pack('!iiiii', 1, 1, 23, 3, 1) + struct.pack('!ii', 4, 1) + struct.pack('!i', -1)
+                          + struct.pack('!ii', 4, 3))
+    assert rows[0][1] == struct.pack('!iiiii', 1, 0, 25, 2, 1) + b'\x00\x00\x00\x01a' + b'\x00\x00\x00\x02bc'
+    # nulls & empty lists become empty arrays like the csv path
+    assert rows[1][0] == rows[2][0] == struct.pack('!iii', 0, 0, 23)
+    assert rows[1][1] == pack_array(None, 25, None)[4:] == struct.pack('!iii', 0, 0, 25)
+
+
+def test_dates_timestamps_and_jsonb():
+    data = pd.DataFrame({
+        'date': pd.to_datetime(['2000-01-02', None]),
+        'updated_at': pd.to_datetime(['2000-01-01 05:00:00-05:00', None]),
+        'payload': ['{"a": 1}', None],
+    })
+    column_types = [('date', 'date'), ('timestamp with time zone', 'timestamptz'), ('jsonb', 'jsonb')]
+    rows = read_copy(to_binary_copy(data, column_types), 3)
+    assert rows == [
+        [struct.pack('!i', 1), struct.pack('!q', 10 * 3600 * 1000000), b'\x01{"a": 1}'],
+        [None, None, None],
+    ]
+    assert dt.date(2000, 1, 1) - dt.date(1970, 1, 1) == dt.timedelta(days=PG_EPOCH_DAYS)
@@ -0,0 +1,47 @@
+import datetime as dt
+import decimal
+import types
+
+import pandas as pd
+
+from postgresql_engine import decode_columns, DATE_OID, TIMESTAMP_OID, TIMESTAMPTZ_OID, NUMERIC_OID
+
+
+def session_cursor(timezone):
+    info = types.SimpleNamespace(parameter_status=lambda name: timezone)
+    return types.SimpleNamespace(connection=types.SimpleNamespace(info=info))
+
+
+def test_dates_outside_datetime64_range():
+    data = pd.DataFrame({0: ['2024-02-29', '9999-12-31', 'infinity', '0001-01-01', None]})
+    decoded = decode_columns(data, [DATE_OID], text=True)
+    assert decoded[0].tolist() == [dt.date(2024, 2, 29), dt.date(9999, 12, 31), dt.date.max, dt.date(1, 1, 1), None]
+
+
+def test_timestamps_in_range_are_datetime64():
+    data = pd.DataFrame({0: ['2024-02-29 12:34:56.789', None]})
+    decoded = decode_columns(data, [TIMESTAMP_OID], text=True)
+    assert decoded[0].dtype == 'datetime64[ns]'
+    assert decoded[0][0] == pd.Timestamp('2024-02-29 12:34:56.789')
+
+
+def test_timestamps_outside_datetime64_range_keep_their_value():
+    data = pd.DataFrame({0: ['2024-02-29 12:34:56', '9999-12-31 23:59:59', '1500-06-01 00:00:00', 'infinity', None]})
+    decoded = decode_columns(data, [TIMESTAMP_OID], text=True)
+    assert decoded[0].tolist() == [dt.datetime(2024, 2, 29, 12, 34, 56), dt.datetime(9999, 12, 31, 23, 59, 59),
+                                   dt.datetime(1500, 6, 1), dt.datetime.max, None]
+
+
+def test_timestamptz_in_session_time_zone():
+    data = pd.DataFrame({0: ['2024-03-10 06:30:00+00', '2024-07-01 12:00:00+00', None]})
+    decoded = decode_columns(data, [TIMESTAMPTZ_OID], session_cursor('America/New_York'), text=True)
+    assert [str(value) for value in decoded[0][:2]] == ['2024-03-10 01:30:00-05:00', '2024-07-01 08:00:00-04:00']
+    assert decoded[0].isna()[2]
+
+
+def test_numeric_as_decimals():
+    data = pd.DataFrame({0: ['12.50', 'NaN', None]})
+    decoded = decode_columns(data, [NUMERIC_OID], text=True, decimals=True)
+    assert decoded[0][0] == decimal.Decimal('12.50') and str(decoded[0][0]) == '12.50'
+    assert decoded[0][1].is_nan()
+    assert decoded[0][2] is None
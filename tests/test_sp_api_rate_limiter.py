@@ -0,0 +1,100 @@
+import types
+
+import pytest
+
+pytest.importorskip('sp_api')
+
+from sp_api.base.exceptions import SellingApiRequestThrottledException
+
+import sp_api_rate_limiter
+from sp_api_rate_limiter import TokenBucket, call
+
+
+class FakeClock():
+    """Monotonic clock that only moves when slept on"""
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def bucket(clock, monkeypatch):
+    """Rate limiter of ('account', 'US', 'get_order_items') driven by the fake clock"""
+    bucket = TokenBucket(0.5, 2, clock=clock, sleep=clock.sleep)
+    monkeypatch.setitem(sp_api_rate_limiter.rate_limiters, ('account', 'US', 'get_order_items'), bucket)
+    return bucket
+
+
+def test_burst_then_waits_for_refill(clock):
+    bucket = TokenBucket(0.5, 2, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == []
+    bucket.acquire()
+    assert clock.sleeps == [pytest.approx(2.0)]
+    assert bucket.tokens == pytest.approx(0.0)
+
+
+def test_refill_is_capped_at_burst(clock):
+    bucket = TokenBucket(1, 3, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        bucket.acquire()
+    clock.now += 1.5
+    bucket.refill()
+    assert bucket.tokens == pytest.approx(1.5)
+    clock.now += 3600
+    bucket.refill()
+    assert bucket.tokens == 3
+
+
+def test_update_rate_ignores_invalid_values(clock):
+    bucket = TokenBucket(2, 2, clock=clock, sleep=clock.sleep)
+    for rate in (None, 'abc', 0, -1):
+        bucket.update_rate(rate)
+    assert bucket.rate == 2
+    bucket.update_rate('0.5')
+    assert bucket.rate == 0.5
+
+
+def test_call_updates_rate_from_response(bucket, clock):
+    response = types.SimpleNamespace(rate_limit='5.0', payload={})
+    assert call('account', 'US', 'get_order_items', lambda: response) is response
+    assert bucket.rate == 5.0
+    assert bucket.tokens == pytest.approx(1.0)
+
+
+def test_call_retries_throttled_requests_with_header_rate(bucket, clock):
+    response = types.SimpleNamespace(rate_limit=None, payload={})
+    errors = [SellingApiRequestThrottledException([{'code': 'QuotaExceeded', 'message': 'throttled'}],
+                                                  {'x-amzn-RateLimit-Limit': '0.25'})]
+
+    def request():
+        if errors:
+            raise errors.pop()
+        return response
+
+    assert call('account', 'US', 'get_order_items', request) is response
+    assert bucket.rate == 0.25
+    # the bucket was emptied by the 429, the retry waited a full token at the new rate
+    assert clock.sleeps == [pytest.approx(4.0)]
+
+
+def test_call_raises_after_last_try(bucket, clock):
+    def request():
+        raise SellingApiRequestThrottledException([{'code': 'QuotaExceeded', 'message': 'throttled'}], {})
+
+    with pytest.raises(SellingApiRequestThrottledException):
+        call('account', 'US', 'get_order_items', request, tries=3)
+    assert len(clock.sleeps) == 2
@@ -0,0 +1,21 @@
+import pytest
+
+from postgresql_engine import sql_standardize
+
+
+# Names whose standardization must never change
+@pytest.mark.parametrize('name, expected', [
+    ('B2B', 'b2b'),
+    ('orderItemB2BUnits', 'order_item_b2b_units'),
+    ('SKU', 'sku'),
+    ('ASIN', 'asin'),
+    ('sellerSKU', 'seller_sku'),
+    ('ASIN Count', 'asin_count'),
+    ('unitsSold14d', 'units_sold_14d'),
+    ('salesSameDay', 'sales_same_day'),
+    ('Cart Adds: 2D Shipping', 'cart_adds_2d_shipping'),
+    ('Impressions (Total)', 'impressions'),
+    ('14 Day Total Sales', '"14_day_total_sales"'),
+])
+def test_sql_standardize(name, expected):
+    assert sql_standardize(name) == expected
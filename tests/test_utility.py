@@ -0,0 +1,53 @@
+import gzip
+import json
+
+import pytest
+
+from utility import iter_json_array
+
+
+def write(tmp_path, text, name='items.json'):
+    path = tmp_path / name
+    if name.endswith('.gz'):
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        path.write_text(text, encoding='utf-8')
+    return path
+
+
+@pytest.mark.parametrize('items', [
+    [],
+    [1, 2.5, -3e10, 'a,]b', None, True],
+    [[1, 2], [3], [], [[4]]],
+    [{'campaignId': 1, 'tags': ['x', 'y']}, {'campaignId': 22, 'nested': {'a': [1, {'b': 2}]}}],
+])
+@pytest.mark.parametrize('block_size', [1, 2, 3, 7, 1 << 20])
+def test_items_across_block_boundaries(tmp_path, items, block_size):
+    path = write(tmp_path, json.dumps(items, indent=1))
+    assert list(iter_json_array(path, block_size)) == items
+
+
+def test_numbers_split_across_blocks(tmp_path):
+    path = write(tmp_path, '[123456789, 987654321]')
+    assert list(iter_json_array(path, block_size=4)) == [123456789, 987654321]
+
+
+def test_gzipped(tmp_path):
+    path = write(tmp_path, '[[1, 2], [3]]', 'items.json.gz')
+    assert list(iter_json_array(path, block_size=2)) == [[1, 2], [3]]
+
+
+@pytest.mark.parametrize('text', ['[1, 2', '[1, 2,', '[[1, 2], [3]', '[{"a": 1}', '['])
+@pytest.mark.parametrize('block_size', [1, 4, 1 << 20])
+def test_truncated_raises(tmp_path, text, block_size):
+    path = write(tmp_path, text)
+    with pytest.raises(ValueError):
+        list(iter_json_array(path, block_size))
+
+
+@pytest.mark.parametrize('text', ['[1 2]', '[[1] [2]]', '[1, ]', '[,1]', '[1,,2]', '{"a": 1}', ''])
+def test_malformed_raises(tmp_path, text):
+    path = write(tmp_path, text)
+    with pytest.raises(ValueError):
+        list(iter_json_array(path, block_size=2))
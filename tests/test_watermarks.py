@@ -0,0 +1,80 @@
+import datetime as dt
+import os
+
+import psycopg2
+import pytest
+
+import postgresql
+import watermarks
+
+
+@pytest.fixture
+def watermarks_table(monkeypatch):
+    """Runs watermarks against a throwaway table, skipped when PostgreSQL isn't reachable"""
+    try:
+        with postgresql.setup_cursor() as cur:
+            cur.execute("SELECT 1;")
+    except psycopg2.OperationalError as error:
+        pytest.skip(f"PostgreSQL isn't reachable: {error}")
+
+    table_name = f"public.test_job_watermarks_{os.getpid()}"
+    monkeypatch.setattr(watermarks, 'table_name', table_name)
+    monkeypatch.setattr(watermarks, 'table_ready', False)
+    yield table_name
+    with postgresql.setup_cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {table_name};")
+
+
+def utc(*args):
+    return dt.datetime(*args, tzinfo=dt.timezone.utc)
+
+
+def test_advance_never_moves_backwards(watermarks_table):
+    watermarks.advance('job', utc(2024, 5, 2), rows_loaded=10)
+    watermarks.advance('job', utc(2024, 5, 1), rows_loaded=3)
+    row = watermarks.get('job')
+    assert row['watermark'] == utc(2024, 5, 2)
+    assert row['status'] == 'succeeded'
+    assert row['rows_loaded'] == 3
+
+    watermarks.advance('job', utc(2024, 5, 3))
+    assert watermarks.get_watermark('job') == utc(2024, 5, 3)
+
+
+def test_advance_without_watermark_keeps_it(watermarks_table):
+    watermarks.advance('job', None, rows_loaded=0)
+    assert watermarks.get_watermark('job', default='never') == 'never'
+    assert watermarks.get('job')['status'] == 'succeeded'
+
+    watermarks.advance('job', utc(2024, 5, 2))
+    watermarks.fail_run('job', error=ValueError('boom'))
+    watermarks.advance('job', None)
+    row = watermarks.get('job')
+    assert row['watermark'] == utc(2024, 5, 2)
+    assert row['status'] == 'succeeded'
+    assert row['last_error'] is None
+
+
+def test_advance_is_scoped_per_tenant_and_marketplace(watermarks_table):
+    watermarks.advance('job', utc(2024, 5, 2), tenant_id=1, marketplace='US')
+    assert watermarks.get_watermark('job', 1, 'CA') is None
+    assert watermarks.get_watermark('job', 2, 'US') is None
+    assert watermarks.get_watermark('job', 1, 'US') == utc(2024, 5, 2)
+
+
+def test_loaded_today(monkeypatch):
+    now = dt.datetime.now(dt.timezone.utc)
+    rows = {
+        'never': None,
+        'no_watermark': {'watermark': None},
+        'today': {'watermark': now},
+        'yesterday': {'watermark': now - dt.timedelta(days=1)},
+        # same instant as `now` in another time zone, compared in UTC
+        'offset': {'watermark': now.astimezone(dt.timezone(dt.timedelta(hours=-12)))},
+    }
+    monkeypatch.setattr(watermarks, 'get', lambda job, tenant_id=0, marketplace='': rows[job])
+    assert watermarks.loaded_today('never') is None
+    assert watermarks.loaded_today('no_watermark') is None
+    assert watermarks.loaded_today('today') is True
+    assert watermarks.loaded_today('yesterday') is False
+    assert watermarks.loaded_today('offset') is True
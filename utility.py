@@ -1,4 +1,7 @@
 import json
+import gzip
+import os
+from concurrent.futures import ThreadPoolExecutor
 import datetime as dt
 import pandas as pd
 import subprocess
@@ -78,6 +81,136 @@ def payload_to_dataframe(response, get_key):
         return pd.read_json(flattened_json)
 
 
+def iter_json_array(file_path, block_size=1 << 20):
+    """
+    Incrementally decodes the items of a (gzipped) JSON array file without
+    loading the whole array, reading `block_size` characters at a time.
+    Raises ValueError if the file isn't an array, or is truncated or malformed.
+    """
+    decoder = json.JSONDecoder()
+    opener = gzip.open if str(file_path).endswith('.gz') else open
+    with opener(file_path, 'rt', encoding='utf-8') as file:
+        buffer, position = '', 0
+        # the opening bracket was read, the next token is an item (or the closing bracket of an empty array)
+        started, expects_item, empty, finished = False, True, True, False
+        while not finished:
+            block = file.read(block_size)
+            buffer = buffer[position:] + block
+            position = 0
+
+            while True:
+                while position < len(buffer) and buffer[position] in ' \t\r\n':
+                    position += 1
+                if position == len(buffer):
+                    break
+                char = buffer[position]
+
+                if not started:
+                    if char != '[':
+                        raise ValueError(f"{file_path} isn't a JSON array")
+                    started = True
+                    position += 1
+                    continue
+
+                if char == ']' and (not expects_item or empty):
+                    finished = True
+                    break
+
+                if not expects_item:
+                    if char != ',':
+                        raise ValueError(f"{file_path}: expected ',' or ']' after an item, got {char!r}")
+                    expects_item = True
+                    position += 1
+                    continue
+
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if not block:
+                        raise
+                    # needs the next block
+                    break
+                # a number may continue in the next block, items end with a separator
+                if block and (end == len(buffer) or buffer[end] not in ' \t\r\n,]'):
+                    break
+                position = end
+                expects_item, empty = False, False
+                yield item
+
+            if not block:
+                break
+
+        if not finished:
+            raise ValueError(f"{file_path} ends before its JSON array is closed")
+
+
+def read_json_chunks(file_path, chunksize=100_000):
+    """
+    Reads a (gzipped) JSON array file of records in dataframes of `chunksize` rows,
+    so memory is bounded by the chunk instead of the file.
+    """
+    records = []
+    for record in iter_json_array(file_path):
+        records.append(record)
+        if len(records) == chunksize:
+            yield pd.DataFrame.from_records(records)
+            records = []
+    if records:
+        yield pd.DataFrame.from_records(records)
+
+
+def list_files(directory, file_extension):
+    """
+    Lists the files in a directory and its subdirectories whose name contains `file_extension`
+    """
+    file_paths = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            if file_extension in filename:
+                file_paths.append(os.path.join(dirpath, filename))
+    return file_paths
+
+
+def combine_files(file_paths, read_file, primary_keys=None, keep='last', max_workers=8,
+                  executor_class=ThreadPoolExecutor, chunksize=1):
+    """
+    Reads files with a pool of workers and concatenates their dataframes once,
+    instead of re-copying a growing dataframe for every file.
+
+    Args:
+        file_paths (list): files combined in this order
+        read_file (callable): file_path -> pd.DataFrame | None, must be picklable for process pools
+        primary_keys (list): optionally drops duplicated rows on these columns
+        keep (str): 'first' | 'last', which of the duplicated rows is kept, in file order
+        max_workers (int): 1 reads the files sequentially
+        executor_class: ThreadPoolExecutor | ProcessPoolExecutor
+        chunksize (int): files sent per task to a process pool
+
+    Returns:
+        combined_data (pd.DataFrame)
+    """
+    if keep not in ('first', 'last'):
+        raise ValueError(f"keep must be 'first' or 'last', not {keep!r}")
+
+    if max_workers == 1 or len(file_paths) < 2:
+        frames = map(read_file, file_paths)
+        frames = [frame for frame in frames if frame is not None and not frame.empty]
+    else:
+        with executor_class(max_workers=max_workers) as executor:
+            frames = [frame for frame in executor.map(read_file, file_paths, chunksize=chunksize)
+                      if frame is not None and not frame.empty]
+
+    if not frames:
+        return pd.DataFrame()
+
+    combined_data = pd.concat(frames, ignore_index=True)
+
+    if primary_keys:
+        combined_data = combined_data.drop_duplicates(subset=primary_keys, keep=keep, ignore_index=True)
+
+    return combined_data
+
+
 def reposition_columns(df, col_positions={}):
     """
     Repositions column names of a pandas df.
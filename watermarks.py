@@ -0,0 +1,120 @@
+import datetime as dt
+import threading
+import postgresql
+import logging
+import logger_setup
+
+logger_setup.setup_logging(__file__)
+logger = logging.getLogger(__name__)
+
+# High-water marks & last run status of incremental jobs, per tenant & marketplace.
+# tenant_id 0 and marketplace '' are used by jobs that aren't per tenant / marketplace.
+table_name = 'public.job_watermarks'
+table_ready = False
+table_lock = threading.Lock()
+
+
+def create_table(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            job TEXT NOT NULL,
+            tenant_id INT NOT NULL DEFAULT 0,
+            marketplace TEXT NOT NULL DEFAULT '',
+            watermark TIMESTAMPTZ,
+            status TEXT NOT NULL DEFAULT 'pending',
+            rows_loaded BIGINT,
+            last_error TEXT,
+            started_at TIMESTAMPTZ,
+            finished_at TIMESTAMPTZ,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job, tenant_id, marketplace)
+        );""")
+
+
+def ensure_table():
+    """Creates the watermarks table once per process"""
+    global table_ready
+    with table_lock:
+        if not table_ready:
+            with postgresql.setup_cursor() as cur:
+                create_table(cur)
+            table_ready = True
+
+
+def get(job, tenant_id=0, marketplace=''):
+    """
+    Returns:
+        row (dict): watermark, status, rows_loaded, last_error, started_at, finished_at
+            or None if the job never ran
+    """
+    ensure_table()
+    with postgresql.setup_cursor() as cur:
+        cur.execute(f"""SELECT * FROM {table_name}
+                        WHERE job = %s AND tenant_id = %s AND marketplace = %s;""",
+                    (job, tenant_id, marketplace))
+        row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def get_watermark(job, tenant_id=0, marketplace='', default=None):
+    """Returns the job's high-water mark (datetime) or `default` if it has none"""
+    row = get(job, tenant_id, marketplace)
+    if row and row['watermark'] is not None:
+        return row['watermark']
+    return default
+
+
+def start_run(job, tenant_id=0, marketplace=''):
+    """Marks a run of the job as running, keeping its watermark"""
+    ensure_table()
+    with postgresql.setup_cursor() as cur:
+        cur.execute(f"""INSERT INTO {table_name} (job, tenant_id, marketplace, status, started_at)
+                        VALUES (%s, %s, %s, 'running', CURRENT_TIMESTAMP)
+                        ON CONFLICT (job, tenant_id, marketplace) DO UPDATE
+                        SET status = 'running', started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP;""",
+                    (job, tenant_id, marketplace))
+
+
+def advance(job, watermark, tenant_id=0, marketplace='', rows_loaded=None, cur=None):
+    """
+    Advances the job's watermark (never moves it backwards) and marks the run as succeeded.
+    Pass the cursor of the load, e.g. upsert_bulk's `before_commit`, to commit both at once.
+    """
+    ensure_table()
+    query = f"""INSERT INTO {table_name} AS target
+                    (job, tenant_id, marketplace, watermark, status, rows_loaded, finished_at)
+                VALUES (%s, %s, %s, %s, 'succeeded', %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (job, tenant_id, marketplace) DO UPDATE
+                SET watermark = GREATEST(target.watermark, EXCLUDED.watermark),
+                    status = 'succeeded', rows_loaded = EXCLUDED.rows_loaded, last_error = NULL,
+                    finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP;"""
+    params = (job, tenant_id, marketplace, watermark, rows_loaded)
+
+    if cur is not None:
+        cur.execute(query, params)
+        return
+    with postgresql.setup_cursor() as cur:
+        cur.execute(query, params)
+
+
+def fail_run(job, tenant_id=0, marketplace='', error=None):
+    """Marks the job's run as failed, keeping its watermark"""
+    ensure_table()
+    with postgresql.setup_cursor() as cur:
+        cur.execute(f"""INSERT INTO {table_name} (job, tenant_id, marketplace, status, last_error, finished_at)
+                        VALUES (%s, %s, %s, 'failed', %s, CURRENT_TIMESTAMP)
+                        ON CONFLICT (job, tenant_id, marketplace) DO UPDATE
+                        SET status = 'failed', last_error = EXCLUDED.last_error,
+                            finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP;""",
+                    (job, tenant_id, marketplace, str(error) if error is not None else None))
+
+
+def loaded_today(job, tenant_id=0, marketplace=''):
+    """
+    Returns:
+        True | False if the job last succeeded today (UTC), None if it never succeeded
+    """
+    row = get(job, tenant_id, marketplace)
+    if not row or row['watermark'] is None:
+        return None
+    return row['watermark'].astimezone(dt.timezone.utc).date() == dt.datetime.now(dt.timezone.utc).date()
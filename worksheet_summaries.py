@@ -0,0 +1,227 @@
+import datetime as dt
+import threading
+import postgresql
+import watermarks
+import logging
+import logger_setup
+
+logger_setup.setup_logging(__file__)
+logger = logging.getLogger(__name__)
+
+# Rows upserted while a refresh runs may carry an earlier updated_at, they're picked up by the next refresh
+overlap = dt.timedelta(hours=1)
+
+# Summaries whose tables & indexes were created by this process, see ensure_tables
+tables_ready = set()
+tables_lock = threading.Lock()
+
+# Catalog of the summary tables backing worksheet_queries.
+# Each summary is refreshed from the (tenant_id, marketplace, date) keys whose source rows changed since its
+# last refresh, found by the sources' updated_at. Its watermark is the job f"summary:{summary_table}".
+#   worksheets: worksheet_queries reading the summary
+#   sources: tables whose updated_at drive the refresh
+#   tables: tables maintained along with the summary, emptied when it's rebuilt
+#   create: statements creating the summary & those tables
+#   prepare: statements run before each refresh, %(since)s is the updated_at the refresh starts from
+#   touched: query of the (tenant_id, marketplace, date) keys to be refreshed
+#   select: query of the summary's rows, {filter} restricts its source `t1`
+summary_tables = {
+    'sponsored_products.portfolio_daily_summary': {
+        'worksheets': ['SP-US', 'SP-CA', 'SP-UK'],
+        'sources': ['sponsored_products.campaign', 'sponsored_products.targeting'],
+        'tables': ['sponsored_products.campaign_portfolios'],
+        'create': [
+            # latest portfolio of each campaign, replaces a DISTINCT ON over the whole targeting table
+            """CREATE TABLE IF NOT EXISTS sponsored_products.campaign_portfolios AS
+                SELECT campaign_id, portfolio_id, date FROM sponsored_products.targeting WITH NO DATA;""",
+            """CREATE UNIQUE INDEX IF NOT EXISTS campaign_portfolios_campaign_id
+                ON sponsored_products.campaign_portfolios (campaign_id);""",
+            """CREATE TABLE IF NOT EXISTS sponsored_products.portfolio_daily_summary AS
+                {select} WITH NO DATA;""",
+        ],
+        'prepare': [
+            """CREATE TEMPORARY TABLE latest_portfolios ON COMMIT DROP AS
+                SELECT DISTINCT ON (campaign_id) campaign_id, portfolio_id, date
+                FROM sponsored_products.targeting
+                WHERE updated_at > %(since)s
+                ORDER BY campaign_id, date DESC;""",
+            # campaigns moved to another portfolio, all of their dates are refreshed
+            """CREATE TEMPORARY TABLE changed_campaigns ON COMMIT DROP AS
+                SELECT latest.campaign_id
+                FROM latest_portfolios latest
+                LEFT JOIN sponsored_products.campaign_portfolios mapping USING (campaign_id)
+                WHERE mapping.campaign_id IS NULL
+                    OR (latest.date >= mapping.date AND latest.portfolio_id IS DISTINCT FROM mapping.portfolio_id);""",
+            """INSERT INTO sponsored_products.campaign_portfolios AS mapping (campaign_id, portfolio_id, date)
+                SELECT campaign_id, portfolio_id, date FROM latest_portfolios
+                ON CONFLICT (campaign_id) DO UPDATE
+                SET portfolio_id = EXCLUDED.portfolio_id, date = EXCLUDED.date
+                WHERE EXCLUDED.date >= mapping.date;""",
+        ],
+        'touched': """SELECT DISTINCT tenant_id, marketplace, date
+                      FROM sponsored_products.campaign
+                      WHERE updated_at > %(since)s
+                          OR campaign_id IN (SELECT campaign_id FROM changed_campaigns)""",
+        'select': """SELECT
+                        t1.tenant_id,
+                        t1.marketplace,
+                        t1.date,
+                        t2.portfolio_id,
+                        t1.campaign_budget_currency_code currency,
+                        sum(t1.cost) total_cost,
+                        sum(t1.units_sold_clicks_7d) total_units_sold_clicks_7d,
+                        sum(t1.clicks) total_clicks,
+                        sum(t1.impressions) total_impressions,
+                        sum(t1.sales_7d) sales_7d
+                    FROM sponsored_products.campaign t1
+                    LEFT JOIN sponsored_products.campaign_portfolios t2
+                        ON t1.campaign_id = t2.campaign_id
+                    WHERE {filter}
+                    GROUP BY t1.tenant_id, t1.marketplace, t1.date, t2.portfolio_id, currency""",
+    },
+
+    'sponsored_products.console_portfolio_daily_summary': {
+        'worksheets': ['SP-US'],
+        'sources': ['sponsored_products.campaign_console'],
+        'tables': [],
+        'create': [
+            """CREATE TABLE IF NOT EXISTS sponsored_products.console_portfolio_daily_summary AS
+                {select} WITH NO DATA;""",
+        ],
+        'prepare': [],
+        'touched': """SELECT DISTINCT tenant_id, marketplace, date
+                      FROM sponsored_products.campaign_console
+                      WHERE updated_at > %(since)s""",
+        'select': """SELECT
+                        t1.tenant_id,
+                        t1.marketplace,
+                        t1.date,
+                        t1.portfolio_name,
+                        t1.currency,
+                        sum(t1.spend) total_cost,
+                        sum(t1."7_day_total_orders") total_units_sold_clicks_7d,
+                        sum(t1.clicks) total_clicks,
+                        sum(t1.impressions) total_impressions,
+                        sum(t1."7_day_total_sales") sales_7d
+                    FROM sponsored_products.campaign_console t1
+                    WHERE {filter}
+                    GROUP BY t1.tenant_id, t1.marketplace, t1.portfolio_name, t1.date, t1.currency""",
+    },
+}
+
+
+def watermark_job(summary_table):
+    return f"summary:{summary_table}"
+
+
+def index_name(table_name, suffix):
+    return f"{table_name.split('.')[-1]}_{suffix}"
+
+
+def create_tables(cur, summary_table):
+    """Creates the summary, the tables it depends on and the indexes of its refresh"""
+    summary = summary_tables[summary_table]
+    for statement in summary['create']:
+        cur.execute(statement.replace('{select}', summary['select'].format(filter='FALSE')))
+    cur.execute(f"""CREATE INDEX IF NOT EXISTS {index_name(summary_table, 'key')}
+                    ON {summary_table} (tenant_id, marketplace, date);""")
+    for source in summary['sources']:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {index_name(source, 'updated_at')} ON {source} (updated_at);")
+
+
+def ensure_tables(summary_table):
+    """
+    Creates the summary's tables & indexes once per process, each statement committed on its own.
+    CREATE INDEX locks its table even when the index exists, so it's kept out of the refresh transaction
+    where it would block upserts to the sources until the refresh commits.
+    """
+    with tables_lock:
+        if summary_table not in tables_ready:
+            with postgresql.setup_cursor() as cur:
+                create_tables(cur, summary_table)
+            tables_ready.add(summary_table)
+
+
+def refresh(summary_table, full=False):
+    """
+    Refreshes the summary's rows of the dates touched since its last refresh, or all of them if it's
+    `full` or never refreshed. The rows & the watermark are committed at once.
+
+    Returns:
+        rows (int): rows written to the summary
+    """
+    summary = summary_tables[summary_table]
+    job = watermark_job(summary_table)
+    since = None if full else watermarks.get_watermark(job)
+    since = '-infinity' if since is None else since - overlap
+    ensure_tables(summary_table)
+    watermarks.start_run(job)
+
+    try:
+        with postgresql.setup_cursor(autocommit=False) as (conn, cur):
+            # one refresh of a summary at a time
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (summary_table,))
+
+            # taken first, rows updated during the refresh are refreshed again next time
+            cur.execute("SELECT max(updated_at) AS watermark FROM ("
+                        + " UNION ALL ".join(f"SELECT max(updated_at) AS updated_at FROM {source}"
+                                             for source in summary['sources'])
+                        + ") AS sources;")
+            watermark = cur.fetchone()['watermark']
+
+            if since == '-infinity':
+                cur.execute(f"TRUNCATE {', '.join([summary_table] + summary['tables'])};")
+            for statement in summary['prepare']:
+                cur.execute(statement, {'since': since})
+
+            if since == '-infinity':
+                logger.info(f"Rebuilding {summary_table}")
+                cur.execute(f"INSERT INTO {summary_table} {summary['select'].format(filter='TRUE')};")
+            else:
+                cur.execute(f"CREATE TEMPORARY TABLE touched_keys ON COMMIT DROP AS {summary['touched']};",
+                            {'since': since})
+                logger.info(f"Refreshing {cur.rowcount} dates of {summary_table}")
+                cur.execute(f"""DELETE FROM {summary_table}
+                                WHERE (tenant_id, marketplace, date) IN (SELECT * FROM touched_keys);""")
+                cur.execute(f"""INSERT INTO {summary_table} {summary['select'].format(
+                    filter='(t1.tenant_id, t1.marketplace, t1.date) IN (SELECT * FROM touched_keys)')};""")
+            rows = cur.rowcount
+
+            watermarks.advance(job, watermark, rows_loaded=rows, cur=cur)
+            conn.commit()
+    except Exception as error:
+        watermarks.fail_run(job, error=error)
+        raise
+
+    logger.info(f"\t{rows} rows written to {summary_table}")
+    return rows
+
+
+def refresh_worksheets(worksheet_names, full=False):
+    """Refreshes the summaries read by the worksheets"""
+    for summary_table, summary in summary_tables.items():
+        if any(worksheet_name in summary['worksheets'] for worksheet_name in worksheet_names):
+            refresh(summary_table, full)
+
+
+def catalog():
+    """
+    Returns:
+        catalog (list): {summary_table, worksheets, sources, watermark, status, rows_loaded, finished_at}
+            of every summary table
+    """
+    entries = []
+    for summary_table, summary in summary_tables.items():
+        row = watermarks.get(watermark_job(summary_table)) or {}
+        entries.append({
+            'summary_table': summary_table,
+            'worksheets': summary['worksheets'],
+            'sources': summary['sources'],
+            **{key: row.get(key) for key in ('watermark', 'status', 'rows_loaded', 'finished_at')}
+        })
+    return entries
+
+
+if __name__ == '__main__':
+    for summary_table in summary_tables:
+        refresh(summary_table)